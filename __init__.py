@@ -1,6 +1,7 @@
 import os
 
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 def create_app(test_config=None):
@@ -8,13 +9,101 @@ def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
         SECRET_KEY='dev',
-        # Removido: DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
-        # Adicionado: Configurações do Banco de Dados MySQL
+        # Backend do banco (db.MySQLBackend): 'mysql', 'sqlite' (um único nó, sem
+        # réplicas nem shards) ou um objeto com a mesma interface
+        DB_BACKEND='mysql',
+        # Configurações do SQLite (sqlite.py)
+        SQLITE_PATH=os.path.join(app.instance_path, 'todolist.sqlite'),
+        SQLITE_BUSY_TIMEOUT=5.0, # Segundos de espera pelo lock de escrita antes de repetir a transação
+        SQLITE_MMAP_SIZE=256 * 1024 * 1024, # Bytes do arquivo lidos por mmap (0 desativa)
+        SQLITE_STATEMENT_CACHE=256, # Instruções preparadas guardadas por conexão
+        # Configurações do Banco de Dados MySQL
         MYSQL_HOST='localhost',
         MYSQL_USER='root',
         MYSQL_PASSWORD='', # Senha vazia para o usuário 'root' do XAMPP
         MYSQL_DB='todolist', # <<< MUITO IMPORTANTE: MUDAR PARA O NOME DO SEU BANCO DE DADOS REAL!
-        MYSQL_CHARSET='utf8mb4' # Garante suporte a caracteres especiais e emojis
+        MYSQL_PORT=3306,
+        MYSQL_CHARSET='utf8mb4', # Garante suporte a caracteres especiais e emojis
+        MYSQL_CONNECT_TIMEOUT=10,
+        # Pool de conexões (db.ConnectionPool)
+        DB_POOL_MIN_SIZE=1, # Conexões abertas desde a criação do pool
+        DB_POOL_MAX_SIZE=10, # Limite de conexões abertas por processo
+        DB_POOL_TIMEOUT=10.0, # Segundos de espera por uma conexão livre
+        DB_POOL_MAX_LIFETIME=3600, # Segundos até uma conexão ser reciclada
+        DB_POOL_PING_IDLE=30, # Faz ping em conexões ociosas há mais de N segundos (None desativa)
+        # Réplicas de leitura: lista de dicionários que sobrescrevem as chaves MYSQL_*,
+        # ex.: [{'MYSQL_HOST': 'replica1'}, {'MYSQL_HOST': 'replica2'}]
+        MYSQL_REPLICAS=[],
+        DB_REPLICA_RETRY_AFTER=30, # Segundos fora do rodízio para uma réplica que falhou
+        DB_READ_YOUR_WRITES=5, # Segundos lendo do primário após uma escrita do usuário
+        # Transações (db.transactional)
+        DB_DEADLOCK_RETRIES=3, # Repetições de uma view após deadlock ou espera de lock esgotada
+        DB_RETRY_BACKOFF=0.05, # Segundos de espera antes da 1ª repetição; dobra a cada nova
+        # Sharding por autor (db.ShardRouter, sharding.py): o banco MYSQL_* é o shard 0 e
+        # guarda usuários e o diretório; cada item sobrescreve as chaves MYSQL_* de um
+        # shard a mais, ex.: [{'MYSQL_DB': 'todolist_shard1'}]. Ao ativar com dados
+        # existentes, comece o AUTO_INCREMENT dos shards novos acima dos ids do shard 0.
+        DB_SHARDS=[],
+        DB_SHARD_CACHE_TTL=5, # Segundos de validade do diretório no cache de cada processo
+        DB_SHARD_ID_STRIDE=16, # Incremento dos ids com sharding; maior que o número de shards
+        # Cache do usuário logado (auth.get_user_cache)
+        USER_CACHE_SIZE=10000, # Máximo de usuários no cache local de cada processo
+        USER_CACHE_TTL=30, # Segundos de validade no cache local
+        USER_CACHE_BACKEND=None, # Cache compartilhado opcional (get/set/delete), ex.: cache.LocalBackend()
+        USER_CACHE_SHARED_TTL=300, # Segundos de validade no cache compartilhado
+        # Hashes de senha (passwords.py)
+        PASSWORD_HASH_METHOD='scrypt', # Método do werkzeug; ao mudar, hashes são refeitos no login
+        PASSWORD_HASH_WORKERS=2, # Processos dedicados a hashes (0 = na própria thread)
+        PASSWORD_HASH_QUEUE_LIMIT=32, # Hashes aguardando além dos em andamento; acima disso, 503
+        PASSWORD_HASH_TIMEOUT=10.0, # Segundos de espera por um hash
+        LOGIN_ATTEMPTS_PER_USERNAME=10, # Tentativas falhas de login por username na janela
+        LOGIN_ATTEMPTS_PER_IP=50, # Tentativas falhas de login por IP na janela
+        LOGIN_ATTEMPT_WINDOW=300, # Janela das tentativas de login, em segundos
+        # Proxies reversos à frente do app (ex.: 1 para um nginx). Com N > 0, o IP
+        # do cliente (request.remote_addr) vem do X-Forwarded-For que eles
+        # acrescentam (werkzeug ProxyFix); com 0, é o endereço da conexão.
+        # Não use N > 0 sem proxy: o cabeçalho viria do próprio cliente.
+        PROXY_TRUSTED_HOPS=0,
+        TASKLISTS_PER_PAGE=20, # Quantidade de tasklists por página no índice
+        STREAM_TEMPLATES=False, # Índice em streaming (flask.stream_template); sem efeito com o cache de páginas
+        # Cache de fragmentos HTML (cache.FragmentCache), desativado por padrão. Com mais
+        # de um processo, use PAGE_CACHE_BACKEND; sem ele, cada processo só vê as
+        # alterações feitas pelos outros (e pelos comandos do CLI) após PAGE_CACHE_TTL
+        PAGE_CACHE_MAX_CHARS=0, # Tamanho do cache em caracteres (0 desativa), ex.: 8_000_000
+        PAGE_CACHE_TTL=30, # Segundos de validade de cada fragmento
+        PAGE_CACHE_BACKEND=None, # Backend compartilhado (get/set/delete) para as invalidações
+        # Instrumentação de consultas (instrument.py)
+        QUERY_STATS=False, # Mede as consultas: /admin/db-stats e Server-Timing (debug ou ADMIN_USER_IDS)
+        QUERY_STATS_SAMPLE_RATE=1.0, # Fração das requisições medidas com QUERY_STATS
+        SLOW_QUERY_MS=200, # Loga instruções mais lentas que isso (None desativa)
+        SLOW_QUERY_LOG=None, # Arquivo opcional para o log de consultas lentas
+        ADMIN_USER_IDS=(), # Ids dos usuários com acesso a /admin (o username pode mudar ou ser liberado)
+        TASK_BATCH_MAX=500, # Máximo de tarefas por operação em lote
+        TASK_POSITION_MAX_LENGTH=24, # Chaves de posição maiores reequilibram a tasklist (positions.py)
+        # Atualização ao vivo da página de detalhes (events.py). O LocalHub só
+        # entrega eventos publicados no mesmo processo: com mais de um worker,
+        # configure em EVENTS_HUB um hub compartilhado entre os processos.
+        EVENTS_HUB=None, # Pub/sub alternativo (publish/subscribe/...); None usa events.LocalHub
+        EVENTS_QUEUE_SIZE=100, # Eventos pendentes por conexão; além disso, o cliente recarrega a página
+        EVENTS_MAX_SUBSCRIBERS=10000, # Conexões de eventos abertas por processo; acima disso, 503
+        # Conexões longas por processo; acima disso o navegador faz polling
+        # (EVENTS_POLL_INTERVAL). None: EVENTS_MAX_SUBSCRIBERS com workers gevent
+        # (gunicorn.conf.py), em que esperar não ocupa uma thread, e
+        # events.THREAD_STREAMS com workers de threads; 0 usa só polling.
+        EVENTS_MAX_STREAMS=None,
+        EVENTS_POLL_INTERVAL=10, # Segundos entre as consultas de quem ficou sem conexão longa
+        EVENTS_HEARTBEAT=15, # Segundos sem eventos até enviar um comentário de keep-alive
+        EVENTS_STREAM_LIFETIME=300, # Segundos até encerrar a conexão (o navegador reconecta)
+        SEARCH_PER_PAGE=20, # Resultados por página da busca
+        SEARCH_MAX_PAGES=50, # Limita o OFFSET da busca ordenada por relevância
+        EXPORT_FETCH_SIZE=500, # Linhas lidas por vez do cursor sem buffer da exportação
+        IMPORT_CHUNK_SIZE=1000, # Registros gravados por transação na importação
+        # Remoção em lotes dos registros excluídos logicamente (purge.py)
+        PURGE_BATCH_SIZE=1000, # Máximo de tarefas removidas por transação
+        PURGE_PAUSE=0.05, # Segundos de pausa entre lotes, para não monopolizar o banco
+        # Partida do app (startup.py)
+        TEMPLATE_BYTECODE_CACHE=True, # Guarda os templates compilados em instance/jinja_cache
+        PRELOAD_TEMPLATES=True, # Compila todos os templates em create_app, antes da 1ª requisição
     )
 
     if test_config is None:
@@ -24,6 +113,10 @@ def create_app(test_config=None):
         # carrega a configuração de teste se for passada
         app.config.from_mapping(test_config)
 
+    if app.config['PROXY_TRUSTED_HOPS']:
+        hops = app.config['PROXY_TRUSTED_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
     # garante que a pasta da instância exista
     try:
         os.makedirs(app.instance_path)
@@ -37,7 +130,22 @@ def create_app(test_config=None):
 
     # Importa e inicializa o módulo db
     from . import db
-    db.init_app(app) # Isso inicializa Flask-MySQLdb com o app e registra callbacks
+    db.init_app(app) # Isso inicializa o pool de conexões com o app e registra callbacks
+
+    from . import cache
+    cache.init_app(app) # Cache de fragmentos das páginas (PAGE_CACHE_MAX_CHARS)
+
+    from . import instrument
+    instrument.init_app(app) # Server-Timing e estatísticas de consultas (QUERY_STATS)
+
+    from . import purge
+    purge.init_app(app) # Comando purge-deleted
+
+    from . import sharding
+    sharding.init_app(app) # Comandos shard-move e shard-status
+
+    from . import positions
+    positions.init_app(app) # Comando rebalance-positions
 
     # Importa e registra os blueprints
     from . import auth
@@ -50,5 +158,20 @@ def create_app(test_config=None):
     from . import task
     app.register_blueprint(task.bp)
 
+    from . import search
+    app.register_blueprint(search.bp)
+
+    from . import bulk
+    app.register_blueprint(bulk.bp)
+
+    from . import api
+    app.register_blueprint(api.bp)
+
+    from . import admin
+    app.register_blueprint(admin.bp)
+
+    from . import startup
+    startup.init_app(app) # Cache de bytecode e pré-carga dos templates; comando startup-time
+
     return app
 
@@ -0,0 +1,53 @@
+import functools
+
+from flask import Blueprint, current_app, g, jsonify
+from werkzeug.exceptions import abort
+
+from .auth import get_user_cache, login_required
+from .cache import get_page_cache
+from .db import pool_status, shard_count, transaction_metrics
+from .events import get_hub, get_stream_slots
+from .purge import purge_status
+from .sharding import shard_status
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
+def admin_required(view):
+    """Restringe a view aos usuários listados em ADMIN_USER_IDS."""
+    @functools.wraps(view)
+    @login_required
+    def wrapped_view(**kwargs):
+        if g.user['id'] not in current_app.config['ADMIN_USER_IDS']:
+            abort(403)
+
+        return view(**kwargs)
+
+    return wrapped_view
+
+
+@bp.route('/db-stats')
+@admin_required
+def db_stats():
+    """
+    Estatísticas deste processo: consultas por endpoint e por instrução,
+    pool de conexões, transações, caches, exclusões pendentes de purge, shards
+    e conexões de eventos.
+    """
+    stats = {}
+    if 'query_stats' in current_app.extensions:
+        stats.update(current_app.extensions['query_stats'].snapshot())
+    stats['pool'] = pool_status()
+    stats['transactions'] = dict(transaction_metrics())
+    stats['purge_pending'] = purge_status()
+    if shard_count() > 1:
+        stats['shards'] = shard_status()
+    hub = get_hub()
+    if hasattr(hub, 'status'):
+        stats['events'] = hub.status()
+    stats['event_streams'] = get_stream_slots().status()
+    stats['user_cache'] = get_user_cache().status()
+    page_cache = get_page_cache()
+    if page_cache is not None:
+        stats['page_cache'] = page_cache.status()
+    return jsonify(stats)
@@ -0,0 +1,285 @@
+import functools
+import hashlib
+
+from flask import Blueprint, current_app, g, jsonify, request
+from werkzeug.exceptions import HTTPException, abort
+
+from .cache import invalidate_pages
+from .db import shard_db, transactional
+from .models import Task, Tasklist
+from .events import publish
+from .task import (
+    TASK_COLUMNS, create_tasks, delete_tasks, get_task, publish_changed_tasks, set_tasks_completed
+)
+from .tasklist import (
+    TASKLIST_COLUMNS, decode_cursor, encode_cursor, get_post, soft_delete_tasklist, touch_tasklist
+)
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+@bp.errorhandler(HTTPException)
+def handle_http_error(e):
+    """Responde erros da API em JSON em vez das páginas HTML padrão."""
+    response = jsonify(error=e.name, message=e.description)
+    response.status_code = e.code
+    return response
+
+
+def api_login_required(view):
+    """Como auth.login_required, mas responde 401 em vez de redirecionar para o login."""
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        if g.user is None:
+            abort(401)
+
+        return view(**kwargs)
+
+    return wrapped_view
+
+
+def conditional(etag):
+    """
+    Compara a ETag com If-None-Match/If-Match da requisição.
+
+    Retorna uma resposta 304 vazia quando o cliente já tem a versão atual, ou
+    None para que a view continue. Aborta 412 se If-Match não bater (proteção
+    contra atualizações concorrentes).
+    """
+    if request.method in ('GET', 'HEAD'):
+        if request.if_none_match.contains(etag):
+            return with_etag(current_app.response_class(status=304), etag)
+    elif request.if_match and not request.if_match.contains(etag):
+        abort(412)
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # O cliente pode guardar a resposta, mas deve revalidá-la a cada uso
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def tasklist_etag(tasklist):
+    return f"tasklist-{tasklist['id']}-v{tasklist['version']}"
+
+
+def tasklist_json(tasklist):
+    return dict(
+        id=tasklist['id'],
+        title=tasklist['title'],
+        body=tasklist['body'],
+        created=tasklist['created'].isoformat(),
+        author_id=tasklist['author_id'],
+        version=tasklist['version'],
+        task_count=tasklist['task_count'],
+        completed_count=tasklist['completed_count'],
+    )
+
+
+def task_json(task):
+    return dict(
+        id=task['id'],
+        tasklist_id=task['tasklist_id'],
+        body=task['body'],
+        completed=bool(task['completed']),
+        created=task['created'].isoformat(),
+    )
+
+
+def json_body(*required):
+    """Lê o corpo JSON da requisição, abortando 400 se faltar algum campo obrigatório."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, 'O corpo da requisição deve ser um objeto JSON.')
+    for field in required:
+        if not data.get(field):
+            abort(400, f"O campo '{field}' é obrigatório.")
+    return data
+
+
+@bp.get('/tasklists')
+@api_login_required
+def list_tasklists():
+    """
+    Lista as tasklists do usuário, das mais recentes para as mais antigas.
+    Paginação por keyset: passe o 'next' da resposta no parâmetro 'after'.
+    """
+    per_page = current_app.config['TASKLISTS_PER_PAGE']
+    query = f'SELECT {TASKLIST_COLUMNS} FROM tasklist WHERE author_id = %s AND deleted_at IS NULL'
+    params = (g.user['id'],)
+    after = request.args.get('after')
+    if after:
+        created, id = decode_cursor(after)
+        query += ' AND (created < %s OR (created = %s AND id < %s))'
+        params += (created, created, id)
+    query += ' ORDER BY created DESC, id DESC LIMIT %s'
+    params += (per_page + 1,)
+
+    db_cursor = shard_db(readonly=True)
+    db_cursor.execute(query, params)
+    tasklists = Tasklist.fetchmany(db_cursor, per_page + 1)
+    next_cursor = encode_cursor(tasklists[per_page - 1]) if len(tasklists) > per_page else None
+    tasklists = tasklists[:per_page]
+
+    # A ETag da página depende só de (id, versão) de cada tasklist: dá para
+    # responder 304 sem serializar nada.
+    digest = hashlib.blake2b(digest_size=16)
+    for tasklist in tasklists:
+        digest.update(f"{tasklist['id']}:{tasklist['version']},".encode())
+    digest.update(str(next_cursor).encode())
+    etag = digest.hexdigest()
+
+    response = conditional(etag)
+    if response is not None:
+        return response
+
+    return with_etag(jsonify(
+        tasklists=[tasklist_json(tasklist) for tasklist in tasklists],
+        next=next_cursor,
+    ), etag)
+
+
+@bp.post('/tasklists')
+@api_login_required
+@transactional
+def create_tasklist():
+    """Cria uma tasklist a partir de {"title": ..., "body": ...}."""
+    data = json_body('title')
+    db_cursor = shard_db()
+    db_cursor.execute(
+        'INSERT INTO tasklist (title, body, author_id) VALUES (%s, %s, %s)',
+        (data['title'], data.get('body', ''), g.user['id'])
+    )
+    id = db_cursor.lastrowid
+    invalidate_pages('index-head')
+
+    tasklist = get_post(id)
+    response = with_etag(jsonify(tasklist_json(tasklist)), tasklist_etag(tasklist))
+    response.status_code = 201
+    return response
+
+
+@bp.get('/tasklists/<int:id>')
+@api_login_required
+def get_tasklist(id):
+    """
+    Retorna a tasklist com as suas tarefas.
+    A ETag é checada antes de buscar as tarefas, então um 304 custa só uma consulta por chave primária.
+    """
+    tasklist = get_post(id)
+    etag = tasklist_etag(tasklist)
+    response = conditional(etag)
+    if response is not None:
+        return response
+
+    db_cursor = shard_db(readonly=True)
+    db_cursor.execute(
+        f'SELECT {TASK_COLUMNS} FROM task WHERE tasklist_id = %s ORDER BY position, id',
+        (id,)
+    )
+    tasks = [task_json(task) for task in Task.fetchall(db_cursor)]
+
+    return with_etag(jsonify(dict(tasklist_json(tasklist), tasks=tasks)), etag)
+
+
+@bp.patch('/tasklists/<int:id>')
+@api_login_required
+@transactional
+def update_tasklist(id):
+    """Altera 'title' e/ou 'body'. Aceita If-Match com a ETag atual."""
+    # Bloqueada até o commit: outra alteração não passa entre a checagem do If-Match e o UPDATE
+    tasklist = get_post(id, lock=True)
+    response = conditional(tasklist_etag(tasklist))
+    if response is not None:
+        return response
+
+    data = json_body()
+    title = data.get('title', tasklist['title'])
+    if not title:
+        abort(400, "O campo 'title' é obrigatório.")
+
+    db_cursor = shard_db()
+    db_cursor.execute(
+        'UPDATE tasklist SET title = %s, body = %s, version = version + 1 WHERE id = %s',
+        (title, data.get('body', tasklist['body']), id)
+    )
+    invalidate_pages(f'tasklist:{id}')
+    publish(id, dict(type='tasklist', title=title, body=data.get('body', tasklist['body'])))
+
+    tasklist = get_post(id)
+    return with_etag(jsonify(tasklist_json(tasklist)), tasklist_etag(tasklist))
+
+
+@bp.delete('/tasklists/<int:id>')
+@api_login_required
+@transactional
+def delete_tasklist(id):
+    tasklist = get_post(id, lock=True) # Como em update_tasklist
+    response = conditional(tasklist_etag(tasklist))
+    if response is not None:
+        return response
+
+    soft_delete_tasklist(id)
+    return '', 204
+
+
+@bp.post('/tasklists/<int:tasklist_id>/tasks')
+@api_login_required
+@transactional
+def create_task(tasklist_id):
+    """Cria uma tarefa a partir de {"body": ...}."""
+    get_post(tasklist_id)
+    data = json_body('body')
+
+    id = create_tasks(tasklist_id, [data['body']])
+
+    response = jsonify(task_json(get_task(id)))
+    response.status_code = 201
+    return response
+
+
+@bp.get('/tasks/<int:id>')
+@api_login_required
+def get_task_json(id):
+    """Retorna uma tarefa. A ETag é a da tasklist pai, que muda a cada alteração nas suas tarefas."""
+    task = get_task(id)
+    tasklist = get_post(task['tasklist_id'])
+    etag = tasklist_etag(tasklist)
+    response = conditional(etag)
+    if response is not None:
+        return response
+
+    return with_etag(jsonify(task_json(task)), etag)
+
+
+@bp.patch('/tasks/<int:id>')
+@api_login_required
+@transactional
+def update_task(id):
+    """Altera 'body' e/ou 'completed' de uma tarefa."""
+    task = get_task(id)
+    data = json_body()
+    body = data.get('body', task['body'])
+    if not body:
+        abort(400, "O campo 'body' é obrigatório.")
+
+    if body != task['body']:
+        touch_tasklist(task['tasklist_id']) # Bloqueia a tasklist antes da tarefa
+        shard_db().execute('UPDATE task SET body = %s WHERE id = %s', (body, id))
+        publish_changed_tasks(task['tasklist_id'], 'task.id = %s', (id,))
+    if 'completed' in data:
+        set_tasks_completed(task['tasklist_id'], [id], bool(data['completed']))
+
+    return jsonify(task_json(get_task(id)))
+
+
+@bp.delete('/tasks/<int:id>')
+@api_login_required
+@transactional
+def delete_task(id):
+    task = get_task(id)
+
+    delete_tasks(task['tasklist_id'], [id])
+    return '', 204
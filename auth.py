@@ -1,28 +1,58 @@
 import functools
 
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request, session,
+    url_for
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-
+from werkzeug.exceptions import abort
 # Ajusta as importações para serem relativas ao pacote
-from db import get_db, mysql_db # Importa também o objeto mysql_db para o commit
-import MySQLdb # Importa MySQLdb para acessar IntegrityError
+from .cache import TieredCache, invalidate_pages
+from .db import (
+    after_commit, assign_shard, get_backend, get_db, shard_db, transaction, transactional
+)
+from .models import User
+from .passwords import HashQueueFull, get_hasher, get_login_throttle
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# Colunas de models.User, guardadas em g.user e no cache. Nunca inclua o hash da senha.
+USER_COLUMNS = 'id, username'
+
+# Resposta quando o pool de hashes de senha está cheio ou atrasado (passwords.HashQueueFull)
+BUSY_MESSAGE = 'Servidor ocupado. Tente novamente em instantes.'
+
+# Prefixo do username das contas excluídas (delete_user), que libera o nome
+# original. Cadastros e alterações não podem usá-lo: o 'UPDATE' da exclusão
+# falharia com o username já ocupado.
+DELETED_USERNAME_PREFIX = '#deleted-'
+DELETED_USERNAME_ERROR = f'Username cannot start with "{DELETED_USERNAME_PREFIX}".'
+
+
+def get_user_cache():
+    """Cache dos usuários logados deste app (ver USER_CACHE_* em create_app)."""
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        config = current_app.config
+        cache = current_app.extensions.setdefault('user_cache', TieredCache(
+            'user',
+            max_size=config['USER_CACHE_SIZE'],
+            ttl=config['USER_CACHE_TTL'],
+            backend=config['USER_CACHE_BACKEND'],
+            shared_ttl=config['USER_CACHE_SHARED_TTL'],
+        ))
+    return cache
+
 
 def get_user(id):
     """Obtém um usuário do banco de dados pelo ID, ou aborta 404 se não encontrado."""
-    db_cursor = get_db() # Obtém o cursor
+    db_cursor = get_db(readonly=True) # Obtém o cursor (pode ser de uma réplica)
     db_cursor.execute( # Executa a consulta no cursor
-        'SELECT id, username FROM user WHERE id = %s', (id,) # Use %s para MySQL
+        f'SELECT {USER_COLUMNS} FROM user WHERE id = %s AND deleted_at IS NULL', (id,) # Use %s para MySQL
     )
-    user = db_cursor.fetchone() # fetchone() é chamado no cursor
-
-    return user
+    return User.fetchone(db_cursor)
 
 @bp.route('/register', methods=('GET', 'POST'))
+@transactional
 def register():
     """Permite o registro de novos usuários."""
     if request.method == 'POST':
@@ -33,22 +63,27 @@ def register():
 
         if not username:
             error = 'Username is required.'
+        elif username.startswith(DELETED_USERNAME_PREFIX):
+            error = DELETED_USERNAME_ERROR
         elif not password:
             error = 'Password is required.'
 
         if error is None:
+            try:
+                password_hash = get_hasher().hash(password) # Roda no pool de hashes
+            except HashQueueFull:
+                flash(BUSY_MESSAGE)
+                return render_template('auth/register.html'), 503
+
             try:
                 db_cursor.execute( # Executa a inserção no cursor
                     "INSERT INTO user (username, password) VALUES (%s, %s)", # Use %s para MySQL
-                    (username, generate_password_hash(password)),
+                    (username, password_hash),
                 )
-                mysql_db.connection.commit() # Commita as alterações
-            except MySQLdb.IntegrityError: # Exceção de integridade do MySQLdb
+            except get_backend().IntegrityError: # Exceção de integridade do driver do banco
                 error = f"User {username} is already registered."
-            except Exception as e: # Captura outras exceções genéricas do DB
-                error = f"An error occurred during registration: {e}"
-                mysql_db.connection.rollback() # Faz rollback em caso de erro
             else:
+                assign_shard(db_cursor.lastrowid) # Onde ficarão as tasklists do usuário
                 return redirect(url_for("auth.login"))
 
         flash(error)
@@ -58,44 +93,83 @@ def register():
 
 @bp.route('/login', methods=('GET', 'POST'))
 def login():
-    """Permite o login de usuários existentes."""
+    """
+    Permite o login de usuários existentes.
+
+    As tentativas falhas são limitadas por username e por IP (o do cliente, ver
+    PROXY_TRUSTED_HOPS), verificadas antes de qualquer hash ser calculado, e o
+    hash é refeito se PASSWORD_HASH_METHOD mudou.
+    """
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db_cursor = get_db() # Obtém o cursor
         error = None
+
+        throttle = get_login_throttle()
+        limits = {
+            f'user:{username}': current_app.config['LOGIN_ATTEMPTS_PER_USERNAME'],
+            f'ip:{request.remote_addr}': current_app.config['LOGIN_ATTEMPTS_PER_IP'],
+        }
+        retry_after = throttle.check(limits)
+        if retry_after is not None:
+            flash(f'Muitas tentativas de login. Tente novamente em {retry_after} segundos.')
+            return render_template('auth/login.html'), 429, {'Retry-After': str(retry_after)}
+
+        db_cursor = get_db() # Obtém o cursor
         db_cursor.execute( # Executa a consulta no cursor
-            'SELECT * FROM user WHERE username = %s', (username,) # Use %s para MySQL
+            'SELECT id, password FROM user WHERE username = %s AND deleted_at IS NULL', # Use %s para MySQL
+            (username,)
         )
-        user = db_cursor.fetchone() # fetchone() é chamado no cursor
-
-        if user is None:
-            error = 'Incorrect username.'
-        elif not check_password_hash(user['password'], password):
-            error = 'Incorrect password.'
+        user_id, stored_hash = db_cursor.fetchone() or (None, None)
+
+        hasher = get_hasher()
+        try:
+            if user_id is None:
+                error = 'Incorrect username.'
+            elif not hasher.verify(stored_hash, password): # Roda no pool de hashes
+                error = 'Incorrect password.'
+            elif hasher.needs_rehash(stored_hash):
+                # A senha está correta, mas o hash usa parâmetros antigos: refaz agora
+                password_hash = hasher.hash(password)
+                with transaction():
+                    db_cursor.execute(
+                        'UPDATE user SET password = %s WHERE id = %s', (password_hash, user_id)
+                    )
+        except HashQueueFull:
+            flash(BUSY_MESSAGE)
+            return render_template('auth/login.html'), 503
 
         if error is None:
+            throttle.reset(f'user:{username}')
             session.clear()
-            session['user_id'] = user['id']
+            session['user_id'] = user_id
             return redirect(url_for('index'))
 
+        throttle.fail(limits)
         flash(error)
 
     return render_template('auth/login.html')
 
 @bp.before_app_request
 def load_logged_in_user():
-    """Carrega o usuário logado antes de cada requisição."""
+    """
+    Carrega o usuário logado antes de cada requisição.
+    Normalmente vem do cache, sem tocar no banco; ver get_user_cache().
+    """
     user_id = session.get('user_id')
 
     if user_id is None:
         g.user = None
+        return
+
+    cache = get_user_cache()
+    cached = cache.get(user_id)
+    if cached is not None:
+        g.user = User(*cached)
     else:
-        db_cursor = get_db() # Obtém o cursor
-        db_cursor.execute( # Executa a consulta no cursor
-            'SELECT * FROM user WHERE id = %s', (user_id,) # Use %s para MySQL
-        )
-        g.user = db_cursor.fetchone() # fetchone() é chamado no cursor
+        g.user = get_user(user_id)
+        if g.user is not None:
+            cache.set(user_id, g.user.astuple()) # Tupla: o cache compartilhado guarda JSON
 
 @bp.route('/logout')
 def logout():
@@ -118,8 +192,11 @@ def login_required(view):
 
 @bp.route('/<int:id>/update', methods=('GET', 'POST'))
 @login_required
+@transactional
 def update(id):
-    """Permite a atualização de um usuário."""
+    """Permite ao usuário logado atualizar a própria conta."""
+    if id != g.user['id']:
+        abort(403)
     user = get_user(id) # get_user já usa o novo padrão
 
     if request.method == 'POST':
@@ -129,17 +206,32 @@ def update(id):
 
         if not username:
             error = 'Username is required.'
+        elif username.startswith(DELETED_USERNAME_PREFIX):
+            error = DELETED_USERNAME_ERROR
 
         if error is not None:
             flash(error)
         else:
             db_cursor = get_db() # Obtém o cursor
-            db_cursor.execute( # Executa a atualização no cursor
-                'UPDATE user SET username = %s, password = %s' # Use %s para MySQL
-                ' WHERE id = %s', # Use %s para MySQL
-                (username, generate_password_hash(password), id)
-            )
-            mysql_db.connection.commit() # Commita as alterações
+            if not password:
+                # Senha em branco: mantém a atual, sem gastar um hash
+                db_cursor.execute(
+                    'UPDATE user SET username = %s WHERE id = %s', (username, id)
+                )
+            else:
+                try:
+                    password_hash = get_hasher().hash(password) # Roda no pool de hashes
+                except HashQueueFull:
+                    flash(BUSY_MESSAGE)
+                    return render_template('auth/updateuser.html', user=user), 503
+                db_cursor.execute( # Executa a atualização no cursor
+                    'UPDATE user SET username = %s, password = %s' # Use %s para MySQL
+                    ' WHERE id = %s', # Use %s para MySQL
+                    (username, password_hash, id)
+                )
+            # Remove do cache a versão antiga do usuário, só depois do commit. Os
+            # fragmentos do cache de páginas não exibem o username: nada a invalidar.
+            after_commit(lambda: get_user_cache().delete(id))
             return redirect(url_for('tasklist.index')) # Redireciona para a lista de tarefas após a atualização
 
     return render_template('auth/updateuser.html', user=user)
@@ -147,6 +239,7 @@ def update(id):
 
 @bp.route('/<int:id>/delete-user', methods=('POST',))
 @login_required
+@transactional
 def delete_user(id):
     """Permite a exclusão de um usuário."""
     user_to_delete = get_user(id)
@@ -160,22 +253,25 @@ def delete_user(id):
         return redirect(url_for('auth.login')) # Ou outro redirecionamento apropriado
 
     db_cursor = get_db() # Obtém o cursor
-    try:
-        db_cursor.execute('DELETE FROM user WHERE id = %s', (id,)) # Use %s para MySQL
-        mysql_db.connection.commit() # Commita as alterações
-
-        if user_to_delete['id'] == g.user['id']:
-            logout() # Se o próprio usuário se deletou, desloga
-            flash(f"Sua conta '{user_to_delete['username']}' foi deletada com sucesso.", 'success')
-            return redirect(url_for('auth.login'))
-        else:
-            flash(f"A conta '{user_to_delete['username']}' foi deletada com sucesso.", 'success')
-            return redirect(url_for('index')) # Redireciona para a página principal se deletou outro usuário (admin)
-
-    except Exception as e:
-        # Importante: para rollback, precisamos do objeto de conexão
-        mysql_db.connection.rollback() # Faz rollback em caso de erro
-        flash(f"Ocorreu um erro ao deletar a conta: {e}", 'error')
+    # Exclusão lógica do usuário e das suas tasklists: some na hora, e purge.py
+    # remove as linhas depois, em lotes. O username fica livre para novos cadastros.
+    db_cursor.execute(
+        'UPDATE user SET deleted_at = CURRENT_TIMESTAMP, username = %s WHERE id = %s',
+        (f'{DELETED_USERNAME_PREFIX}{id}', id)
+    )
+    shard_db(id).execute( # As tasklists ficam no shard do usuário
+        'UPDATE tasklist SET deleted_at = CURRENT_TIMESTAMP, version = version + 1'
+        ' WHERE author_id = %s AND deleted_at IS NULL',
+        (id,)
+    )
+    after_commit(lambda: get_user_cache().delete(id))
+    invalidate_pages(f'user:{id}') # Páginas do índice com as tasklists do usuário, agora excluídas
 
-    return redirect(url_for('auth.login'))
+    if user_to_delete['id'] == g.user['id']:
+        logout() # Se o próprio usuário se deletou, desloga
+        flash(f"Sua conta '{user_to_delete['username']}' foi deletada com sucesso.", 'success')
+        return redirect(url_for('auth.login'))
+    else:
+        flash(f"A conta '{user_to_delete['username']}' foi deletada com sucesso.", 'success')
+        return redirect(url_for('index')) # Redireciona para a página principal se deletou outro usuário (admin)
 
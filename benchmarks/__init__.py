@@ -0,0 +1 @@
+"""Benchmarks reproduzíveis da aplicação (ver benchmarks/routes.py, benchmarks/rows.py e benchmarks/search.py)."""
@@ -0,0 +1,322 @@
+"""
+Benchmark de carga das rotas dos blueprints.
+
+Cria o app com create_app(test_config) apontando para um banco MySQL local de
+benchmark, ou para um arquivo SQLite com --backend sqlite (dispensa servidor,
+útil na CI), recriado do zero com init_db; popula usuários × tasklists × tarefas
+e dispara cada rota com a concorrência pedida usando o cliente de teste do
+Flask. O resultado é um JSON com vazão, latências p50/p95/p99 e consultas por
+requisição de cada rota, para comparar entre commits.
+
+Exemplo, a partir do diretório que contém o pacote:
+
+    python -m <pacote>.benchmarks.routes --users 50 --lists 20 --tasks 50 \\
+        --requests 500 --concurrency 8 --output bench.json --baseline antes.json
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from .. import create_app
+from ..db import database, get_db, init_db
+from ..positions import spaced_keys
+
+ROUTES = ('login', 'index', 'detail', 'create', 'toggle', 'delete')
+PASSWORD = 'bench-password'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=('mysql', 'sqlite'),
+                        default=os.environ.get('BENCH_DB_BACKEND', 'mysql'))
+    parser.add_argument('--sqlite-path', default=os.path.join(tempfile.gettempdir(), 'todolist_bench.sqlite'),
+                        help='Arquivo do banco com --backend sqlite. TODO O CONTEÚDO É APAGADO.')
+    parser.add_argument('--host', default=os.environ.get('BENCH_MYSQL_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BENCH_MYSQL_PORT', 3306)))
+    parser.add_argument('--user', default=os.environ.get('BENCH_MYSQL_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('BENCH_MYSQL_PASSWORD', ''))
+    parser.add_argument('--database', default=os.environ.get('BENCH_MYSQL_DB', 'todolist_bench'),
+                        help='Banco usado no benchmark. TODO O CONTEÚDO É APAGADO.')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--lists', type=int, default=10, help='Tasklists por usuário.')
+    parser.add_argument('--tasks', type=int, default=20, help='Tarefas por tasklist.')
+    parser.add_argument('--requests', type=int, default=200, help='Requisições por rota.')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--routes', default=','.join(ROUTES),
+                        help=f"Rotas separadas por vírgula, entre: {', '.join(ROUTES)}.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-page-cache', action='store_true',
+                        help='Desativa o cache de fragmentos (PAGE_CACHE_MAX_CHARS=0).')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout).')
+    parser.add_argument('--baseline', help='JSON de uma execução anterior para comparar.')
+    return parser.parse_args(argv)
+
+
+def make_app(args):
+    return create_app(dict(
+        TESTING=True,
+        SECRET_KEY='bench',
+        DB_BACKEND=args.backend,
+        SQLITE_PATH=args.sqlite_path,
+        MYSQL_HOST=args.host,
+        MYSQL_PORT=args.port,
+        MYSQL_USER=args.user,
+        MYSQL_PASSWORD=args.password,
+        MYSQL_DB=args.database,
+        DB_POOL_MAX_SIZE=max(args.concurrency, 1) + 1,
+        PAGE_CACHE_MAX_CHARS=0 if args.no_page_cache else 8_000_000,
+        QUERY_STATS=True, # Consultas por requisição no SQLite (StatsCounter)
+        # A rota de login é disparada em loop pelos mesmos usuários e IP
+        LOGIN_ATTEMPTS_PER_USERNAME=10**9,
+        LOGIN_ATTEMPTS_PER_IP=10**9,
+    ))
+
+
+def seed(app, args):
+    """Recria o banco e insere os dados; retorna {username: [tasklist_id, ...]}."""
+    rng = random.Random(args.seed)
+    # Mesmo hash para todos: o custo de gerar hashes não interessa aqui
+    password_hash = generate_password_hash(PASSWORD)
+
+    with app.app_context():
+        init_db()
+        cursor = get_db()
+        cursor.executemany(
+            'INSERT INTO user (username, password) VALUES (%s, %s)',
+            [(f'bench{i}', password_hash) for i in range(args.users)]
+        )
+        cursor.execute('SELECT id, username FROM user ORDER BY id')
+        usernames = dict(cursor.fetchall())
+
+        for user_id in usernames:
+            cursor.executemany(
+                'INSERT INTO tasklist (author_id, title, body) VALUES (%s, %s, %s)',
+                [(user_id, f'Lista {n}', 'descrição ' * rng.randint(1, 20))
+                 for n in range(args.lists)]
+            )
+        cursor.execute('SELECT id, author_id FROM tasklist ORDER BY id')
+        lists = {}
+        for tasklist_id, author_id in cursor.fetchall():
+            lists.setdefault(usernames[author_id], []).append(tasklist_id)
+
+        positions = spaced_keys(args.tasks)
+        for user_lists in lists.values():
+            rows = [
+                (tasklist_id, f'tarefa {n} ' + 'x' * rng.randint(0, 80), rng.random() < 0.3, position)
+                for tasklist_id in user_lists for n, position in enumerate(positions)
+            ]
+            cursor.executemany(
+                'INSERT INTO task (tasklist_id, body, completed, position) VALUES (%s, %s, %s, %s)', rows
+            )
+        cursor.execute(
+            'UPDATE tasklist SET'
+            ' task_count = (SELECT COUNT(*) FROM task WHERE tasklist_id = tasklist.id),'
+            ' completed_count = (SELECT COUNT(*) FROM task WHERE tasklist_id = tasklist.id AND completed)'
+        )
+        database.connection.commit()
+
+    return lists
+
+
+def task_ids(app, tasklist_ids):
+    with app.app_context():
+        cursor = get_db()
+        placeholders = ', '.join(['%s'] * len(tasklist_ids))
+        cursor.execute(
+            f'SELECT id FROM task WHERE tasklist_id IN ({placeholders}) ORDER BY id',
+            tuple(tasklist_ids)
+        )
+        return [id for (id,) in cursor.fetchall()]
+
+
+class QuestionCounter:
+    """
+    Conta as instruções recebidas pelo servidor (status global 'Questions').
+    Assume um servidor de benchmark dedicado, sem outros clientes.
+    """
+
+    overhead = 1 # A própria consulta SHOW STATUS
+
+    def __init__(self, args):
+        import MySQLdb
+        self.conn = MySQLdb.connect(
+            host=args.host, port=args.port, user=args.user, password=args.password,
+        )
+
+    def read(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        value = int(cursor.fetchone()[1])
+        cursor.close()
+        return value
+
+
+class StatsCounter:
+    """
+    Conta as instruções pelas estatísticas do app (instrument.QueryStats), para
+    backends sem servidor. Não vê as consultas feitas fora dos cursores de g.
+    """
+
+    overhead = 0
+
+    def __init__(self, app):
+        self.app = app
+
+    def read(self):
+        endpoints = self.app.extensions['query_stats'].snapshot()['endpoints']
+        return sum(stats['queries'] for stats in endpoints.values())
+
+
+def login(client, username):
+    response = client.post('/auth/login', data=dict(username=username, password=PASSWORD))
+    assert response.status_code == 302, f'login de {username} falhou'
+
+
+class Worker:
+    """Um cliente logado como um usuário, com as tasklists e tarefas que pode usar."""
+
+    def __init__(self, app, username, tasklists, toggleable, deletable):
+        self.client = app.test_client()
+        self.username = username
+        self.tasklists = tasklists
+        self.toggleable = toggleable
+        self.deletable = deletable # ids de tarefas só deste worker
+        self.rng = random.Random(f'{username}-{len(deletable)}')
+        login(self.client, username)
+
+    def request(self, route):
+        client, tasklist_id = self.client, self.rng.choice(self.tasklists)
+        if route == 'login':
+            return client.post('/auth/login', data=dict(username=self.username, password=PASSWORD))
+        if route == 'index':
+            return client.get('/')
+        if route == 'detail':
+            return client.get(f'/{tasklist_id}/')
+        if route == 'create':
+            return client.post(f'/task/{tasklist_id}/create', data=dict(body='nova tarefa'))
+        if route == 'toggle':
+            return client.post(f'/task/{self.rng.choice(self.toggleable)}/toggle-complete')
+        if route == 'delete':
+            return client.post(f'/task/{self.deletable.pop()}/delete')
+        raise ValueError(route)
+
+
+def run_route(route, workers, args):
+    """Dispara args.requests requisições da rota e retorna as latências em segundos."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    per_worker = [args.requests // len(workers)] * len(workers)
+    for i in range(args.requests % len(workers)):
+        per_worker[i] += 1
+
+    def drive(worker, count):
+        nonlocal errors
+        local, failed = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            response = worker.request(route)
+            local.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+        for future in [executor.submit(drive, w, n) for w, n in zip(workers, per_worker)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed, questions):
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        throughput_rps=round(len(latencies) / elapsed, 2),
+        p50_ms=round(cuts[49] * 1000, 3),
+        p95_ms=round(cuts[94] * 1000, 3),
+        p99_ms=round(cuts[98] * 1000, 3),
+        queries_per_request=round(questions / len(latencies), 2),
+    )
+
+
+def compare(results, baseline):
+    """Variação percentual de cada métrica em relação a uma execução anterior."""
+    deltas = {}
+    for route, metrics in results.items():
+        before = baseline.get(route)
+        if not before:
+            continue
+        deltas[route] = {
+            name: round((value - before[name]) / before[name] * 100, 1)
+            for name, value in metrics.items()
+            if name in before and isinstance(value, (int, float)) and before[name]
+        }
+    return deltas
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    routes = [route for route in args.routes.split(',') if route]
+    app = make_app(args)
+    lists = seed(app, args)
+    counter = QuestionCounter(args) if args.backend == 'mysql' else StatsCounter(app)
+
+    # Os workers são distribuídos entre os usuários. Metade das tarefas de cada
+    # usuário é alternada pelo 'toggle'; a outra metade é repartida entre os
+    # workers desse usuário para o 'delete', sem que dois excluam a mesma.
+    usernames = sorted(lists)
+    assigned = {}
+    for n in range(args.concurrency):
+        assigned.setdefault(usernames[n % len(usernames)], []).append(n)
+    workers = []
+    for username, slots in assigned.items():
+        owned = task_ids(app, lists[username])
+        toggleable, rest = owned[:len(owned) // 2], owned[len(owned) // 2:]
+        for k in range(len(slots)):
+            workers.append(Worker(
+                app, username, lists[username], toggleable, rest[k::len(slots)]
+            ))
+
+    results = {}
+    for route in routes:
+        if route == 'delete' and min(len(w.deletable) for w in workers) < -(-args.requests // len(workers)):
+            raise SystemExit('Tarefas insuficientes para o benchmark de delete; aumente --tasks.')
+        before = counter.read()
+        latencies, errors, elapsed = run_route(route, workers, args)
+        questions = counter.read() - before - counter.overhead
+        results[route] = summarize(latencies, errors, elapsed, questions)
+
+    report = dict(
+        config=dict(
+            backend=args.backend, users=args.users, lists=args.lists, tasks=args.tasks,
+            requests=args.requests,
+            concurrency=args.concurrency, seed=args.seed, page_cache=not args.no_page_cache,
+        ),
+        routes=results,
+    )
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['change_pct'] = compare(results, json.load(f)['routes'])
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
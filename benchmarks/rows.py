@@ -0,0 +1,173 @@
+"""
+Benchmark das linhas do banco: dicts do DictCursor × modelos de models.py.
+
+Recria um banco MySQL (ou SQLite, com --backend sqlite) de benchmark com uma
+tasklist de --tasks tarefas e lê essas tarefas repetidas vezes com a consulta
+da página de detalhes, de dois jeitos: DictCursor (uma dict por linha, como
+antes; no SQLite, dicts montadas da descrição do cursor) e cursor de tuplas com
+models.Task. Para cada um mede o tempo da consulta com a montagem das linhas,
+a memória ocupada pelas linhas (tracemalloc) e o tempo para renderizar
+task/_detail.html com elas. Com --offline mede só a montagem das linhas a
+partir de tuplas prontas, sem banco.
+
+Exemplo, a partir do diretório que contém o pacote:
+
+    python -m <pacote>.benchmarks.rows --tasks 5000 --repeat 20
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from flask import render_template
+
+from .. import create_app
+from ..db import database, get_backend, get_db, init_db
+from ..models import Task, Tasklist
+from ..positions import spaced_keys
+from ..task import TASK_COLUMNS
+from ..tasklist import TASKLIST_COLUMNS
+
+DETAIL_SQL = f'SELECT {TASK_COLUMNS} FROM task WHERE tasklist_id = %s ORDER BY position, id'
+COLUMNS = Task.__slots__[:5]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=('mysql', 'sqlite'),
+                        default=os.environ.get('BENCH_DB_BACKEND', 'mysql'))
+    parser.add_argument('--sqlite-path', default=os.path.join(tempfile.gettempdir(), 'todolist_bench.sqlite'),
+                        help='Arquivo do banco com --backend sqlite. TODO O CONTEÚDO É APAGADO.')
+    parser.add_argument('--host', default=os.environ.get('BENCH_MYSQL_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BENCH_MYSQL_PORT', 3306)))
+    parser.add_argument('--user', default=os.environ.get('BENCH_MYSQL_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('BENCH_MYSQL_PASSWORD', ''))
+    parser.add_argument('--database', default=os.environ.get('BENCH_MYSQL_DB', 'todolist_bench'),
+                        help='Banco usado no benchmark. TODO O CONTEÚDO É APAGADO.')
+    parser.add_argument('--tasks', type=int, default=5000, help='Tarefas na tasklist lida.')
+    parser.add_argument('--repeat', type=int, default=20, help='Repetições de cada medição.')
+    parser.add_argument('--offline', action='store_true',
+                        help='Mede só a montagem das linhas, sem banco.')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout).')
+    return parser.parse_args(argv)
+
+
+def measure(fn, repeat):
+    """Mediana do tempo de fn() em ms e bytes alocados pelo resultado (por linha)."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    rows = fn()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(
+        median_ms=round(statistics.median(timings) * 1000, 3),
+        bytes_per_row=round(allocated / max(len(rows), 1), 1),
+    ), rows
+
+
+def offline(args):
+    created = datetime(2024, 1, 1)
+    tuples = [(n, 1, f'tarefa {n}', n % 2, created) for n in range(args.tasks)]
+    results = {}
+    results['dict'], _ = measure(lambda: [dict(zip(COLUMNS, row)) for row in tuples], args.repeat)
+    results['slots'], _ = measure(lambda: [Task(*row) for row in tuples], args.repeat)
+    return results
+
+
+def seed(app, args):
+    """Recria o banco com um usuário e uma tasklist de args.tasks tarefas; retorna o id dela."""
+    with app.app_context():
+        init_db()
+        cursor = get_db()
+        cursor.execute("INSERT INTO user (username, password) VALUES ('bench', '-')")
+        cursor.execute(
+            "INSERT INTO tasklist (author_id, title, body, task_count) VALUES (%s, 'Lista', '', %s)",
+            (cursor.lastrowid, args.tasks)
+        )
+        tasklist_id = cursor.lastrowid
+        cursor.executemany(
+            'INSERT INTO task (tasklist_id, body, completed, position) VALUES (%s, %s, %s, %s)',
+            [(tasklist_id, f'tarefa {n} ' + 'x' * (n % 80), n % 3 == 0, position)
+             for n, position in enumerate(spaced_keys(args.tasks))]
+        )
+        database.connection.commit()
+    return tasklist_id
+
+
+def online(args):
+    app = create_app(dict(
+        TESTING=True,
+        SECRET_KEY='bench',
+        DB_BACKEND=args.backend,
+        SQLITE_PATH=args.sqlite_path,
+        MYSQL_HOST=args.host,
+        MYSQL_PORT=args.port,
+        MYSQL_USER=args.user,
+        MYSQL_PASSWORD=args.password,
+        MYSQL_DB=args.database,
+        QUERY_STATS=False,
+    ))
+    tasklist_id = seed(app, args)
+
+    results = {}
+    with app.test_request_context():
+        conn = database.connection
+        cursor = get_backend().cursor(conn)
+        cursor.execute(f'SELECT {TASKLIST_COLUMNS} FROM tasklist WHERE id = %s', (tasklist_id,))
+        tasklist = Tasklist.fetchone(cursor)
+
+        def read_dicts():
+            if args.backend == 'sqlite':
+                cursor.execute(DETAIL_SQL, (tasklist_id,))
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            import MySQLdb.cursors
+            dict_cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+            dict_cursor.execute(DETAIL_SQL, (tasklist_id,))
+            return dict_cursor.fetchall()
+
+        def read_models():
+            cursor.execute(DETAIL_SQL, (tasklist_id,))
+            return Task.fetchall(cursor)
+
+        for name, read in (('dict', read_dicts), ('slots', read_models)):
+            results[name], tasks = measure(read, args.repeat)
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                render_template('task/_detail.html', tasklist=tasklist, tasks=tasks)
+                timings.append(time.perf_counter() - started)
+            results[name]['render_median_ms'] = round(statistics.median(timings) * 1000, 3)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = offline(args) if args.offline else online(args)
+    for metric in ('median_ms', 'bytes_per_row', 'render_median_ms'):
+        if metric in results['dict']:
+            before, after = results['dict'][metric], results['slots'][metric]
+            results.setdefault('change_pct', {})[metric] = round((after - before) / before * 100, 1)
+
+    output = json.dumps(dict(
+        config=dict(tasks=args.tasks, repeat=args.repeat, offline=args.offline, backend=args.backend),
+        rows=results,
+    ), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
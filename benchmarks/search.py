@@ -0,0 +1,143 @@
+"""
+Benchmark da busca (search.py): latência para um usuário conforme cresce o
+número de usuários que usam as mesmas palavras.
+
+Para cada quantidade de usuários em --users, recria um banco MySQL (ou SQLite,
+com --backend sqlite) em que cada usuário tem --lists tasklists de --tasks
+tarefas, todas com a palavra comum 'mercado'; só as tarefas do primeiro usuário
+têm também a palavra 'exclusivo'. Mede então, para o primeiro usuário, a
+latência (mediana e p95) de search_user_data com a palavra comum e com a
+exclusiva. Os dados do usuário são os mesmos em todas as quantidades, então a
+latência da palavra comum deve ficar estável mesmo numa tabela grande com
+muitos usuários: o índice só tem a lista de ocorrências do próprio usuário
+(ver o comentário de MYSQL_SEARCH_SQL). Se ela crescer com --users, o índice
+voltou a pontuar as linhas dos outros usuários.
+
+Exemplo, a partir do diretório que contém o pacote:
+
+    python -m <pacote>.benchmarks.search --users 1,100,1000 --repeat 50
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from .. import create_app
+from ..db import database, get_db, init_db
+from ..positions import spaced_keys
+from ..search import search_user_data
+
+WORDS = dict(common='mercado', exclusive='exclusivo')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=('mysql', 'sqlite'),
+                        default=os.environ.get('BENCH_DB_BACKEND', 'mysql'))
+    parser.add_argument('--sqlite-path', default=os.path.join(tempfile.gettempdir(), 'todolist_bench.sqlite'),
+                        help='Arquivo do banco com --backend sqlite. TODO O CONTEÚDO É APAGADO.')
+    parser.add_argument('--host', default=os.environ.get('BENCH_MYSQL_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BENCH_MYSQL_PORT', 3306)))
+    parser.add_argument('--user', default=os.environ.get('BENCH_MYSQL_USER', 'root'))
+    parser.add_argument('--password', default=os.environ.get('BENCH_MYSQL_PASSWORD', ''))
+    parser.add_argument('--database', default=os.environ.get('BENCH_MYSQL_DB', 'todolist_bench'),
+                        help='Banco usado no benchmark. TODO O CONTEÚDO É APAGADO.')
+    parser.add_argument('--users', default='1,100,1000',
+                        help='Quantidades de usuários, separadas por vírgula; o banco é recriado para cada uma.')
+    parser.add_argument('--lists', type=int, default=5, help='Tasklists por usuário.')
+    parser.add_argument('--tasks', type=int, default=20, help='Tarefas por tasklist.')
+    parser.add_argument('--repeat', type=int, default=30, help='Buscas medidas por palavra.')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout).')
+    return parser.parse_args(argv)
+
+
+def make_app(args):
+    return create_app(dict(
+        TESTING=True,
+        SECRET_KEY='bench',
+        DB_BACKEND=args.backend,
+        SQLITE_PATH=args.sqlite_path,
+        MYSQL_HOST=args.host,
+        MYSQL_PORT=args.port,
+        MYSQL_USER=args.user,
+        MYSQL_PASSWORD=args.password,
+        MYSQL_DB=args.database,
+        QUERY_STATS=False,
+    ))
+
+
+def seed(app, args, users):
+    """Recria o banco com 'users' usuários; retorna o id do primeiro."""
+    positions = spaced_keys(args.tasks)
+    with app.app_context():
+        init_db()
+        cursor = get_db()
+        cursor.executemany(
+            'INSERT INTO user (username, password) VALUES (%s, %s)',
+            [(f'bench{i}', '-') for i in range(users)]
+        )
+        cursor.execute('SELECT id FROM user ORDER BY id')
+        user_ids = [id for (id,) in cursor.fetchall()]
+
+        for user_id in user_ids:
+            extra = f" {WORDS['exclusive']}" if user_id == user_ids[0] else ''
+            cursor.executemany(
+                'INSERT INTO tasklist (author_id, title, body, task_count) VALUES (%s, %s, %s, %s)',
+                [(user_id, f'Lista {n}', '', args.tasks) for n in range(args.lists)]
+            )
+            cursor.execute('SELECT id FROM tasklist WHERE author_id = %s', (user_id,))
+            cursor.executemany(
+                'INSERT INTO task (tasklist_id, body, position) VALUES (%s, %s, %s)',
+                [(tasklist_id, f"tarefa {n} {WORDS['common']}{extra}", position)
+                 for (tasklist_id,) in cursor.fetchall() for n, position in enumerate(positions)]
+            )
+        # O índice FULLTEXT do InnoDB só vê as linhas depois do commit
+        database.connection.commit()
+    return user_ids[0]
+
+
+def measure(app, args, author_id, word):
+    per_page = app.config['SEARCH_PER_PAGE']
+    timings = []
+    with app.test_request_context():
+        results, _ = search_user_data(author_id, word, 1, per_page) # Aquece conexão e caches
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            search_user_data(author_id, word, 1, per_page)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return dict(
+        median_ms=round(statistics.median(timings) * 1000, 3),
+        p95_ms=round(timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1000, 3),
+        results=len(results),
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = make_app(args)
+    runs = []
+    for users in [int(n) for n in args.users.split(',')]:
+        author_id = seed(app, args, users)
+        runs.append(dict(
+            users=users,
+            # Linhas do banco inteiro com a palavra comum
+            matching_tasks=users * args.lists * args.tasks,
+            searches={name: measure(app, args, author_id, word) for name, word in WORDS.items()},
+        ))
+
+    output = json.dumps(dict(
+        config=dict(lists=args.lists, tasks=args.tasks, repeat=args.repeat, backend=args.backend),
+        runs=runs,
+    ), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+import codecs
+import csv
+import io
+import itertools
+import json
+
+import click
+from flask import (
+    Blueprint, Response, current_app, flash, g, redirect, render_template, request,
+    stream_with_context, url_for
+)
+from werkzeug.exceptions import abort
+
+from .auth import login_required
+from .cache import invalidate_pages
+from .db import get_db, run_transaction, shard_db, shard_for, streaming_cursor
+from .positions import append_positions
+from .tasklist import touch_tasklist
+
+bp = Blueprint('bulk', __name__, url_prefix='/bulk', cli_group=None)
+
+# Uma linha por tarefa; a tasklist se repete em todas as suas tarefas e uma
+# tasklist sem tarefas aparece numa linha com as colunas task_* vazias.
+CSV_COLUMNS = (
+    'tasklist_id', 'tasklist_title', 'tasklist_body', 'tasklist_created',
+    'task_id', 'task_body', 'task_completed', 'task_created',
+)
+
+# Tasklists do usuário com as suas tarefas, já agrupadas e na ordem de exibição.
+# As colunas seguem a ordem de CSV_COLUMNS.
+EXPORT_SQL = """
+    SELECT tasklist.id, tasklist.title, tasklist.body, tasklist.created,
+           task.id, task.body, task.completed, task.created
+    FROM tasklist LEFT JOIN task ON task.tasklist_id = tasklist.id
+    WHERE tasklist.author_id = %s AND tasklist.deleted_at IS NULL
+    ORDER BY tasklist.created DESC, tasklist.id DESC, task.position ASC, task.id ASC
+"""
+
+# Tamanho máximo do título, como na coluna tasklist.title
+TITLE_MAX_LENGTH = 255
+
+# Tamanho aproximado de cada pedaço enviado ao cliente na exportação
+EXPORT_BUFFER_CHARS = 64 * 1024
+
+
+class ImportFormatError(ValueError):
+    """Registro inválido no arquivo importado; 'line' é a linha onde o erro foi encontrado."""
+
+    def __init__(self, line, message):
+        super().__init__(f'linha {line}: {message}')
+        self.line = line
+
+
+def export_rows(author_id):
+    """Gera as linhas de EXPORT_SQL lidas sem buffer, EXPORT_FETCH_SIZE por vez."""
+    fetch_size = current_app.config['EXPORT_FETCH_SIZE']
+    with streaming_cursor(shard=shard_for(author_id)) as cursor:
+        cursor.execute(EXPORT_SQL, (author_id,))
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def to_ndjson(rows):
+    """
+    Um objeto JSON por linha: {"type": "tasklist", ...} seguido pelos
+    {"type": "task", ...} da tasklist.
+    """
+    current = None
+    for tasklist_id, title, body, created, task_id, task_body, completed, task_created in rows:
+        if tasklist_id != current:
+            current = tasklist_id
+            yield json.dumps(dict(
+                type='tasklist', id=tasklist_id, title=title, body=body, created=_isoformat(created),
+            )) + '\n'
+        if task_id is not None:
+            yield json.dumps(dict(
+                type='task', id=task_id, tasklist_id=tasklist_id, body=task_body,
+                completed=bool(completed), created=_isoformat(task_created),
+            )) + '\n'
+
+
+def to_csv(rows):
+    """CSV com cabeçalho e as colunas de CSV_COLUMNS."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for tasklist_id, title, body, created, task_id, task_body, completed, task_created in rows:
+        writer.writerow([
+            tasklist_id, title, body, _isoformat(created), task_id, task_body,
+            None if completed is None else int(completed), _isoformat(task_created),
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _buffered(chunks, size=EXPORT_BUFFER_CHARS):
+    """Junta pedaços pequenos em blocos de ~size caracteres, para não enviar uma linha por vez."""
+    parts, length = [], 0
+    for chunk in chunks:
+        parts.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts)
+
+
+EXPORT_FORMATS = {
+    'ndjson': (to_ndjson, 'application/x-ndjson'),
+    'csv': (to_csv, 'text/csv'),
+}
+
+
+def parse_ndjson(lines):
+    """
+    Lê registros gerados por to_ndjson(). Gera (linha, 'tasklist', (title, body))
+    e (linha, 'task', (body, completed)); ids e datas são ignorados.
+    """
+    number = 0
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ImportFormatError(number, 'JSON inválido.')
+            kind = record.get('type') if isinstance(record, dict) else None
+            if kind == 'tasklist':
+                yield number, kind, (_title(number, record.get('title')), str(record.get('body') or ''))
+            elif kind == 'task':
+                yield number, kind, (_task_body(number, record.get('body')), bool(record.get('completed')))
+            else:
+                raise ImportFormatError(number, "o campo 'type' deve ser 'tasklist' ou 'task'.")
+    except UnicodeDecodeError:
+        raise ImportFormatError(number + 1, 'o arquivo deve estar em UTF-8.')
+
+
+def parse_csv(lines):
+    """
+    Lê linhas no formato de to_csv(). Linhas consecutivas com o mesmo
+    tasklist_id pertencem à mesma tasklist; ids e datas são ignorados.
+    """
+    reader = csv.DictReader(lines)
+    try:
+        missing = {'tasklist_id', 'tasklist_title', 'task_body'} - set(reader.fieldnames or ())
+        if missing:
+            raise ImportFormatError(1, f"colunas ausentes: {', '.join(sorted(missing))}.")
+        current = None
+        for row in reader:
+            number = reader.line_num
+            if row['tasklist_id'] != current:
+                current = row['tasklist_id']
+                yield number, 'tasklist', (_title(number, row['tasklist_title']), row.get('tasklist_body') or '')
+            if row['task_body']:
+                completed = (row.get('task_completed') or '').strip().lower() in ('1', 'true')
+                yield number, 'task', (row['task_body'], completed)
+    except UnicodeDecodeError:
+        raise ImportFormatError(reader.line_num + 1, 'o arquivo deve estar em UTF-8.')
+    except csv.Error as e:
+        raise ImportFormatError(reader.line_num, f'CSV inválido ({e}).')
+
+
+def _title(line, title):
+    if not title or not isinstance(title, str):
+        raise ImportFormatError(line, 'a tasklist precisa de um título.')
+    if len(title) > TITLE_MAX_LENGTH:
+        raise ImportFormatError(line, f'título com mais de {TITLE_MAX_LENGTH} caracteres.')
+    return title
+
+
+def _task_body(line, body):
+    if not body or not isinstance(body, str):
+        raise ImportFormatError(line, 'a tarefa precisa de uma descrição.')
+    return body
+
+
+PARSERS = {'ndjson': parse_ndjson, 'csv': parse_csv}
+
+
+class Importer:
+    """
+    Grava os registros de um parser (parse_ndjson/parse_csv) para um autor.
+
+    Os registros são lidos IMPORT_CHUNK_SIZE por vez e cada bloco é gravado
+    numa transação própria, com executemany para as tarefas; a memória usada
+    não depende do tamanho do arquivo. Se um registro for inválido, os blocos
+    anteriores continuam gravados e tasklists/tasks contam o que foi importado.
+    """
+
+    def __init__(self, author_id, chunk_size):
+        self.author_id = author_id
+        self.chunk_size = chunk_size
+        self.tasklists = 0
+        self.tasks = 0
+        self._tasklist_id = None # Tasklist que recebe as próximas tarefas
+
+    def run(self, records):
+        records = iter(records)
+        try:
+            while True:
+                chunk = list(itertools.islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                # Repetida inteira em caso de deadlock, por isso não altera self
+                tasklist_id, tasklists, tasks = run_transaction(self._write, chunk)
+                self._tasklist_id = tasklist_id
+                self.tasklists += tasklists
+                self.tasks += tasks
+        finally:
+            # Também quando um registro inválido interrompe a importação: as
+            # tasklists dos blocos anteriores já estão gravadas
+            if self.tasklists:
+                invalidate_pages('index-head')
+
+    def _write(self, chunk):
+        db_cursor = shard_db(self.author_id)
+        tasklist_id, tasklists, tasks, rows = self._tasklist_id, 0, 0, []
+
+        def flush():
+            if rows:
+                # Bloqueia primeiro a tasklist, como as demais alterações (ver task.create_tasks)
+                touch_tasklist(
+                    tasklist_id, tasks=len(rows), completed=sum(row[2] for row in rows),
+                    author_id=self.author_id,
+                )
+                # Tarefas importadas entram no fim da tasklist, na ordem do arquivo
+                positions = append_positions(shard_for(self.author_id), tasklist_id, len(rows))
+                db_cursor.executemany(
+                    'INSERT INTO task (tasklist_id, body, completed, position) VALUES (%s, %s, %s, %s)',
+                    [(*row, position) for row, position in zip(rows, positions)]
+                )
+                rows.clear()
+
+        for line, kind, fields in chunk:
+            if kind == 'tasklist':
+                flush()
+                db_cursor.execute(
+                    'INSERT INTO tasklist (title, body, author_id) VALUES (%s, %s, %s)',
+                    (*fields, self.author_id)
+                )
+                tasklist_id = db_cursor.lastrowid
+                tasklists += 1
+            else:
+                if tasklist_id is None:
+                    raise ImportFormatError(line, 'tarefa antes de qualquer tasklist.')
+                rows.append((tasklist_id, *fields))
+                tasks += 1
+        flush()
+        return tasklist_id, tasklists, tasks
+
+
+def _format_from(filename, default='ndjson'):
+    """Formato pelo parâmetro 'format' ou pela extensão do arquivo."""
+    name = (filename or '').lower()
+    return 'csv' if name.endswith('.csv') else 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else default
+
+
+@bp.route('/')
+@login_required
+def index():
+    return render_template('bulk.html')
+
+
+@bp.route('/export')
+@login_required
+def export():
+    """
+    Exporta todas as tasklists e tarefas do usuário em NDJSON (padrão) ou CSV.
+    A resposta é enviada em streaming, conforme as linhas chegam do banco.
+    """
+    format = request.args.get('format', 'ndjson')
+    if format not in EXPORT_FORMATS:
+        abort(400, f"Formato desconhecido: {format}.")
+    serialize, mimetype = EXPORT_FORMATS[format]
+
+    chunks = _buffered(serialize(export_rows(g.user['id'])))
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=tasklists.{format}',
+    })
+
+
+@bp.route('/import', methods=('POST',))
+@login_required
+def import_():
+    """Importa um arquivo NDJSON ou CSV (campo 'file') enviado pelo formulário."""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        flash('Selecione um arquivo para importar.')
+        return redirect(url_for('bulk.index'))
+
+    format = request.form.get('format') or _format_from(upload.filename)
+    if format not in PARSERS:
+        abort(400, f"Formato desconhecido: {format}.")
+
+    # O upload já está num arquivo temporário; é lido e decodificado linha a linha
+    lines = codecs.iterdecode(upload.stream, 'utf-8-sig')
+    importer = Importer(g.user['id'], current_app.config['IMPORT_CHUNK_SIZE'])
+    try:
+        importer.run(PARSERS[format](lines))
+    except ImportFormatError as e:
+        flash(
+            f'Importação interrompida na {e} Foram importadas {importer.tasklists}'
+            f' tasklists e {importer.tasks} tarefas antes do erro.'
+        )
+        return redirect(url_for('bulk.index'))
+
+    flash(f'{importer.tasklists} tasklists e {importer.tasks} tarefas importadas.')
+    return redirect(url_for('tasklist.index'))
+
+
+@bp.cli.command('import-tasks')
+@click.argument('username')
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', type=click.Choice(sorted(PARSERS)),
+              help='Formato do arquivo (padrão: pela extensão, ou ndjson).')
+@click.option('--chunk-size', type=int, help='Registros por transação (padrão: IMPORT_CHUNK_SIZE).')
+def import_tasks_command(username, file, format, chunk_size):
+    """Importa tasklists e tarefas de FILE (NDJSON ou CSV; '-' para stdin) para USERNAME."""
+    db_cursor = get_db()
+    db_cursor.execute('SELECT id FROM user WHERE username = %s AND deleted_at IS NULL', (username,))
+    row = db_cursor.fetchone()
+    if row is None:
+        raise click.ClickException(f'Usuário {username} não encontrado.')
+
+    format = format or _format_from(file.name)
+    importer = Importer(row[0], chunk_size or current_app.config['IMPORT_CHUNK_SIZE'])
+    try:
+        importer.run(PARSERS[format](codecs.iterdecode(file, 'utf-8-sig')))
+    except ImportFormatError as e:
+        raise click.ClickException(
+            f'{e} ({importer.tasklists} tasklists e {importer.tasks} tarefas importadas antes do erro)'
+        )
+    click.echo(f'{importer.tasklists} tasklists e {importer.tasks} tarefas importadas.')
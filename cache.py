@@ -0,0 +1,314 @@
+from collections import OrderedDict
+import json
+import threading
+import time
+import uuid
+
+from flask import current_app, g
+
+
+class LRUCache:
+    """
+    Cache em memória do processo, com expiração (TTL) e limite de itens (LRU).
+
+    Thread-safe. Quando o limite é atingido, o item usado há mais tempo é
+    descartado. Mantém contadores de acertos, falhas e descartes.
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict() # chave -> (valor, expira_em)
+        self._lock = threading.Lock()
+        self.metrics = dict(hits=0, misses=0, evictions=0)
+
+    def get(self, key):
+        """Retorna o valor da chave, ou None se ausente ou expirada."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] > time.monotonic():
+                self._items.move_to_end(key)
+                self.metrics['hits'] += 1
+                return item[0]
+            if item is not None:
+                del self._items[key]
+            self.metrics['misses'] += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Armazena o valor, descartando os itens menos usados se necessário."""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.metrics['evictions'] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def status(self):
+        with self._lock:
+            return dict(self.metrics, size=len(self._items), max_size=self.max_size)
+
+
+class LocalBackend:
+    """
+    Substituto local para um cache compartilhado (Redis, memcached...).
+
+    Implementa a mesma interface mínima esperada de um backend compartilhado:
+    get(chave) -> str | None, set(chave, valor, ttl) e delete(chave).
+    Útil em testes e em instalações de um único processo.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= time.monotonic():
+                self._items.pop(key, None)
+                return None
+            return item[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class TieredCache:
+    """
+    Cache em dois níveis: LRUCache local na frente de um backend compartilhado opcional.
+
+    Os valores precisam ser serializáveis em JSON, pois é assim que são gravados
+    no backend compartilhado. Invalidações removem a chave dos dois níveis; as
+    cópias locais de outros processos expiram pelo TTL local, que por isso deve
+    ser curto.
+    """
+
+    def __init__(self, prefix, max_size=1000, ttl=60, backend=None, shared_ttl=None):
+        self.prefix = prefix
+        self.local = LRUCache(max_size=max_size, ttl=ttl)
+        self.backend = backend
+        self.shared_ttl = ttl if shared_ttl is None else shared_ttl
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.backend is not None:
+            raw = self.backend.get(f'{self.prefix}:{key}')
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.backend is not None:
+            self.backend.set(f'{self.prefix}:{key}', json.dumps(value), self.shared_ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.backend is not None:
+            self.backend.delete(f'{self.prefix}:{key}')
+
+    def status(self):
+        return self.local.status()
+
+
+class FragmentCache:
+    """
+    Cache de fragmentos HTML renderizados, limitado pelo total de caracteres
+    e com validade de 'ttl' segundos.
+
+    Cada fragmento é guardado com um conjunto de tags (ex.: 'tasklist:42') e
+    invalidate(tag) remove todos os fragmentos marcados com ela. Para não
+    guardar um fragmento renderizado com dados que foram alterados durante a
+    renderização, get_or_render() descarta o resultado se alguma das suas tags
+    foi invalidada depois que a renderização começou.
+
+    Os fragmentos ficam no processo. Com vários processos (workers, comandos
+    do CLI), as invalidações chegam aos outros pelo backend compartilhado
+    opcional (get/set/delete, ver LocalBackend): invalidate() grava ali um
+    token novo para cada tag, e um fragmento só é entregue se os tokens das
+    suas tags ainda são os lidos quando ele foi guardado. Sem o backend, um
+    processo só vê as alterações dos outros quando o fragmento expira.
+    """
+
+    def __init__(self, max_chars=8_000_000, ttl=30, backend=None):
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.backend = backend
+        self._items = OrderedDict() # chave -> (html, tags, expira_em, tokens)
+        self._by_tag = {} # tag -> conjunto de chaves
+        self._chars = 0
+        self._clock = 0 # incrementado a cada invalidação
+        self._invalidated = {} # tag -> valor de _clock na última invalidação
+        self._floor = 0 # renderizações iniciadas antes disso são sempre descartadas
+        self._lock = threading.Lock()
+        self.metrics = dict(hits=0, misses=0, evictions=0, invalidations=0, discarded=0)
+
+    def _tokens(self, tags):
+        # Tokens atuais das tags no backend compartilhado (None: nunca invalidada ou expirada)
+        if self.backend is None:
+            return None
+        return tuple(self.backend.get(f'page-tag:{tag}') for tag in tags)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[2] <= time.monotonic():
+                self._remove(key)
+                item = None
+            if item is None:
+                self.metrics['misses'] += 1
+                return None
+            html, tags, _, tokens = item
+
+        if self._tokens(tags) != tokens:
+            # Invalidada por outro processo
+            with self._lock:
+                if self._items.get(key) is item:
+                    self._remove(key)
+                self.metrics['misses'] += 1
+            return None
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+            self.metrics['hits'] += 1
+        return html
+
+    def get_or_render(self, key, render):
+        """
+        Retorna o fragmento da chave; se ausente, chama render(), que deve
+        retornar (html, tags), e guarda o resultado.
+        """
+        html = self.get(key)
+        if html is None:
+            started = self._clock
+            html, tags = render()
+            # Tokens lidos logo depois da renderização: uma invalidação remota
+            # entre a leitura dos dados e este ponto só dura até o fragmento expirar
+            tags = tuple(sorted(tags))
+            self._store(key, html, tags, started, self._tokens(tags))
+        return html
+
+    def _store(self, key, html, tags, started, tokens):
+        with self._lock:
+            if started < self._floor or any(
+                self._invalidated.get(tag, -1) > started for tag in tags
+            ):
+                self.metrics['discarded'] += 1
+                return
+            if len(html) > self.max_chars:
+                return
+            self._remove(key)
+            self._items[key] = (html, tags, time.monotonic() + self.ttl, tokens)
+            self._chars += len(html)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while self._chars > self.max_chars:
+                self._remove(next(iter(self._items)))
+                self.metrics['evictions'] += 1
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        self._chars -= len(item[0])
+        for tag in item[1]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, *tags):
+        """Remove todos os fragmentos marcados com alguma das tags."""
+        with self._lock:
+            self._clock += 1
+            for tag in tags:
+                self._invalidated[tag] = self._clock
+                for key in list(self._by_tag.get(tag, ())):
+                    self._remove(key)
+                self.metrics['invalidations'] += 1
+            if len(self._invalidated) > 10000:
+                # Esquece as invalidações antigas; renderizações em andamento são descartadas
+                self._invalidated.clear()
+                self._floor = self._clock
+
+        if self.backend is not None:
+            # Basta o token durar o TTL dos fragmentos: os guardados antes dele já expiraram
+            token = uuid.uuid4().hex
+            for tag in tags:
+                self.backend.set(f'page-tag:{tag}', token, self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._by_tag.clear()
+            self._chars = 0
+
+    def status(self):
+        with self._lock:
+            return dict(self.metrics, size=len(self._items), chars=self._chars,
+                        max_chars=self.max_chars)
+
+
+def get_page_cache():
+    """Cache de fragmentos das páginas deste app, ou None se PAGE_CACHE_MAX_CHARS for 0 (padrão)."""
+    return current_app.extensions.get('page_cache')
+
+
+def invalidate_pages(*tags):
+    """
+    Agenda a invalidação dos fragmentos marcados com as tags.
+
+    A invalidação acontece no fim da requisição, depois do commit: invalidar
+    antes permitiria que outra requisição guardasse de novo os dados antigos.
+    """
+    if get_page_cache() is not None:
+        g.setdefault('page_cache_tags', set()).update(tags)
+
+
+def invalidate_now(*tags):
+    """
+    Invalida os fragmentos já, para código fora de requisições (comandos do CLI),
+    que deve chamá-la depois do commit.
+    """
+    page_cache = get_page_cache()
+    if page_cache is not None and tags:
+        page_cache.invalidate(*tags)
+
+
+def flush_invalidations(e=None):
+    """Aplica agora as invalidações agendadas (já depois do commit)."""
+    tags = g.pop('page_cache_tags', None)
+    if tags:
+        get_page_cache().invalidate(*tags)
+
+
+def init_app(app):
+    """Cria o cache de fragmentos do app e registra a invalidação no fim das requisições."""
+    config = app.config
+    if config['PAGE_CACHE_MAX_CHARS']:
+        app.extensions['page_cache'] = FragmentCache(
+            config['PAGE_CACHE_MAX_CHARS'], ttl=config['PAGE_CACHE_TTL'],
+            backend=config['PAGE_CACHE_BACKEND'],
+        )
+        app.teardown_appcontext(flush_invalidations)
+        if config['STREAM_TEMPLATES']:
+            # O índice em cache é um fragmento pronto; não há o que enviar em partes
+            app.logger.warning('STREAM_TEMPLATES não tem efeito com o cache de páginas (PAGE_CACHE_MAX_CHARS).')
@@ -1,50 +1,737 @@
-from flask import current_app, g
-from flask_mysqldb import MySQL
-import MySQLdb.cursors
+from collections import deque
+from contextlib import contextmanager
+import functools
+import itertools
+import os
+import random
+import re # Importa re para dividir os scripts SQL
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request, session
 import click # Importa click para o comando CLI
-import re # Importa re para dividir o schema.sql
+from werkzeug.exceptions import ServiceUnavailable
+
+from .cache import LRUCache
+from .instrument import InstrumentedCursor
+from .sqlite import SQLiteBackend
+
+# Diretório (relativo ao pacote) com as migrações numeradas do esquema.
+# Arquivos de migração: '<versão>_<nome>.sql', ex.: 0002_hot_path_indexes.sql
+MIGRATIONS_DIR = 'migrations'
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite de checkout."""
+
+
+class ConnectionPool:
+    """
+    Pool de conexões limitado e thread-safe.
+
+    Mantém até max_size conexões abertas (min_size delas abertas desde o início).
+    Quando todas estão em uso, acquire() espera até 'timeout' segundos por uma
+    devolução antes de levantar PoolTimeout. Conexões mais velhas que
+    'max_lifetime' são descartadas e as ociosas há mais de 'ping_idle' segundos
+    recebem um ping antes de serem entregues, sendo recriadas se estiverem mortas
+    (o ping falha com uma das exceções em 'ping_errors').
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0,
+                 max_lifetime=3600, ping_idle=30, ping_errors=(Exception,)):
+        self._connect = connect
+        self.ping_errors = ping_errors
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_idle = ping_idle
+
+        self._lock = threading.Condition()
+        self._idle = deque() # (conexão, criada_em, devolvida_em)
+        self._born = {} # id(conexão) -> criada_em, para as conexões em uso
+        self._size = 0 # conexões abertas, ociosas ou em uso
+        self.metrics = dict(
+            in_use=0, checkouts=0, waits=0, timeouts=0, creations=0,
+            reconnects=0, expired=0,
+        )
+
+        for _ in range(min_size):
+            self._size += 1
+            self._idle.append((self._create(), time.monotonic(), time.monotonic()))
+
+    def _count(self, metric):
+        with self._lock:
+            self.metrics[metric] += 1
+
+    def _create(self):
+        conn = self._connect()
+        self._count('creations')
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Retira uma conexão do pool, abrindo uma nova se houver espaço."""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._lock:
+            while True:
+                if self._idle:
+                    # LIFO: a conexão usada mais recentemente tem menos chance de estar morta
+                    conn, born, returned = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                if not waited:
+                    waited = True
+                    self.metrics['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'Nenhuma conexão livre em {self.timeout}s (max_size={self.max_size}).'
+                    )
+                self._lock.wait(remaining)
+
+        try:
+            now = time.monotonic()
+            if conn is None:
+                conn, born = self._create(), now
+            elif self.max_lifetime is not None and now - born > self.max_lifetime:
+                self._count('expired')
+                self._discard(conn)
+                conn, born = self._create(), now
+            elif self.ping_idle is not None and now - returned > self.ping_idle:
+                try:
+                    conn.ping()
+                except self.ping_errors:
+                    self._count('reconnects')
+                    self._discard(conn)
+                    conn, born = self._create(), now
+        except Exception:
+            # Falhou ao abrir a conexão: libera a vaga reservada
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._born[id(conn)] = born
+            self.metrics['in_use'] += 1
+            self.metrics['checkouts'] += 1
+        return conn
+
+    def release(self, conn):
+        """Devolve ao pool uma conexão obtida com acquire()."""
+        try:
+            # Descarta qualquer transação deixada aberta pela requisição
+            conn.rollback()
+            reusable = True
+        except Exception:
+            reusable = False
+
+        with self._lock:
+            born = self._born.pop(id(conn))
+            self.metrics['in_use'] -= 1
+            if reusable:
+                self._idle.append((conn, born, time.monotonic()))
+            else:
+                self._size -= 1
+            self._lock.notify()
+
+        if not reusable:
+            self._discard(conn)
+
+    def status(self):
+        """Retorna o tamanho atual do pool e suas métricas."""
+        with self._lock:
+            return dict(self.metrics, size=self._size, idle=len(self._idle),
+                        max_size=self.max_size)
+
+
+class ReplicaSet:
+    """
+    Escolhe réplicas de leitura em rodízio, pulando por 'retry_after' segundos
+    as que falharam (conexão recusada ou pool esgotado).
+    """
+
+    def __init__(self, size, retry_after=30):
+        self.size = size
+        self.retry_after = retry_after
+        self._down_until = [0.0] * size
+        self._next = itertools.count()
+        self.metrics = dict(reads=0, failures=0, fallbacks=0)
+
+    def candidates(self):
+        """Índices das réplicas saudáveis, começando pela próxima do rodízio."""
+        start, now = next(self._next), time.monotonic()
+        order = [(start + i) % self.size for i in range(self.size)]
+        return [i for i in order if self._down_until[i] <= now]
+
+    def mark_down(self, index):
+        self._down_until[index] = time.monotonic() + self.retry_after
+        self.metrics['failures'] += 1
+
+    def status(self):
+        now = time.monotonic()
+        return dict(self.metrics, healthy=sum(1 for t in self._down_until if t <= now),
+                    size=self.size)
+
+
+class ShardMoving(ServiceUnavailable):
+    """Os dados do usuário estão sendo movidos de shard; escritas esperam (503)."""
+
+    description = 'Os dados desta conta estão sendo movidos. Tente de novo em alguns segundos.'
+
+
+class ShardRouter:
+    """
+    Diretório author_id -> shard, lido da tabela user_shard do banco principal
+    e guardado num LRU por DB_SHARD_CACHE_TTL segundos.
+
+    O shard 0 é o banco principal (MYSQL_*), que guarda também os usuários e o
+    diretório; os demais vêm de DB_SHARDS. Usuários sem linha no diretório
+    ficam no shard 0, então um app sem DB_SHARDS nunca consulta a tabela.
+    """
+
+    def __init__(self, count, ttl, id_stride):
+        self.count = count
+        self.id_stride = id_stride
+        self._cache = LRUCache(max_size=100_000, ttl=ttl)
+
+    def lookup(self, author_id):
+        """(shard, moving) do usuário; moving indica uma migração em andamento."""
+        if self.count == 1:
+            return 0, False
+        entry = self._cache.get(author_id)
+        if entry is None:
+            # Conexão própria, fora de g: não conta como uso do primário na requisição
+            pool = database.pool
+            conn = pool.acquire()
+            try:
+                cursor = get_backend().cursor(conn)
+                cursor.execute(
+                    'SELECT shard, moving FROM user_shard WHERE user_id = %s', (author_id,)
+                )
+                row = cursor.fetchone()
+                cursor.close()
+            finally:
+                pool.release(conn)
+            entry = (row[0], bool(row[1])) if row else (0, False)
+            self._cache.set(author_id, entry)
+        return entry
+
+    def assign(self, user_id):
+        """
+        Shard de um usuário novo, em rodízio pela sequência dos ids. Os ids
+        gerados no banco principal avançam de id_stride em id_stride (ver
+        MySQLBackend.create_pool), então o rodízio usa o quociente, e não o id.
+        """
+        return user_id // self.id_stride % self.count
+
+    def forget(self, author_id):
+        self._cache.delete(author_id)
+
 
-# Declaração do objeto MySQL. Ele será inicializado em init_app.
-mysql_db = MySQL()
+# Erros do MySQL que justificam repetir a transação inteira
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+RETRYABLE_ERRORS = {ER_LOCK_DEADLOCK: 'deadlocks', ER_LOCK_WAIT_TIMEOUT: 'lock_timeouts'}
 
-def get_db():
+
+class MySQLBackend:
     """
-    Obtém um cursor do MySQL para a conexão atual.
+    Backend MySQL (DB_BACKEND='mysql'), com o MySQLdb.
+
+    Um backend é qualquer objeto com esta interface, escolhido em DB_BACKEND
+    (ver sqlite.SQLiteBackend):
+
+    - name e migrations_dir: nome do dialeto e diretório das suas migrações;
+    - single_node: True se não aceita réplicas nem shards;
+    - IntegrityError e OperationalError: exceções do driver;
+    - create_pool(config, shard): pool com acquire/release/status;
+    - cursor(conn) e streaming_cursor(conn): cursores de tuplas que aceitam o
+      SQL das views (placeholders %s e %(nome)s, FOR UPDATE);
+    - retry_metric(erro): 'deadlocks' ou 'lock_timeouts' se vale repetir a
+      transação (ver run_transaction), senão None;
+    - split_sql(script): comandos de um script de migração.
+    """
+
+    name = 'mysql'
+    migrations_dir = MIGRATIONS_DIR
+    single_node = False
+
+    def __init__(self):
+        # Importado só aqui: instalações com SQLite não precisam do mysqlclient
+        import MySQLdb
+        import MySQLdb.cursors
+        self.driver = MySQLdb
+        self.IntegrityError = MySQLdb.IntegrityError
+        self.OperationalError = MySQLdb.OperationalError
+
+    def create_pool(self, config, shard=0):
+        options = {}
+        if config['DB_SHARDS']:
+            # Ids intercalados entre os shards (shard n gera n+1, n+1+stride, ...),
+            # para que uma tasklist mantenha o id ao mudar de shard
+            options['init_command'] = (
+                f"SET SESSION auto_increment_increment = {config['DB_SHARD_ID_STRIDE']},"
+                f' auto_increment_offset = {shard + 1}'
+            )
+
+        def connect():
+            return self.driver.connect(
+                host=config['MYSQL_HOST'],
+                port=config['MYSQL_PORT'],
+                user=config['MYSQL_USER'],
+                password=config['MYSQL_PASSWORD'],
+                database=config['MYSQL_DB'],
+                charset=config['MYSQL_CHARSET'],
+                connect_timeout=config['MYSQL_CONNECT_TIMEOUT'],
+                **options,
+            )
+
+        return ConnectionPool(
+            connect,
+            min_size=config['DB_POOL_MIN_SIZE'],
+            max_size=config['DB_POOL_MAX_SIZE'],
+            timeout=config['DB_POOL_TIMEOUT'],
+            max_lifetime=config['DB_POOL_MAX_LIFETIME'],
+            ping_idle=config['DB_POOL_PING_IDLE'],
+            ping_errors=self.OperationalError,
+        )
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def streaming_cursor(self, conn):
+        return conn.cursor(self.driver.cursors.SSCursor)
+
+    def retry_metric(self, error):
+        return RETRYABLE_ERRORS.get(error.args[0])
+
+    def split_sql(self, script):
+        return split_sql(script)
+
+
+# Backends aceitos por nome em DB_BACKEND
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
+
+
+class Database:
+    """
+    Integração dos pools de conexões do backend (DB_BACKEND) com o Flask.
+
+    Há um pool para o primário (MYSQL_* ou SQLITE_*), um para cada réplica de
+    leitura em MYSQL_REPLICAS e um para cada shard em DB_SHARDS, listas de
+    dicionários que sobrescrevem as chaves do primário (ex.: [{'MYSQL_HOST': 'replica1'}]).
+
+    Cada processo cria os seus pools no primeiro uso (e não em init_app), para que
+    servidores que fazem fork dos workers não compartilhem sockets.
+    """
+
+    def init_app(self, app):
+        backend = app.config['DB_BACKEND']
+        if isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise RuntimeError(f'DB_BACKEND desconhecido: {backend!r}.')
+            backend = BACKENDS[backend]()
+        if backend.single_node and (app.config['MYSQL_REPLICAS'] or app.config['DB_SHARDS']):
+            raise RuntimeError(f'O backend {backend.name} não aceita MYSQL_REPLICAS nem DB_SHARDS.')
+        app.extensions['db_backend'] = backend
+        app.extensions['db_pools'] = {}
+        app.extensions['db_pool_lock'] = threading.Lock()
+        app.extensions['db_transactions'] = dict(
+            commits=0, rollbacks=0, retries=0, deadlocks=0, lock_timeouts=0, failures=0,
+        )
+        app.extensions['db_replicas'] = ReplicaSet(
+            len(app.config['MYSQL_REPLICAS']), app.config['DB_REPLICA_RETRY_AFTER']
+        )
+        if len(app.config['DB_SHARDS']) >= app.config['DB_SHARD_ID_STRIDE']:
+            raise RuntimeError('DB_SHARD_ID_STRIDE precisa ser maior que o número de shards.')
+        app.extensions['db_shard_router'] = ShardRouter(
+            len(app.config['DB_SHARDS']) + 1, app.config['DB_SHARD_CACHE_TTL'],
+            app.config['DB_SHARD_ID_STRIDE'],
+        )
+
+    def get_pool(self, name='primary'):
+        """Pool 'primary', 'replica<n>' ou 'shard<n>' deste app, criado no primeiro uso."""
+        app = current_app._get_current_object()
+        pools = app.extensions['db_pools']
+        if name not in pools:
+            with app.extensions['db_pool_lock']:
+                if name not in pools:
+                    config, shard = dict(app.config), 0
+                    if name.startswith('replica'):
+                        config.update(app.config['MYSQL_REPLICAS'][int(name[len('replica'):])])
+                    elif name.startswith('shard'):
+                        shard = int(name[len('shard'):])
+                        config.update(app.config['DB_SHARDS'][shard - 1])
+                    pools[name] = app.extensions['db_backend'].create_pool(config, shard)
+        return pools[name]
+
+    @property
+    def pool(self):
+        return self.get_pool('primary')
+
+    @property
+    def connection(self):
+        """Conexão retirada do pool do primário para o contexto atual (uma por requisição)."""
+        if 'db_conn' not in g:
+            g.db_conn = self.pool.acquire()
+        return g.db_conn
+
+    def read_connection(self):
+        """
+        Conexão de uma réplica saudável para o contexto atual, ou None se
+        nenhuma estiver disponível (o chamador então usa o primário).
+        """
+        if 'db_read_conn' not in g:
+            replicas = current_app.extensions['db_replicas']
+            for index in replicas.candidates():
+                name = f'replica{index}'
+                try:
+                    g.db_read_conn = self.get_pool(name).acquire()
+                except (get_backend().OperationalError, PoolTimeout):
+                    replicas.mark_down(index)
+                else:
+                    g.db_read_pool = name
+                    replicas.metrics['reads'] += 1
+                    break
+            else:
+                replicas.metrics['fallbacks'] += 1
+                return None
+        return g.db_read_conn
+
+
+# Declaração do objeto Database. Ele será inicializado em init_app.
+database = Database()
+
+# Métodos HTTP que não alteram dados: só eles leem das réplicas
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _make_cursor(conn):
+    # Cursor de tuplas: as views montam as linhas com os modelos de models.py
+    cursor = get_backend().cursor(conn)
+    if current_app.config['QUERY_STATS']:
+        cursor = InstrumentedCursor(cursor) # Mede cada instrução (ver instrument.py)
+    return cursor
+
+def _use_replica():
+    """
+    Decide se uma leitura pode ir para uma réplica: só em requisições que não
+    alteram dados, fora de primary_reads, se o primário ainda não foi usado na
+    requisição e se o usuário não fez nenhuma escrita nos últimos
+    DB_READ_YOUR_WRITES segundos.
+    """
+    if not current_app.config['MYSQL_REPLICAS'] or g.get('db_replica_unavailable'):
+        return False
+    if g.get('db_primary_reads'):
+        return False
+    if not has_request_context() or request.method not in SAFE_METHODS:
+        return False
+    if 'db_conn' in g:
+        return False
+    wrote_at = session.get('_db_wrote_at')
+    return wrote_at is None or time.time() - wrote_at > current_app.config['DB_READ_YOUR_WRITES']
+
+@contextmanager
+def primary_reads():
+    """
+    Dentro do bloco, as leituras com readonly=True vão ao primário.
+
+    Usado ao renderizar fragmentos para o cache de páginas (cache.py): lido de
+    uma réplica atrasada, o fragmento poderia ser guardado depois da
+    invalidação que o tornou velho e ficaria no cache até expirar.
+    """
+    previous = g.get('db_primary_reads', False)
+    g.db_primary_reads = True
+    try:
+        yield
+    finally:
+        g.db_primary_reads = previous
+
+def get_db(readonly=False, shard=0):
+    """
+    Obtém um cursor do banco (DB_BACKEND) para a conexão atual.
     O cursor é armazenado em g.db para ser reutilizado durante a requisição.
+
+    Com readonly=True a consulta pode ser atendida por uma réplica de leitura
+    (ver _use_replica e primary_reads); use só para SELECTs que toleram um
+    pequeno atraso de replicação.
+    Com shard=n > 0 o cursor é do shard n (sem réplicas); para os dados de um
+    usuário use shard_db(), que consulta o diretório.
     """
+    if shard:
+        cursors = g.setdefault('db_shard_cursors', {})
+        if shard not in cursors:
+            conns = g.setdefault('db_shard_conns', {})
+            conns[shard] = database.get_pool(f'shard{shard}').acquire()
+            cursors[shard] = _make_cursor(conns[shard])
+        return cursors[shard]
+
+    if readonly and _use_replica():
+        if 'db_read_cursor' not in g:
+            conn = database.read_connection()
+            if conn is None:
+                g.db_replica_unavailable = True # Nenhuma réplica: fica no primário
+                return get_db()
+            g.db_read_cursor = _make_cursor(conn)
+        return g.db_read_cursor
+
     if 'db_cursor' not in g:
-        # Pega a conexão do MySQL. Flask-MySQLdb gerencia o pool de conexões.
-        # Usa DictCursor para que os resultados das consultas sejam dicionários.
-        g.db_cursor = mysql_db.connection.cursor(MySQLdb.cursors.DictCursor)
+        # Pega uma conexão do pool (só na primeira vez que a requisição precisa do banco).
+        g.db_cursor = _make_cursor(database.connection)
     return g.db_cursor
 
+def get_backend():
+    """Backend do banco deste app (ver MySQLBackend)."""
+    return current_app.extensions['db_backend']
+
+def get_shard_router():
+    return current_app.extensions['db_shard_router']
+
+def shard_count():
+    """Número de shards, contando o banco principal (shard 0)."""
+    return get_shard_router().count
+
+def shard_for(author_id, write=False):
+    """
+    Shard com as tasklists e tarefas do usuário. Com write=True levanta
+    ShardMoving enquanto os dados dele estão sendo movidos (ver sharding.py).
+    """
+    shard, moving = get_shard_router().lookup(author_id)
+    if moving and write:
+        raise ShardMoving(retry_after=current_app.config['DB_SHARD_CACHE_TTL'])
+    return shard
+
+def shard_db(author_id=None, readonly=False):
+    """
+    Cursor do shard que guarda as tasklists e tarefas de author_id (padrão: o
+    usuário logado). Sem readonly, falha com 503 durante uma migração do usuário.
+    """
+    if author_id is None:
+        author_id = g.user['id']
+    return get_db(readonly, shard_for(author_id, write=not readonly))
+
+def assign_shard(user_id):
+    """Registra no diretório, na transação atual, o shard de um usuário novo."""
+    router = get_shard_router()
+    if router.count > 1:
+        get_db().execute(
+            'INSERT INTO user_shard (user_id, shard) VALUES (%s, %s)',
+            (user_id, router.assign(user_id))
+        )
+
+def shards_from(author_id):
+    """
+    Todos os shards, começando pelo de author_id: para achar pelo id um registro
+    que provavelmente é do usuário, sem consultar os outros shards à toa.
+    """
+    own = shard_for(author_id) if author_id is not None else 0
+    return [own] + [shard for shard in range(shard_count()) if shard != own]
+
+def _shard_connection(shard):
+    """Conexão do contexto atual com o shard (aberta por get_db se preciso)."""
+    get_db(shard=shard)
+    return g.db_shard_conns[shard] if shard else g.db_conn
+
+def _open_connections():
+    """Conexões de escrita usadas no contexto atual: shards primeiro, principal por último."""
+    conns = list(g.get('db_shard_conns', {}).values())
+    if 'db_conn' in g:
+        conns.append(g.db_conn)
+    return conns
+
 def close_db(e=None):
     """
-    Fecha o cursor do banco de dados ao final da requisição.
+    Fecha os cursores do banco de dados e devolve as conexões aos pools ao final da requisição.
     """
-    db_cursor = g.pop('db_cursor', None) # Pega o cursor armazenado em g
+    for cursor in g.pop('db_shard_cursors', {}).values():
+        cursor.close()
+    for shard, conn in g.pop('db_shard_conns', {}).items():
+        database.get_pool(f'shard{shard}').release(conn)
+
+    for cursor_key, conn_key in (('db_cursor', 'db_conn'), ('db_read_cursor', 'db_read_conn')):
+        db_cursor = g.pop(cursor_key, None) # Pega o cursor armazenado em g
 
-    if db_cursor is not None:
-        db_cursor.close() # Fecha o cursor, liberando os recursos
+        if db_cursor is not None:
+            db_cursor.close() # Fecha o cursor, liberando os recursos
 
-def init_db():
+        db_conn = g.pop(conn_key, None)
+        if db_conn is not None:
+            pool = 'primary' if conn_key == 'db_conn' else g.pop('db_read_pool')
+            database.get_pool(pool).release(db_conn) # Devolve a conexão ao pool
+
+def mark_recent_write(response):
     """
-    Inicializa o banco de dados executando o script SQL do schema.
-    Para MySQL, é necessário executar cada comando SQL separadamente.
+    Depois de uma requisição que usou o primário para alterar dados, as leituras
+    desse usuário ficam no primário por DB_READ_YOUR_WRITES segundos, para que
+    ele sempre veja as próprias alterações.
     """
-    cursor = get_db() # Obtém um cursor
+    if _open_connections() and request.method not in SAFE_METHODS:
+        session['_db_wrote_at'] = time.time()
+    return response
 
-    # Abre o arquivo schema.sql e lê seu conteúdo
-    with current_app.open_resource('schema.sql') as f:
-        schema_script = f.read().decode('utf8')
+def pool_status():
+    """Métricas dos pools de conexões (primário e réplicas) deste processo."""
+    status = {name: pool.status() for name, pool in current_app.extensions['db_pools'].items()}
+    if current_app.config['MYSQL_REPLICAS']:
+        status['replicas'] = current_app.extensions['db_replicas'].status()
+    return status
+
+def transaction_metrics():
+    """Contadores de transações deste processo (commits, rollbacks, repetições...)."""
+    return current_app.extensions['db_transactions']
+
+def after_commit(callback):
+    """
+    Agenda callback() para depois do commit da transação atual (ex.: invalidar
+    caches). Se a transação for desfeita, o callback é descartado.
+    """
+    g.setdefault('db_after_commit', []).append(callback)
+
+@contextmanager
+def transaction():
+    """
+    Unidade de trabalho: faz commit no primário ao final do bloco e rollback se
+    ele levantar qualquer exceção. Blocos aninhados participam da transação
+    mais externa. Só toca no banco se o bloco tiver usado o primário.
+
+    Se o bloco usou mais de um shard, cada conexão faz o seu commit, os shards
+    antes do banco principal. Não há commit em duas fases: uma falha entre os
+    commits deixa os shards já confirmados, por isso as views escrevem num
+    único shard (o do usuário) e, quando preciso, também no principal.
+    """
+    if g.get('db_in_transaction'):
+        yield
+        return
 
-    # Divide o script em comandos individuais usando ponto e vírgula como delimitador,
-    # ignorando linhas vazias ou comentários.
-    # O regex re.split(r';\s*$', ...) é usado para garantir que apenas semicolons no final da linha
-    # sejam usados como delimitadores, evitando problemas com semicolons dentro de strings ou comentários.
-    commands = [cmd.strip() for cmd in re.split(r';\s*$', schema_script, flags=re.MULTILINE) if cmd.strip()]
+    metrics = transaction_metrics()
+    g.db_in_transaction = True
+    try:
+        yield
+        conns = _open_connections()
+        for conn in conns:
+            conn.commit() # Um único commit por banco para a unidade inteira
+        if conns:
+            metrics['commits'] += 1
+    except BaseException:
+        g.pop('db_after_commit', None)
+        conns = _open_connections()
+        for conn in conns:
+            conn.rollback() # Desfaz tudo o que a unidade alterou
+        if conns:
+            metrics['rollbacks'] += 1
+        raise
+    finally:
+        g.pop('db_in_transaction', None)
 
-    for command in commands:
+    for callback in g.pop('db_after_commit', []):
+        callback()
+
+def run_transaction(fn, *args, **kwargs):
+    """
+    Executa fn(*args, **kwargs) dentro de transaction() e retorna o resultado.
+    Se falhar por deadlock ou espera de lock esgotada (ver retry_metric do
+    backend), desfaz tudo e repete fn
+    até DB_DEADLOCK_RETRIES vezes, com espera exponencial e aleatória entre as
+    tentativas. Numa requisição, as mensagens flash da tentativa falha são descartadas.
+    """
+    config, metrics, backend = current_app.config, transaction_metrics(), get_backend()
+    flashes = list(session.get('_flashes', [])) if has_request_context() else None
+    for attempt in itertools.count():
+        try:
+            with transaction():
+                return fn(*args, **kwargs)
+        except backend.OperationalError as e:
+            metric = backend.retry_metric(e)
+            if metric is None:
+                raise
+            metrics[metric] += 1
+            if attempt >= config['DB_DEADLOCK_RETRIES']:
+                metrics['failures'] += 1
+                raise
+            metrics['retries'] += 1
+            if flashes:
+                session['_flashes'] = list(flashes)
+            elif flashes is not None:
+                session.pop('_flashes', None)
+            time.sleep(config['DB_RETRY_BACKOFF'] * 2 ** attempt * random.uniform(0.5, 1.5))
+
+def transactional(view):
+    """Decorator que executa a view inteira como uma unidade de trabalho (ver run_transaction)."""
+    @functools.wraps(view)
+    def wrapped_view(*args, **kwargs):
+        return run_transaction(view, *args, **kwargs)
+
+    return wrapped_view
+
+@contextmanager
+def streaming_cursor(readonly=True, shard=0):
+    """
+    Cursor sem buffer (SSCursor no MySQL, de tuplas) numa conexão dedicada, fora de g:
+    as linhas são lidas do servidor conforme o chamador itera, com memória constante.
+
+    Enquanto houver linhas pendentes a conexão não aceita outras instruções,
+    por isso ela não é a da requisição. Com readonly=True usa uma réplica, se houver
+    (só o shard 0 tem réplicas). A conexão volta ao pool ao sair do bloco.
+    """
+    backend, pool = get_backend(), None
+    if shard:
+        pool = database.get_pool(f'shard{shard}')
+        conn = pool.acquire()
+    elif readonly:
+        replicas = current_app.extensions['db_replicas']
+        for index in replicas.candidates():
+            try:
+                pool = database.get_pool(f'replica{index}')
+                conn = pool.acquire()
+            except (backend.OperationalError, PoolTimeout):
+                replicas.mark_down(index)
+                pool = None
+            else:
+                replicas.metrics['reads'] += 1
+                break
+    if pool is None:
+        pool = database.pool
+        conn = pool.acquire()
+
+    cursor = backend.streaming_cursor(conn)
+    try:
+        yield cursor
+    finally:
+        try:
+            cursor.close() # Descarta as linhas que o chamador não leu
+        finally:
+            pool.release(conn)
+
+def split_sql(script):
+    """
+    Divide um script SQL em comandos individuais (MySQLBackend; o SQLite tem o seu).
+    Para MySQL, é necessário executar cada comando SQL separadamente.
+    """
+    # Linhas inteiras de comentário são descartadas antes da divisão.
+    # O regex garante que apenas semicolons no final da linha (opcionalmente seguidos
+    # de um comentário '--') sejam usados como delimitadores, evitando problemas com
+    # semicolons dentro de strings.
+    script = re.sub(r'^\s*--.*$', '', script, flags=re.MULTILINE)
+    commands = re.split(r';[ \t]*(?:--[^\n]*)?$', script, flags=re.MULTILINE)
+    return [cmd.strip() for cmd in commands if cmd.strip()]
+
+
+def execute_script(cursor, script):
+    """Executa cada comando de um script SQL no cursor informado."""
+    for command in get_backend().split_sql(script):
         try:
             cursor.execute(command) # Executa cada comando SQL
         except Exception as e:
@@ -52,25 +739,150 @@ def init_db():
             print(f"Erro ao executar SQL: {command}\nErro: {e}")
             raise # Re-lança a exceção para que o Flask a capture
 
-    # Confirma as alterações no banco de dados
-    mysql_db.connection.commit()
+
+def list_migrations():
+    """
+    Lista as migrações disponíveis como tuplas (versão, nome, caminho),
+    em ordem crescente de versão.
+    """
+    directory = os.path.join(current_app.root_path, get_backend().migrations_dir)
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append(
+                (int(match.group(1)), match.group(2), os.path.join(directory, filename))
+            )
+    migrations.sort()
+    return migrations
+
+
+def applied_versions(shard=0):
+    """Retorna o conjunto de versões de migração já aplicadas ao banco (ou ao shard)."""
+    cursor = get_db(shard=shard)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute('SELECT version FROM schema_version')
+    return {version for (version,) in cursor.fetchall()}
+
+
+def upgrade_db(shard=0):
+    """
+    Aplica, em ordem, as migrações ainda não aplicadas ao banco principal (ou
+    ao shard) e retorna a lista de (versão, nome) aplicados. Todos os shards
+    têm o mesmo esquema; cada backend tem as suas migrações (migrations_dir).
+
+    No MySQL os comandos DDL fazem commit implícito (e no SQLite rodam em
+    autocommit), então cada migração é
+    registrada em schema_version logo após ser executada: se uma falhar, as
+    anteriores continuam registradas e um novo 'db-upgrade' recomeça dela.
+    Nos shards além do principal, remove depois a chave estrangeira de
+    tasklist.author_id (drop_author_foreign_key).
+    """
+    cursor = get_db(shard=shard)
+    applied = applied_versions(shard)
+    done = []
+
+    for version, name, path in list_migrations():
+        if version in applied:
+            continue
+        with open(path, encoding='utf8') as f:
+            execute_script(cursor, f.read())
+        cursor.execute(
+            'INSERT INTO schema_version (version, name) VALUES (%s, %s)',
+            (version, name)
+        )
+        _shard_connection(shard).commit()
+        done.append((version, name))
+
+    if shard > 0:
+        drop_author_foreign_key(shard)
+    return done
+
+
+def drop_author_foreign_key(shard):
+    """
+    Remove, num shard além do principal, a chave estrangeira de
+    tasklist.author_id: a tabela user desses shards fica vazia. O nome da
+    chave é gerado pelo MySQL, então é lido de information_schema; sem a
+    chave (já removida), não faz nada. A remoção das tasklists de um usuário
+    excluído é feita pelo purge (purge.py), e não pelo ON DELETE CASCADE.
+    """
+    cursor = get_db(shard=shard)
+    cursor.execute(
+        'SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS'
+        ' WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        ' AND REFERENCED_TABLE_NAME = %s',
+        ('tasklist', 'user')
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE tasklist DROP FOREIGN KEY `{name}`')
+
+
+def init_db(shard=0):
+    """
+    Limpa o banco de dados (schema.sql) e recria o esquema aplicando todas as migrações.
+    """
+    cursor = get_db(shard=shard) # Obtém um cursor
+
+    # Abre o arquivo schema.sql e lê seu conteúdo
+    with current_app.open_resource('schema.sql') as f:
+        execute_script(cursor, f.read().decode('utf8'))
+    _shard_connection(shard).commit()
+
+    upgrade_db(shard)
+
+def _shard_label(shard):
+    # Prefixo das mensagens dos comandos quando há mais de um shard
+    return f'[shard {shard}] ' if shard_count() > 1 else ''
 
 @click.command('init-db')
 def init_db_command():
-    """Limpa os dados existentes e cria novas tabelas."""
-    init_db()
-    click.echo('Banco de dados inicializado.')
+    """Limpa os dados existentes e cria novas tabelas (em todos os shards)."""
+    for shard in range(shard_count()):
+        init_db(shard)
+        click.echo(f'{_shard_label(shard)}Banco de dados inicializado.')
+
+@click.command('db-upgrade')
+def db_upgrade_command():
+    """Aplica as migrações pendentes sem apagar dados (em todos os shards)."""
+    for shard in range(shard_count()):
+        done = upgrade_db(shard)
+        for version, name in done:
+            click.echo(f'{_shard_label(shard)}Aplicada {version:04d}_{name}')
+        if not done:
+            click.echo(f'{_shard_label(shard)}Banco de dados já está atualizado.')
+
+@click.command('db-status')
+def db_status_command():
+    """Mostra quais migrações já foram aplicadas e quais estão pendentes."""
+    for shard in range(shard_count()):
+        applied = applied_versions(shard)
+        for version, name, _ in list_migrations():
+            status = 'aplicada' if version in applied else 'pendente'
+            click.echo(f'{_shard_label(shard)}{version:04d}_{name}: {status}')
 
 def init_app(app):
     """
     Registra as funções de callback para a aplicação Flask.
     """
-    # Inicializa o objeto MySQL com a aplicação Flask.
-    # As configurações de conexão (MYSQL_HOST, MYSQL_USER, etc.) devem estar em app.config
-    mysql_db.init_app(app)
+    # Inicializa o objeto Database com a aplicação Flask.
+    # As configurações de conexão (DB_BACKEND, MYSQL_* ou SQLITE_*) devem estar em app.config
+    database.init_app(app)
 
-    # Garante que o cursor seja fechado automaticamente ao final de cada requisição
+    # Garante que o cursor seja fechado e a conexão devolvida ao pool ao final de cada requisição
     app.teardown_appcontext(close_db)
+    # Leituras do próprio usuário vão ao primário logo após as suas escritas
+    app.after_request(mark_recent_write)
     # Adiciona o comando 'init-db' ao CLI do Flask
     app.cli.add_command(init_db_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_status_command)
 
@@ -0,0 +1,320 @@
+from collections import OrderedDict, deque
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from flask import current_app
+
+from .cache import flush_invalidations
+from .db import after_commit
+
+# Número de eventos guardados por canal para quem reconecta (Last-Event-ID)
+HISTORY_SIZE = 100
+# Canais com histórico guardado (os menos recentes são descartados)
+MAX_CHANNELS = 10_000
+# Espera do EventSource antes de reconectar, em ms
+RECONNECT_MS = 2000
+# Conexões longas por processo sem gevent (EVENTS_MAX_STREAMS=None), quando cada uma ocupa uma thread
+THREAD_STREAMS = 8
+
+
+class TooManySubscribers(Exception):
+    """O processo já atende EVENTS_MAX_SUBSCRIBERS conexões; a requisição deve ser recusada (503)."""
+
+
+class Subscription:
+    """
+    Inscrição num canal do LocalHub. get() espera pelo próximo evento (id, data);
+    se o assinante atrasar mais que queue_size eventos, 'lagged' fica True e
+    ele deve recarregar tudo.
+    """
+
+    def __init__(self, hub, channel, queue_size):
+        self.hub = hub
+        self.channel = channel
+        self.lagged = False
+        self._queue = queue.Queue(queue_size)
+
+    def push(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.lagged = True
+
+    def get(self, timeout):
+        """Próximo evento, ou None se nada chegou em 'timeout' segundos."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class LocalHub:
+    """
+    Pub/sub dentro do processo: publish() entrega o evento a todas as inscrições
+    abertas no canal. Cada evento tem um id '<época>-<n>', crescente no processo;
+    a época muda a cada partida. Um id de outra época (de antes de reiniciar, ou
+    de outro processo) não diz o que foi perdido: a inscrição começa 'lagged'.
+
+    Qualquer objeto com a mesma interface (publish, subscribe, unsubscribe,
+    has_subscribers, last_id) pode substituí-lo em EVENTS_HUB, por exemplo um
+    que repasse os eventos por um serviço compartilhado entre processos. Com o
+    LocalHub, quem publica e quem assina precisam estar no mesmo processo: com
+    vários workers, a alteração feita em um não chega às páginas conectadas a
+    outro, nem é reenviada a quem reconecta num worker diferente (outra época).
+    """
+
+    def __init__(self, queue_size=100, max_subscribers=10_000, reader_ttl=30):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.reader_ttl = reader_ttl
+        self.epoch = f'{os.getpid():x}{int(time.time()):x}'
+        self._counter = itertools.count(1)
+        self._last = 0
+        self._subscribers = {} # canal -> set de Subscription
+        self._count = 0
+        self._history = OrderedDict() # canal -> deque de (n, data)
+        self._dropped = {} # canal -> n do último evento que saiu do histórico
+        self._evicted = 0 # n do último evento de um canal descartado inteiro
+        self._read = {} # canal -> instante da última inscrição
+        self._lock = threading.Lock()
+        self.metrics = dict(published=0, delivered=0, lagged=0)
+
+    def _event_id(self, n):
+        return f'{self.epoch}-{n}'
+
+    def last_id(self, channel=None):
+        """Id do último evento publicado; um assinante que parte dele não perde nada depois."""
+        return self._event_id(self._last)
+
+    def has_subscribers(self, channel):
+        """
+        Indica se alguém lê o canal: uma inscrição aberta ou uma feita nos
+        últimos reader_ttl segundos (polling, ou uma conexão que vai reconectar).
+        """
+        if self._subscribers.get(channel):
+            return True
+        read = self._read.get(channel)
+        return read is not None and time.monotonic() - read < self.reader_ttl
+
+    def publish(self, channel, data):
+        with self._lock:
+            n = self._last = next(self._counter)
+            event = (self._event_id(n), data)
+            history = self._history.pop(channel, None) or deque(maxlen=HISTORY_SIZE)
+            if len(history) == history.maxlen:
+                self._dropped[channel] = history[0][0]
+            history.append((n, data))
+            self._history[channel] = history # Vai para o fim: o canal mais recente
+            if len(self._history) > MAX_CHANNELS:
+                evicted, evicted_history = self._history.popitem(last=False)
+                self._evicted = max(self._evicted, evicted_history[-1][0])
+                self._dropped.pop(evicted, None)
+            subscribers = list(self._subscribers.get(channel, ()))
+            self.metrics['published'] += 1
+
+        for subscription in subscribers:
+            subscription.push(event)
+            if subscription.lagged:
+                self.metrics['lagged'] += 1
+        self.metrics['delivered'] += len(subscribers)
+
+    def subscribe(self, channel, since=None):
+        """
+        Abre uma inscrição no canal. Com 'since' (o id do último evento que o
+        cliente recebeu), os eventos publicados depois dele são entregues antes
+        dos novos; se eles já saíram do histórico ou 'since' é de outra época,
+        a inscrição começa 'lagged'.
+        """
+        subscription = Subscription(self, channel, self.queue_size)
+        since = since or None
+        if since is not None:
+            epoch, _, n = since.partition('-')
+            if epoch == self.epoch and n.isdigit():
+                since = int(n)
+            else:
+                since, subscription.lagged = None, True
+        now = time.monotonic()
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._subscribers.setdefault(channel, set()).add(subscription)
+            self._count += 1
+            if len(self._read) > MAX_CHANNELS:
+                self._read = {
+                    key: read for key, read in self._read.items() if now - read < self.reader_ttl
+                }
+            self._read[channel] = now
+
+            if since is not None:
+                history = self._history.get(channel)
+                if history is None:
+                    # Sem histórico: nada publicado, ou o canal foi descartado depois de 'since'
+                    subscription.lagged = since < self._evicted
+                elif since < self._dropped.get(channel, 0):
+                    subscription.lagged = True # Eventos perdidos além do histórico
+                else:
+                    for event_n, data in history:
+                        if event_n > since:
+                            subscription.push((self._event_id(event_n), data))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def status(self):
+        return dict(self.metrics, subscribers=self._count, channels=len(self._subscribers))
+
+
+class StreamSlots:
+    """
+    Vagas para conexões de eventos longas no processo (EVENTS_MAX_STREAMS).
+    Com workers de threads, cada conexão longa ocupa uma thread do servidor,
+    parada em Subscription.get, enquanto durar: sem um limite, as páginas de
+    detalhes abertas ocupariam todas as threads e as demais requisições
+    esperariam. Com gevent a espera só ocupa uma green thread, e o limite
+    padrão é o de inscrições do hub.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit else None
+        self._lock = threading.Lock()
+        self.metrics = dict(open=0, streams=0, polls=0)
+
+    def acquire(self):
+        """Ocupa uma vaga; False se não houver (a conexão deve virar polling)."""
+        acquired = self._slots is not None and self._slots.acquire(blocking=False)
+        with self._lock:
+            if acquired:
+                self.metrics['open'] += 1
+                self.metrics['streams'] += 1
+            else:
+                self.metrics['polls'] += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.metrics['open'] -= 1
+        self._slots.release()
+
+    def status(self):
+        with self._lock:
+            return dict(self.metrics, limit=self.limit)
+
+
+def green_threads():
+    """Indica se o processo roda com o monkey patching do gevent (ex.: gunicorn -k gevent)."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def get_stream_slots():
+    slots = current_app.extensions.get('events_stream_slots')
+    if slots is None:
+        config = current_app.config
+        limit = config['EVENTS_MAX_STREAMS']
+        if limit is None:
+            limit = config['EVENTS_MAX_SUBSCRIBERS'] if green_threads() else THREAD_STREAMS
+        slots = current_app.extensions.setdefault('events_stream_slots', StreamSlots(limit))
+    return slots
+
+
+def get_hub():
+    """Hub de eventos deste app: EVENTS_HUB, se configurado, ou um LocalHub."""
+    hub = current_app.extensions.get('events_hub')
+    if hub is None:
+        config = current_app.config
+        hub = config['EVENTS_HUB'] or LocalHub(
+            queue_size=config['EVENTS_QUEUE_SIZE'],
+            max_subscribers=config['EVENTS_MAX_SUBSCRIBERS'],
+            # Quem faz polling não fica inscrito entre as consultas
+            reader_ttl=2 * config['EVENTS_POLL_INTERVAL'] + RECONNECT_MS / 1000,
+        )
+        hub = current_app.extensions.setdefault('events_hub', hub)
+    return hub
+
+
+def tasklist_channel(tasklist_id):
+    return f'tasklist:{tasklist_id}'
+
+
+def watched(tasklist_id):
+    """
+    Indica se alguém acompanha a tasklist. Sem ninguém, as alterações publicam
+    só publish_stale, sem montar o evento completo.
+    """
+    return get_hub().has_subscribers(tasklist_channel(tasklist_id))
+
+
+def publish_stale(tasklist_id):
+    """
+    Registra no histórico que a tasklist mudou, sem o conteúdo: uma página
+    aberta antes da alteração que só se conectar depois dela recarrega, em vez
+    de perder a alteração.
+    """
+    publish(tasklist_id, dict(type='stale'))
+
+
+def publish(tasklist_id, data):
+    """
+    Publica 'data' no canal da tasklist depois do commit da transação atual;
+    se ela for desfeita, nada é publicado.
+
+    As páginas em cache são invalidadas antes: quem montar a página de detalhes
+    depois disso vê a alteração, e quem a montou antes recebe o evento.
+    """
+    hub = get_hub()
+
+    def send():
+        flush_invalidations()
+        hub.publish(tasklist_channel(tasklist_id), data)
+
+    after_commit(send)
+
+
+def stream(subscription, heartbeat, lifetime, retry=RECONNECT_MS, on_close=None):
+    """
+    Gera a resposta text/event-stream de uma inscrição: cada evento como
+    'id:'/'data:' (JSON), um comentário a cada 'heartbeat' segundos sem eventos
+    (mantém proxies e o navegador conectados) e fim após 'lifetime' segundos;
+    o EventSource reconecta sozinho depois de 'retry' ms, com o Last-Event-ID.
+
+    Com lifetime=0 só entrega os eventos já pendentes (os reenviados desde o
+    Last-Event-ID) e encerra: é o polling de quem ficou sem vaga em
+    StreamSlots. on_close é chamada ao fim do fluxo.
+    """
+    deadline = time.monotonic() + lifetime
+    try:
+        yield f'retry: {retry}\n\n'
+        while True:
+            if subscription.lagged:
+                yield f"data: {json.dumps(dict(type='reload'))}\n\n"
+                return
+            remaining = max(deadline - time.monotonic(), 0)
+            # Depois do prazo, só esvazia a fila (timeout 0) antes de encerrar
+            event = subscription.get(timeout=min(heartbeat, remaining))
+            if event is None:
+                if not remaining:
+                    return
+                yield ': keep-alive\n\n'
+                continue
+            event_id, data = event
+            yield f'id: {event_id}\ndata: {json.dumps(data)}\n\n'
+    finally:
+        subscription.close()
+        if on_close is not None:
+            on_close()
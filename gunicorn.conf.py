@@ -0,0 +1,26 @@
+"""
+Configuração do gunicorn para servir o app:
+
+    gunicorn -c <pacote>/gunicorn.conf.py '<pacote>:create_app()'
+
+Os workers são do gevent: o gunicorn aplica o monkey patching ao iniciar cada
+worker, antes de carregar o app, e cada requisição roda numa green thread.
+Uma conexão de eventos (tasklist.detail_events) esperando o próximo evento não
+ocupa uma thread do sistema, então cada worker mantém até worker_connections
+conexões abertas (ver EVENTS_MAX_STREAMS e EVENTS_MAX_SUBSCRIBERS).
+
+O mysqlclient é uma extensão em C e não cede a vez às outras green threads:
+enquanto uma consulta roda, o worker inteiro espera por ela. As consultas das
+views são curtas; para usar mais núcleos, aumente WEB_WORKERS. Com mais de um
+worker, configure um EVENTS_HUB compartilhado: o events.LocalHub só entrega os
+eventos publicados no próprio processo.
+"""
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_WORKERS', 1))
+# Conexões simultâneas por worker, contando as de eventos
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 10000))
+# Ao reiniciar, as conexões de eventos são encerradas e o navegador reconecta
+graceful_timeout = 10
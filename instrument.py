@@ -0,0 +1,172 @@
+import logging
+import random
+import re
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+
+# Instruções acima de SLOW_QUERY_MS vão para este logger (e para SLOW_QUERY_LOG, se configurado)
+slow_query_logger = logging.getLogger(__name__ + '.slow_queries')
+
+# Quantas instruções normalizadas distintas as estatísticas guardam
+MAX_STATEMENTS = 1000
+
+
+def normalize_sql(query):
+    """
+    Reduz uma instrução à sua forma genérica, para agrupar execuções iguais:
+    espaços colapsados, literais trocados por '?' e listas IN (...) de qualquer
+    tamanho unificadas.
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf8', 'replace')
+    query = re.sub(r"'(?:[^'\\]|\\.)*'", '?', query)
+    query = re.sub(r'\b\d+\b', '?', query)
+    query = re.sub(r'%(?:\(\w+\))?s', '?', query)
+    query = re.sub(r'\s+', ' ', query).strip()
+    return re.sub(r'IN \((?:\?, )*\?\)', 'IN (...)', query, flags=re.IGNORECASE)
+
+
+class InstrumentedCursor:
+    """
+    Envolve um cursor do banco medindo cada instrução executada.
+
+    As medições das requisições sorteadas (ver sample_request) ficam em
+    g.db_queries como tuplas (instrução, segundos, linhas); o resto da
+    interface é repassado ao cursor.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            record_query(query, time.perf_counter() - started, self._cursor.rowcount)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            record_query(query, time.perf_counter() - started, self._cursor.rowcount)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def record_query(query, duration, rows):
+    # Fora de requisições (comandos CLI) nada é guardado: g só seria limpo no fim do comando
+    if g.get('db_sampled'):
+        g.db_queries.append((query, duration, rows))
+
+    threshold = current_app.config['SLOW_QUERY_MS']
+    if threshold is not None and duration * 1000 >= threshold:
+        slow_query_logger.warning(
+            '%.1f ms, %s linhas, %s: %s', duration * 1000, rows,
+            request.endpoint if has_request_context() else '-', normalize_sql(query),
+        )
+
+
+class QueryStats:
+    """Totais de consultas por endpoint e por instrução normalizada, deste processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.statements = {}
+
+    def add(self, endpoint, queries):
+        total = sum(duration for _, duration, _ in queries)
+        normalized = [(normalize_sql(q), duration, rows) for q, duration, rows in queries]
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, dict(
+                requests=0, queries=0, db_ms=0.0, max_queries=0, max_db_ms=0.0,
+            ))
+            stats['requests'] += 1
+            stats['queries'] += len(queries)
+            stats['db_ms'] += total * 1000
+            stats['max_queries'] = max(stats['max_queries'], len(queries))
+            stats['max_db_ms'] = max(stats['max_db_ms'], total * 1000)
+
+            for sql, duration, rows in normalized:
+                stats = self.statements.get(sql)
+                if stats is None:
+                    if len(self.statements) >= MAX_STATEMENTS:
+                        continue
+                    stats = self.statements[sql] = dict(count=0, total_ms=0.0, max_ms=0.0, rows=0)
+                stats['count'] += 1
+                stats['total_ms'] += duration * 1000
+                stats['max_ms'] = max(stats['max_ms'], duration * 1000)
+                stats['rows'] += max(rows or 0, 0)
+
+    def snapshot(self):
+        """Cópia das estatísticas com médias por requisição, ordenadas pelo tempo total."""
+        with self._lock:
+            endpoints = {
+                name: dict(
+                    stats,
+                    queries_per_request=round(stats['queries'] / stats['requests'], 2),
+                    db_ms_per_request=round(stats['db_ms'] / stats['requests'], 3),
+                )
+                for name, stats in self.endpoints.items()
+            }
+            statements = sorted(
+                (dict(stats, sql=sql) for sql, stats in self.statements.items()),
+                key=lambda stats: stats['total_ms'], reverse=True,
+            )
+        return dict(endpoints=endpoints, statements=statements)
+
+
+def get_query_stats():
+    return current_app.extensions['query_stats']
+
+
+def sample_request():
+    """Sorteia se a requisição é medida, com probabilidade QUERY_STATS_SAMPLE_RATE."""
+    if random.random() < current_app.config['QUERY_STATS_SAMPLE_RATE']:
+        g.db_sampled = True
+        g.db_queries = []
+
+
+def shows_server_timing():
+    """O cabeçalho Server-Timing só vai em modo debug ou para usuários de ADMIN_USER_IDS."""
+    if current_app.debug:
+        return True
+    user = g.get('user')
+    return user is not None and user['id'] in current_app.config['ADMIN_USER_IDS']
+
+
+def add_server_timing(response):
+    """Soma as consultas da requisição nas estatísticas e, se permitido, no cabeçalho Server-Timing."""
+    if not g.pop('db_sampled', False):
+        return response
+    queries = g.pop('db_queries')
+    if shows_server_timing():
+        total = sum(duration for _, duration, _ in queries)
+        response.headers.add(
+            'Server-Timing', f'db;dur={total * 1000:.2f};desc="{len(queries)} queries"'
+        )
+    get_query_stats().add(request.endpoint or '-', queries)
+    return response
+
+
+def init_app(app):
+    """Ativa a instrumentação de consultas se QUERY_STATS estiver ligado."""
+    if not app.config['QUERY_STATS']:
+        return
+
+    app.extensions['query_stats'] = QueryStats()
+    app.before_request(sample_request)
+    app.after_request(add_server_timing)
+
+    if app.config['SLOW_QUERY_LOG'] and not slow_query_logger.handlers:
+        handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
@@ -0,0 +1,7 @@
+-- Índices para as consultas mais frequentes
+
+-- tasklist.index(): ORDER BY created DESC, id DESC com paginação por keyset
+CREATE INDEX idx_tasklist_created_id ON tasklist (created, id);
+
+-- tasklist.detail(): WHERE tasklist_id = ? ORDER BY created, id
+CREATE INDEX idx_task_tasklist_created_id ON task (tasklist_id, created, id);
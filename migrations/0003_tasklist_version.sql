@@ -0,0 +1,6 @@
+-- Versão de cada tasklist, incrementada a cada alteração nela ou nas suas tarefas.
+-- Usada como ETag pela API JSON (api.py).
+ALTER TABLE tasklist ADD COLUMN version INT NOT NULL DEFAULT 0;
+
+-- GET /api/v1/tasklists: WHERE author_id = ? ORDER BY created DESC, id DESC
+CREATE INDEX idx_tasklist_author_created_id ON tasklist (author_id, created, id);
@@ -0,0 +1,11 @@
+-- Contadores de tarefas por tasklist, mantidos por tasklist.touch_tasklist()
+-- na mesma transação de cada alteração. 'flask repair-task-counts' os recalcula.
+ALTER TABLE tasklist
+    ADD COLUMN task_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN completed_count INT NOT NULL DEFAULT 0;
+
+UPDATE tasklist SET
+    task_count = (SELECT COUNT(*) FROM task WHERE task.tasklist_id = tasklist.id),
+    completed_count = (
+        SELECT COUNT(*) FROM task WHERE task.tasklist_id = tasklist.id AND task.completed
+    );
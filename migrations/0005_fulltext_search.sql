@@ -0,0 +1,4 @@
+-- Índices de texto completo usados pela busca (search.py)
+ALTER TABLE tasklist ADD FULLTEXT INDEX ft_tasklist_title_body (title, body);
+
+ALTER TABLE task ADD FULLTEXT INDEX ft_task_body (body);
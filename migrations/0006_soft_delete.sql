@@ -0,0 +1,9 @@
+-- Exclusão lógica: usuários e tasklists excluídos recebem deleted_at e somem
+-- das páginas na hora; 'flask purge-deleted' (purge.py) remove as linhas
+-- depois, em lotes pequenos.
+ALTER TABLE user ADD COLUMN deleted_at TIMESTAMP NULL DEFAULT NULL;
+ALTER TABLE tasklist ADD COLUMN deleted_at TIMESTAMP NULL DEFAULT NULL;
+
+-- Fila do purge: WHERE deleted_at IS NOT NULL ORDER BY deleted_at, id
+CREATE INDEX idx_user_deleted_at ON user (deleted_at, id);
+CREATE INDEX idx_tasklist_deleted_at ON tasklist (deleted_at, id);
@@ -0,0 +1,12 @@
+-- Sharding por autor (db.ShardRouter): o diretório diz em qual shard ficam as
+-- tasklists e tarefas de cada usuário. Só o do banco principal (shard 0) é
+-- usado; usuários sem linha aqui ficam no shard 0.
+CREATE TABLE IF NOT EXISTS user_shard (
+    user_id INT PRIMARY KEY,
+    shard INT NOT NULL,
+    moving BOOLEAN NOT NULL DEFAULT FALSE -- Escritas bloqueadas durante 'flask shard-move'
+);
+
+-- Nos outros shards a tabela user fica vazia e author_id não pode ser chave
+-- estrangeira; db.upgrade_db a remove só neles (ver drop_author_foreign_key).
+-- No banco principal ela continua valendo.
@@ -0,0 +1,17 @@
+-- Ordem das tarefas definida pelo usuário (positions.py): chaves em base 62
+-- comparadas byte a byte. Mover uma tarefa grava uma chave entre as das
+-- vizinhas, alterando só a linha dela.
+ALTER TABLE task ADD COLUMN position VARCHAR(255) CHARACTER SET ascii COLLATE ascii_bin NULL;
+
+-- Tarefas existentes mantêm a ordem por criação. Os dígitos de CONV (0-9A-Z)
+-- seguem a mesma ordem de positions.DIGITS e o 'V' final evita chaves
+-- terminadas em '0'.
+UPDATE task JOIN (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY tasklist_id ORDER BY created, id) AS n FROM task
+) AS numbered ON numbered.id = task.id
+SET task.position = CONCAT(LPAD(CONV(numbered.n, 10, 36), 5, '0'), 'V');
+
+ALTER TABLE task MODIFY position VARCHAR(255) CHARACTER SET ascii COLLATE ascii_bin NOT NULL;
+
+-- Página de detalhes (ORDER BY position) e vizinhas de uma posição
+CREATE INDEX idx_task_tasklist_position ON task (tasklist_id, position);
@@ -0,0 +1,47 @@
+-- Busca separada por usuário (search.py): o índice de texto completo passa a
+-- cobrir search_tokens, o título/descrição ou o texto da tarefa com cada
+-- palavra prefixada pelo autor ('a7xcomprar', ver sqlite.author_tokens). A
+-- lista de ocorrências de uma palavra no índice fica só com as linhas do
+-- próprio usuário. Com o binlog ativo, criar triggers exige SUPER ou
+-- log_bin_trust_function_creators.
+ALTER TABLE tasklist ADD COLUMN search_tokens MEDIUMTEXT NULL;
+
+ALTER TABLE task ADD COLUMN search_tokens MEDIUMTEXT NULL;
+
+-- O prefixo entra no início de cada sequência de letras e dígitos (a expressão
+-- só casa posições, então não depende da sintaxe de referências do
+-- REGEXP_REPLACE). As tarefas usam o autor da tasklist.
+CREATE TRIGGER tasklist_search_insert BEFORE INSERT ON tasklist FOR EACH ROW
+SET NEW.search_tokens = REGEXP_REPLACE(CONCAT_WS(' ', NEW.title, NEW.body),
+    '(?<![[:alnum:]])(?=[[:alnum:]])', CONCAT('a', NEW.author_id, 'x'));
+
+CREATE TRIGGER tasklist_search_update BEFORE UPDATE ON tasklist FOR EACH ROW
+SET NEW.search_tokens = IF(
+    NEW.title <=> OLD.title AND NEW.body <=> OLD.body AND NEW.author_id <=> OLD.author_id,
+    OLD.search_tokens,
+    REGEXP_REPLACE(CONCAT_WS(' ', NEW.title, NEW.body),
+        '(?<![[:alnum:]])(?=[[:alnum:]])', CONCAT('a', NEW.author_id, 'x')));
+
+CREATE TRIGGER task_search_insert BEFORE INSERT ON task FOR EACH ROW
+SET NEW.search_tokens = REGEXP_REPLACE(NEW.body, '(?<![[:alnum:]])(?=[[:alnum:]])',
+    CONCAT('a', (SELECT author_id FROM tasklist WHERE id = NEW.tasklist_id), 'x'));
+
+CREATE TRIGGER task_search_update BEFORE UPDATE ON task FOR EACH ROW
+SET NEW.search_tokens = IF(
+    NEW.body <=> OLD.body AND NEW.tasklist_id <=> OLD.tasklist_id,
+    OLD.search_tokens,
+    REGEXP_REPLACE(NEW.body, '(?<![[:alnum:]])(?=[[:alnum:]])',
+        CONCAT('a', (SELECT author_id FROM tasklist WHERE id = NEW.tasklist_id), 'x')));
+
+-- Linhas existentes
+UPDATE tasklist
+SET search_tokens = REGEXP_REPLACE(CONCAT_WS(' ', title, body),
+    '(?<![[:alnum:]])(?=[[:alnum:]])', CONCAT('a', author_id, 'x'));
+
+UPDATE task JOIN tasklist ON task.tasklist_id = tasklist.id
+SET task.search_tokens = REGEXP_REPLACE(task.body,
+    '(?<![[:alnum:]])(?=[[:alnum:]])', CONCAT('a', tasklist.author_id, 'x'));
+
+ALTER TABLE tasklist DROP INDEX ft_tasklist_title_body, ADD FULLTEXT INDEX ft_tasklist_search (search_tokens);
+
+ALTER TABLE task DROP INDEX ft_task_body, ADD FULLTEXT INDEX ft_task_search (search_tokens);
@@ -0,0 +1,81 @@
+-- Esquema do backend SQLite (sqlite.py), equivalente às migrações 0001 a 0008
+-- do MySQL. Migrações novas entram nos dois diretórios com o mesmo número.
+
+-- AUTOINCREMENT: como no MySQL, ids de linhas removidas nunca são reutilizados
+-- (os caches e os eventos identificam tasklists e tarefas pelo id)
+CREATE TABLE IF NOT EXISTS user (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(255) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    deleted_at TIMESTAMP NULL DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tasklist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    author_id INT NOT NULL, -- Sem chave estrangeira: as tasklists são removidas pelo purge (purge.py)
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    title VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    version INT NOT NULL DEFAULT 0,
+    task_count INT NOT NULL DEFAULT 0,
+    completed_count INT NOT NULL DEFAULT 0,
+    deleted_at TIMESTAMP NULL DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS task (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tasklist_id INT NOT NULL,
+    body TEXT NOT NULL,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    position VARCHAR(255) COLLATE BINARY NOT NULL, -- Comparada byte a byte (positions.py)
+    FOREIGN KEY (tasklist_id) REFERENCES tasklist (id) ON DELETE CASCADE
+);
+
+-- Diretório de shards: o SQLite não tem shards, mas o purge mantém a tabela
+CREATE TABLE IF NOT EXISTS user_shard (
+    user_id INT PRIMARY KEY,
+    shard INT NOT NULL,
+    moving BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX idx_tasklist_created_id ON tasklist (created, id);
+CREATE INDEX idx_task_tasklist_created_id ON task (tasklist_id, created, id);
+CREATE INDEX idx_tasklist_author_created_id ON tasklist (author_id, created, id);
+CREATE INDEX idx_user_deleted_at ON user (deleted_at, id);
+CREATE INDEX idx_tasklist_deleted_at ON tasklist (deleted_at, id);
+CREATE INDEX idx_task_tasklist_position ON task (tasklist_id, position);
+
+-- Busca (search.py): índices FTS5 sobre as próprias tabelas, mantidos por
+-- triggers. As tarefas só são reindexadas quando o texto muda, e não ao
+-- concluir ou mover.
+CREATE VIRTUAL TABLE tasklist_fts USING fts5(title, body, content='tasklist', content_rowid='id');
+CREATE VIRTUAL TABLE task_fts USING fts5(body, content='task', content_rowid='id');
+
+CREATE TRIGGER tasklist_fts_insert AFTER INSERT ON tasklist BEGIN
+    INSERT INTO tasklist_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+
+CREATE TRIGGER tasklist_fts_delete AFTER DELETE ON tasklist BEGIN
+    INSERT INTO tasklist_fts (tasklist_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+END;
+
+CREATE TRIGGER tasklist_fts_update AFTER UPDATE OF title, body ON tasklist BEGIN
+    INSERT INTO tasklist_fts (tasklist_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+    INSERT INTO tasklist_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+
+CREATE TRIGGER task_fts_insert AFTER INSERT ON task BEGIN
+    INSERT INTO task_fts (rowid, body) VALUES (new.id, new.body);
+END;
+
+CREATE TRIGGER task_fts_delete AFTER DELETE ON task BEGIN
+    INSERT INTO task_fts (task_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+
+CREATE TRIGGER task_fts_update AFTER UPDATE OF body ON task BEGIN
+    INSERT INTO task_fts (task_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    INSERT INTO task_fts (rowid, body) VALUES (new.id, new.body);
+END;
@@ -0,0 +1,75 @@
+-- Busca separada por usuário (search.py), como na 0009 do MySQL: as tabelas
+-- FTS5 passam a indexar search_tokens, o texto com cada palavra prefixada pelo
+-- autor. author_tokens() é registrada em cada conexão (sqlite.py).
+ALTER TABLE tasklist ADD COLUMN search_tokens TEXT NOT NULL DEFAULT '';
+
+ALTER TABLE task ADD COLUMN search_tokens TEXT NOT NULL DEFAULT '';
+
+DROP TRIGGER tasklist_fts_insert;
+DROP TRIGGER tasklist_fts_delete;
+DROP TRIGGER tasklist_fts_update;
+DROP TRIGGER task_fts_insert;
+DROP TRIGGER task_fts_delete;
+DROP TRIGGER task_fts_update;
+DROP TABLE tasklist_fts;
+DROP TABLE task_fts;
+
+UPDATE tasklist SET search_tokens = author_tokens(author_id, title || ' ' || body);
+
+UPDATE task SET search_tokens = author_tokens(
+    (SELECT author_id FROM tasklist WHERE tasklist.id = task.tasklist_id), body);
+
+CREATE VIRTUAL TABLE tasklist_fts USING fts5(search_tokens, content='tasklist', content_rowid='id');
+
+CREATE VIRTUAL TABLE task_fts USING fts5(search_tokens, content='task', content_rowid='id');
+
+INSERT INTO tasklist_fts (tasklist_fts) VALUES ('rebuild');
+
+INSERT INTO task_fts (task_fts) VALUES ('rebuild');
+
+-- search_tokens é calculado depois do INSERT ou da mudança do texto, e só a
+-- mudança de search_tokens atualiza o índice. Linhas recém-inseridas ainda
+-- não estão no índice (search_tokens vazio), daí o WHERE do 'delete'.
+CREATE TRIGGER tasklist_tokens_insert AFTER INSERT ON tasklist BEGIN
+    UPDATE tasklist SET search_tokens = author_tokens(new.author_id, new.title || ' ' || new.body)
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER tasklist_tokens_update AFTER UPDATE OF author_id, title, body ON tasklist BEGIN
+    UPDATE tasklist SET search_tokens = author_tokens(new.author_id, new.title || ' ' || new.body)
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER tasklist_fts_update AFTER UPDATE OF search_tokens ON tasklist BEGIN
+    INSERT INTO tasklist_fts (tasklist_fts, rowid, search_tokens)
+    SELECT 'delete', old.id, old.search_tokens WHERE old.search_tokens <> '';
+    INSERT INTO tasklist_fts (rowid, search_tokens) VALUES (new.id, new.search_tokens);
+END;
+
+CREATE TRIGGER tasklist_fts_delete AFTER DELETE ON tasklist BEGIN
+    INSERT INTO tasklist_fts (tasklist_fts, rowid, search_tokens)
+    SELECT 'delete', old.id, old.search_tokens WHERE old.search_tokens <> '';
+END;
+
+CREATE TRIGGER task_tokens_insert AFTER INSERT ON task BEGIN
+    UPDATE task SET search_tokens = author_tokens(
+        (SELECT author_id FROM tasklist WHERE tasklist.id = new.tasklist_id), new.body)
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER task_tokens_update AFTER UPDATE OF tasklist_id, body ON task BEGIN
+    UPDATE task SET search_tokens = author_tokens(
+        (SELECT author_id FROM tasklist WHERE tasklist.id = new.tasklist_id), new.body)
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER task_fts_update AFTER UPDATE OF search_tokens ON task BEGIN
+    INSERT INTO task_fts (task_fts, rowid, search_tokens)
+    SELECT 'delete', old.id, old.search_tokens WHERE old.search_tokens <> '';
+    INSERT INTO task_fts (rowid, search_tokens) VALUES (new.id, new.search_tokens);
+END;
+
+CREATE TRIGGER task_fts_delete AFTER DELETE ON task BEGIN
+    INSERT INTO task_fts (task_fts, rowid, search_tokens)
+    SELECT 'delete', old.id, old.search_tokens WHERE old.search_tokens <> '';
+END;
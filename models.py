@@ -0,0 +1,113 @@
+from datetime import datetime
+
+
+class Row:
+    """
+    Base dos modelos das linhas lidas do banco.
+
+    get_db() usa um cursor de tuplas; cada consulta seleciona colunas explícitas
+    na ordem de __slots__ do modelo e monta os objetos com fetchone/fetchall.
+    Um objeto com __slots__ é menor e mais rápido de criar que o dict do
+    DictCursor (ver benchmarks/rows.py). row['campo'] continua funcionando como
+    nos dicts, então os templates não mudam.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def astuple(self):
+        """Valores na ordem de __slots__; Model(*row.astuple()) recria a linha."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+    @classmethod
+    def fetchone(cls, cursor):
+        row = cursor.fetchone()
+        return None if row is None else cls(*row)
+
+    @classmethod
+    def fetchall(cls, cursor):
+        return [cls(*row) for row in cursor.fetchall()]
+
+    @classmethod
+    def fetchmany(cls, cursor, size):
+        return [cls(*row) for row in cursor.fetchmany(size)]
+
+
+class User(Row):
+    """Colunas: id, username. Nunca inclui o hash da senha."""
+
+    __slots__ = ('id', 'username')
+
+    def __init__(self, id: int, username: str):
+        self.id = id
+        self.username = username
+
+
+class Tasklist(Row):
+    """Colunas: id, title, body, created, author_id, version, task_count, completed_count."""
+
+    __slots__ = (
+        'id', 'title', 'body', 'created', 'author_id', 'version', 'task_count', 'completed_count',
+    )
+
+    def __init__(self, id: int, title: str, body: str, created: datetime, author_id: int,
+                 version: int, task_count: int, completed_count: int):
+        self.id = id
+        self.title = title
+        self.body = body
+        self.created = created
+        self.author_id = author_id
+        self.version = version
+        self.task_count = task_count
+        self.completed_count = completed_count
+
+
+class Task(Row):
+    """
+    Colunas: id, tasklist_id, body, completed, created e, opcionalmente,
+    o author_id da tasklist (só nas consultas que fazem o JOIN).
+    """
+
+    __slots__ = ('id', 'tasklist_id', 'body', 'completed', 'created', 'author_id')
+
+    def __init__(self, id: int, tasklist_id: int, body: str, completed: int, created: datetime,
+                 author_id: int = None):
+        self.id = id
+        self.tasklist_id = tasklist_id
+        self.body = body
+        self.completed = completed
+        self.created = created
+        self.author_id = author_id
+
+
+class SearchResult(Row):
+    """Colunas: kind ('tasklist' ou 'task'), tasklist_id, task_id, title, body, score."""
+
+    __slots__ = ('kind', 'tasklist_id', 'task_id', 'title', 'body', 'score')
+
+    def __init__(self, kind: str, tasklist_id: int, task_id: int, title: str, body: str,
+                 score: float):
+        self.kind = kind
+        self.tasklist_id = tasklist_id
+        self.task_id = task_id
+        self.title = title
+        self.body = body
+        self.score = score
@@ -0,0 +1,159 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as ResultTimeout
+import multiprocessing
+import os
+import threading
+import time
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashQueueFull(Exception):
+    """Há hashes demais em andamento ou na fila; a requisição deve ser recusada (503)."""
+
+
+class HashTimeout(HashQueueFull):
+    """O hash não terminou em PASSWORD_HASH_TIMEOUT segundos: o pool está sobrecarregado (503)."""
+
+
+class PasswordHasher:
+    """
+    Gera e confere hashes de senha fora das threads que atendem requisições.
+
+    Os hashes rodam num pool de 'workers' processos (ou na própria thread, com
+    workers=0). No máximo workers + queue_limit hashes ficam em andamento ou na
+    fila ao mesmo tempo; além disso, levanta HashQueueFull em vez de enfileirar.
+    Assim uma rajada de logins não ocupa todos os núcleos nem todas as threads.
+    Se o resultado não chega em 'timeout' segundos, levanta HashTimeout (uma
+    HashQueueFull), e a vaga só é liberada quando o hash termina.
+    """
+
+    def __init__(self, method, workers=2, queue_limit=32, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_limit)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Prefixo completo (com parâmetros) dos hashes gerados pelo método atual,
+        # ex.: 'scrypt:32768:8:1', para detectar hashes que precisam ser refeitos
+        self.prefix = generate_password_hash('', method).split('$', 1)[0]
+
+    def _get_executor(self):
+        with self._lock:
+            # Um pool por processo: workers do servidor criados por fork não herdam o do pai
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashQueueFull()
+        if self.workers == 0:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # A vaga acompanha o hash, não a espera: depois de um timeout ele ainda
+        # ocupa o pool até terminar
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except ResultTimeout:
+            future.cancel() # Se ainda estiver na fila, não chega a rodar
+            raise HashTimeout() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Indica se o hash foi gerado com outro método ou outros parâmetros."""
+        return pwhash.split('$', 1)[0] != self.prefix
+
+
+class AttemptThrottle:
+    """
+    Limita tentativas falhas por chave (ex.: 'user:fulano', 'ip:10.0.0.1')
+    numa janela deslizante. Só as falhas contam: quem acerta a senha não gasta
+    o limite do IP, que pode ser compartilhado por muitos usuários (NAT).
+    Os contadores são deste processo.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._attempts = {} # chave -> deque de instantes
+        self._lock = threading.Lock()
+
+    def check(self, limits):
+        """
+        Verifica as chaves de 'limits' ({chave: limite}) sem registrar nada.
+        Retorna None se a tentativa é permitida, ou os segundos até a próxima
+        tentativa permitida.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if len(self._attempts) > 100_000:
+                self._prune(now)
+            retry_after = 0
+            for key, limit in limits.items():
+                attempts = self._attempts.get(key)
+                if attempts is None:
+                    continue
+                while attempts and attempts[0] <= now - self.window:
+                    attempts.popleft()
+                if len(attempts) >= limit:
+                    retry_after = max(retry_after, attempts[0] + self.window - now)
+            return int(retry_after) + 1 if retry_after else None
+
+    def fail(self, keys):
+        """Registra uma tentativa falha para cada chave."""
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._attempts.setdefault(key, deque()).append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def _prune(self, now):
+        for key in [k for k, v in self._attempts.items() if not v or v[-1] <= now - self.window]:
+            del self._attempts[key]
+
+
+def get_hasher():
+    """PasswordHasher deste app, configurado por PASSWORD_HASH_*."""
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        config = current_app.config
+        hasher = current_app.extensions.setdefault('password_hasher', PasswordHasher(
+            config['PASSWORD_HASH_METHOD'],
+            workers=config['PASSWORD_HASH_WORKERS'],
+            queue_limit=config['PASSWORD_HASH_QUEUE_LIMIT'],
+            timeout=config['PASSWORD_HASH_TIMEOUT'],
+        ))
+    return hasher
+
+
+def get_login_throttle():
+    throttle = current_app.extensions.get('login_throttle')
+    if throttle is None:
+        throttle = current_app.extensions.setdefault(
+            'login_throttle', AttemptThrottle(current_app.config['LOGIN_ATTEMPT_WINDOW'])
+        )
+    return throttle
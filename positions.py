@@ -0,0 +1,231 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+import click
+from flask import current_app
+
+from .db import get_db, run_transaction, shard_count
+
+# Posições das tarefas: chaves em base 62 comparadas como texto (coluna
+# task.position, ascii_bin). Entre duas chaves sempre existe outra, então mover
+# uma tarefa altera só a linha dela. Nenhuma chave termina em '0': 'A' e 'A0'
+# não teriam nada entre elas.
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+# Largura das chaves espaçadas e distância entre chaves no fim/início da lista:
+# inserções no fim (o caso comum) não dividem intervalos, então mais de 100 mil
+# tarefas cabem em chaves de 4 dígitos, e entre duas delas cabem outras 61
+KEY_WIDTH = 4
+APPEND_STEP = BASE
+# Tamanho da coluna task.position: key_between nunca passa disso
+MAX_KEY_LENGTH = 255
+
+
+class PositionsExhausted(Exception):
+    """
+    Não há chave de até MAX_KEY_LENGTH dígitos no intervalo pedido (ex.: mais
+    de BASE ** KEY_WIDTH / APPEND_STEP inserções no fim sem reequilíbrio). A
+    tasklist precisa ser reequilibrada (ver append_positions).
+    """
+
+
+def _value(key):
+    """Valor inteiro dos primeiros KEY_WIDTH dígitos da chave."""
+    value = 0
+    for char in key[:KEY_WIDTH].ljust(KEY_WIDTH, '0'):
+        value = value * BASE + DIGITS.index(char)
+    return value
+
+
+def _key(value, width=KEY_WIDTH):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(DIGITS[digit])
+    # Zeros à direita não mudam a ordem e deixariam a chave sem vizinhas
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def midpoint(low, high):
+    """
+    Chave estritamente entre low e high. low pode ser '' (antes de todas) e
+    high None (depois de todas); low < high.
+    """
+    if high is not None:
+        # Prefixo comum (low completado com '0', o menor dígito)
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else '0') == high[n]:
+            n += 1
+        if n:
+            return high[:n] + midpoint(low[n:], high[n:])
+
+    digit_low = DIGITS.index(low[0]) if low else 0
+    digit_high = DIGITS.index(high[0]) if high is not None else BASE
+    if digit_high - digit_low > 1:
+        return DIGITS[(digit_low + digit_high) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[digit_low] + midpoint(low[1:], None)
+
+
+def key_between(low=None, high=None):
+    """
+    Chave para uma tarefa entre as posições low e high (None: início ou fim da
+    lista). No fim e no início avança APPEND_STEP, sem gastar o espaço entre
+    chaves; no meio usa o ponto médio, que cresce um dígito a cada ~6 divisões.
+    Levanta PositionsExhausted se a chave passaria de MAX_KEY_LENGTH.
+    """
+    if high is None and low is not None:
+        value = _value(low) + APPEND_STEP
+        if value < BASE ** KEY_WIDTH:
+            return _key(value)
+    elif low is None and high is not None:
+        value = _value(high) - APPEND_STEP
+        if value > 0:
+            return _key(value)
+    # low e high têm no máximo MAX_KEY_LENGTH dígitos, o que limita a recursão
+    key = midpoint(low or '', high)
+    if len(key) > MAX_KEY_LENGTH:
+        raise PositionsExhausted(low, high)
+    return key
+
+
+def keys_after(low, count):
+    """count chaves crescentes depois de low (None: lista vazia)."""
+    keys = []
+    for _ in range(count):
+        low = key_between(low, None)
+        keys.append(low)
+    return keys
+
+
+def last_position(db_cursor, tasklist_id):
+    """Maior posição da tasklist, ou None se ela não tem tarefas (índice (tasklist_id, position))."""
+    db_cursor.execute('SELECT MAX(position) FROM task WHERE tasklist_id = %s', (tasklist_id,))
+    return db_cursor.fetchone()[0]
+
+
+def append_positions(shard, tasklist_id, count):
+    """
+    count posições no fim da tasklist, na transação atual, que já bloqueou a
+    tasklist. Se as chaves se esgotarem, reequilibra a tasklist ali mesmo,
+    reservando espaço para as novas, em vez de esperar o Rebalancer.
+    """
+    db_cursor = get_db(shard=shard)
+    try:
+        return keys_after(last_position(db_cursor, tasklist_id), count)
+    except PositionsExhausted:
+        rebalance_tasklist(shard, tasklist_id, reserve=count)
+        return keys_after(last_position(db_cursor, tasklist_id), count)
+
+
+def spaced_keys(count):
+    """
+    count chaves igualmente espaçadas na metade de baixo do espaço, deixando a
+    outra metade para as inserções no fim da lista.
+    """
+    width = KEY_WIDTH
+    while BASE ** width < 2 * (count + 1) * BASE:
+        width += 1
+    step = BASE ** width // (2 * (count + 1))
+    return [_key(step * (n + 1), width) for n in range(count)]
+
+
+def rebalance_tasklist(shard, tasklist_id, reserve=0):
+    """
+    Regrava as posições das tarefas de uma tasklist com chaves curtas e
+    espaçadas, mantendo a ordem. Com reserve, as chaves são espaçadas como se
+    houvesse mais 'reserve' tarefas, o que garante espaço para inserir essas
+    no fim. Retorna quantas tarefas foram regravadas.
+    """
+    db_cursor = get_db(shard=shard)
+    # Bloqueia a tasklist antes das tarefas, como as views (tasklist.lock_tasklist)
+    db_cursor.execute('SELECT id FROM tasklist WHERE id = %s FOR UPDATE', (tasklist_id,))
+    if db_cursor.fetchone() is None:
+        return 0
+    db_cursor.execute(
+        'SELECT id FROM task WHERE tasklist_id = %s ORDER BY position, id', (tasklist_id,)
+    )
+    ids = [id for (id,) in db_cursor.fetchall()]
+    db_cursor.executemany(
+        'UPDATE task SET position = %s WHERE id = %s', list(zip(spaced_keys(len(ids) + reserve), ids))
+    )
+    return len(ids)
+
+
+class Rebalancer:
+    """
+    Reequilibra tasklists em segundo plano, numa thread por processo, depois
+    que uma inserção ou movimento gera uma chave maior que
+    TASK_POSITION_MAX_LENGTH. Pedidos repetidos para a mesma tasklist enquanto
+    ela espera na fila são ignorados.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pending = set()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def schedule(self, shard, tasklist_id):
+        key = (shard, tasklist_id)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            # Um executor por processo: workers do servidor criados por fork não herdam a thread
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rebalance')
+                self._pid = os.getpid()
+            self._executor.submit(self._run, key)
+
+    def _run(self, key):
+        try:
+            with self.app.app_context():
+                run_transaction(rebalance_tasklist, *key)
+        except Exception:
+            self.app.logger.exception('Falha ao reequilibrar as posições da tasklist %s', key[1])
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+def get_rebalancer():
+    rebalancer = current_app.extensions.get('position_rebalancer')
+    if rebalancer is None:
+        rebalancer = current_app.extensions.setdefault(
+            'position_rebalancer', Rebalancer(current_app._get_current_object())
+        )
+    return rebalancer
+
+
+def check_length(shard, tasklist_id, position):
+    """Agenda o reequilíbrio da tasklist se a chave ficou longa demais."""
+    if len(position) > current_app.config['TASK_POSITION_MAX_LENGTH']:
+        get_rebalancer().schedule(shard, tasklist_id)
+
+
+@click.command('rebalance-positions')
+@click.option('--min-length', type=int,
+              help='Reequilibra tasklists com chaves maiores que isso (padrão: TASK_POSITION_MAX_LENGTH).')
+def rebalance_positions_command(min_length):
+    """Reequilibra agora as posições das tasklists com chaves longas."""
+    if min_length is None:
+        min_length = current_app.config['TASK_POSITION_MAX_LENGTH']
+    total = 0
+    for shard in range(shard_count()):
+        db_cursor = get_db(shard=shard)
+        db_cursor.execute(
+            # LENGTH conta bytes no MySQL, mas as chaves são ASCII
+            'SELECT DISTINCT tasklist_id FROM task WHERE LENGTH(position) > %s', (min_length,)
+        )
+        for (tasklist_id,) in db_cursor.fetchall():
+            run_transaction(rebalance_tasklist, shard, tasklist_id)
+            total += 1
+    click.echo(f'{total} tasklists reequilibradas.')
+
+
+def init_app(app):
+    app.cli.add_command(rebalance_positions_command)
@@ -0,0 +1,195 @@
+import time
+
+import click
+from flask import current_app
+
+from .cache import invalidate_now
+from .db import get_db, run_transaction, shard_count
+
+# Tasklists lidas da fila por vez
+QUEUE_BATCH = 100
+
+
+def purge_status():
+    """
+    O que falta remover: tasklists e usuários excluídos logicamente e o total
+    de tarefas dessas tasklists (pelo task_count, decrementado a cada lote),
+    somando todos os shards.
+    """
+    def read():
+        status = dict(tasklists=0, tasks=0)
+        for shard in range(shard_count()):
+            db_cursor = get_db(shard=shard)
+            db_cursor.execute(
+                'SELECT COUNT(*), COALESCE(SUM(task_count), 0) FROM tasklist WHERE deleted_at IS NOT NULL'
+            )
+            tasklists, tasks = db_cursor.fetchone()
+            status['tasklists'] += int(tasklists)
+            status['tasks'] += int(tasks)
+        db_cursor = get_db()
+        db_cursor.execute('SELECT COUNT(*) FROM user WHERE deleted_at IS NOT NULL')
+        users, = db_cursor.fetchone()
+        return dict(status, users=int(users))
+
+    return run_transaction(read)
+
+
+def _delete_task_batch(shard, tasklist_id, batch_size):
+    db_cursor = get_db(shard=shard)
+    db_cursor.execute(
+        'SELECT id FROM task WHERE tasklist_id = %s LIMIT %s', (tasklist_id, batch_size)
+    )
+    ids = [id for (id,) in db_cursor.fetchall()]
+    if ids:
+        placeholders = ', '.join(['%s'] * len(ids))
+        # Mantém o task_count como o total que ainda falta remover (ver purge_status).
+        # Atualiza a tasklist antes das tarefas, como tasklist.touch_tasklist.
+        db_cursor.execute(
+            'UPDATE tasklist SET task_count = task_count - %s WHERE id = %s',
+            (len(ids), tasklist_id)
+        )
+        db_cursor.execute(f'DELETE FROM task WHERE id IN ({placeholders})', ids)
+    return len(ids)
+
+
+def _delete_tasklist(shard, tasklist_id):
+    get_db(shard=shard).execute(
+        'DELETE FROM tasklist WHERE id = %s AND deleted_at IS NOT NULL', (tasklist_id,)
+    )
+
+
+def purge_tasklist(shard, tasklist_id, batch_size, pause, echo=None):
+    """
+    Remove as tarefas de uma tasklist excluída do shard em lotes de batch_size,
+    cada lote na sua transação e com uma pausa de 'pause' segundos entre eles,
+    e depois a própria tasklist. Retorna quantas tarefas foram removidas.
+    """
+    deleted = 0
+    while True:
+        count = run_transaction(_delete_task_batch, shard, tasklist_id, batch_size)
+        deleted += count
+        if echo and count:
+            echo(f'  tasklist {tasklist_id}: {deleted} tarefas removidas')
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    run_transaction(_delete_tasklist, shard, tasklist_id)
+    # A tasklist já sumia das páginas desde a exclusão lógica; descarta os fragmentos restantes
+    invalidate_now(f'tasklist:{tasklist_id}')
+    return deleted
+
+
+def _queued_tasklists(shard):
+    db_cursor = get_db(shard=shard)
+    db_cursor.execute(
+        'SELECT id FROM tasklist WHERE deleted_at IS NOT NULL ORDER BY deleted_at, id LIMIT %s',
+        (QUEUE_BATCH,)
+    )
+    return [id for (id,) in db_cursor.fetchall()]
+
+
+def _delete_users():
+    """
+    Remove usuários excluídos que já não têm tasklists em nenhum shard, com as
+    suas linhas do diretório de shards; retorna os ids.
+    """
+    db_cursor = get_db()
+    db_cursor.execute(
+        'SELECT id FROM user WHERE deleted_at IS NOT NULL'
+        ' AND NOT EXISTS (SELECT 1 FROM tasklist WHERE tasklist.author_id = user.id)'
+        ' ORDER BY deleted_at, id LIMIT %s',
+        (QUEUE_BATCH,)
+    )
+    ids = [id for (id,) in db_cursor.fetchall()]
+    for shard in range(1, shard_count()):
+        if not ids:
+            break
+        shard_cursor = get_db(shard=shard)
+        placeholders = ', '.join(['%s'] * len(ids))
+        shard_cursor.execute(
+            f'SELECT DISTINCT author_id FROM tasklist WHERE author_id IN ({placeholders})', ids
+        )
+        pending = {author_id for (author_id,) in shard_cursor.fetchall()}
+        ids = [id for id in ids if id not in pending]
+    if ids:
+        placeholders = ', '.join(['%s'] * len(ids))
+        db_cursor.execute(
+            f'DELETE FROM user WHERE id IN ({placeholders}) AND deleted_at IS NOT NULL', ids
+        )
+        db_cursor.execute(f'DELETE FROM user_shard WHERE user_id IN ({placeholders})', ids)
+    return ids
+
+
+def purge_deleted(batch_size=None, pause=None, echo=None):
+    """
+    Remove de fato as tasklists e usuários excluídos logicamente (deleted_at),
+    dos mais antigos para os mais novos. Nenhuma transação apaga mais que
+    batch_size tarefas, então outros escritores nunca esperam muito por locks.
+
+    Todo o estado está no banco: se o processo parar no meio, a próxima
+    execução continua de onde parou. Retorna os totais removidos.
+    """
+    config = current_app.config
+    batch_size = batch_size or config['PURGE_BATCH_SIZE']
+    pause = config['PURGE_PAUSE'] if pause is None else pause
+    totals = dict(tasklists=0, tasks=0, users=0)
+
+    for shard in range(shard_count()):
+        while True:
+            queue = run_transaction(_queued_tasklists, shard)
+            if not queue:
+                break
+            for tasklist_id in queue:
+                totals['tasks'] += purge_tasklist(shard, tasklist_id, batch_size, pause, echo)
+                totals['tasklists'] += 1
+                if echo:
+                    echo(f'tasklist {tasklist_id} removida')
+
+    while True:
+        ids = run_transaction(_delete_users)
+        invalidate_now(*(f'user:{id}' for id in ids))
+        count = len(ids)
+        totals['users'] += count
+        if count < QUEUE_BATCH:
+            break
+        time.sleep(pause)
+    if echo and totals['users']:
+        echo(f"{totals['users']} usuários removidos")
+
+    return totals
+
+
+@click.command('purge-deleted')
+@click.option('--batch-size', type=int, help='Tarefas removidas por transação (padrão: PURGE_BATCH_SIZE).')
+@click.option('--pause', type=float, help='Segundos entre lotes (padrão: PURGE_PAUSE).')
+@click.option('--loop', is_flag=True, help='Continua rodando e verifica a fila a cada --interval segundos.')
+@click.option('--interval', default=60.0, show_default=True, help='Segundos entre verificações com --loop.')
+@click.option('--status', is_flag=True, help='Só mostra o que falta remover.')
+def purge_deleted_command(batch_size, pause, loop, interval, status):
+    """Remove, em lotes pequenos, as tasklists e usuários excluídos."""
+    def show_status():
+        pending = purge_status()
+        click.echo(
+            f"Pendentes: {pending['tasklists']} tasklists, {pending['tasks']} tarefas,"
+            f" {pending['users']} usuários."
+        )
+
+    show_status()
+    if status:
+        return
+
+    while True:
+        totals = purge_deleted(batch_size, pause, echo=click.echo)
+        if any(totals.values()):
+            click.echo(
+                f"Removidos: {totals['tasklists']} tasklists, {totals['tasks']} tarefas,"
+                f" {totals['users']} usuários."
+            )
+            show_status()
+        if not loop:
+            break
+        time.sleep(interval)
+
+
+def init_app(app):
+    app.cli.add_command(purge_deleted_command)
@@ -0,0 +1,110 @@
+from flask import Blueprint, current_app, g, render_template, request, url_for
+
+from .auth import login_required
+from .db import get_backend, shard_db
+from .models import SearchResult
+from .sqlite import author_tokens
+
+bp = Blueprint('search', __name__, url_prefix='/search')
+
+# O índice FULLTEXT cobre search_tokens, em que cada palavra leva o prefixo
+# do autor (migrations/0009, sqlite.author_tokens), e a consulta usa os termos
+# com o mesmo prefixo. Assim o MySQL só busca e pontua as linhas do próprio
+# usuário: uma palavra comum a muitos usuários não deixa a busca de cada um
+# mais lenta (benchmarks/search.py mede isso). O author_id continua no WHERE
+# por segurança; o LIMIT de cada parte só encurta a ordenação final. As
+# colunas seguem a ordem de models.SearchResult.
+MYSQL_SEARCH_SQL = """
+    (SELECT 'tasklist' AS kind, id AS tasklist_id, NULL AS task_id, title, body,
+            MATCH (search_tokens) AGAINST (%(q)s IN NATURAL LANGUAGE MODE) AS score
+     FROM tasklist
+     WHERE author_id = %(author_id)s AND deleted_at IS NULL
+       AND MATCH (search_tokens) AGAINST (%(q)s IN NATURAL LANGUAGE MODE)
+     ORDER BY score DESC LIMIT %(limit)s)
+    UNION ALL
+    (SELECT 'task' AS kind, task.tasklist_id, task.id AS task_id, tasklist.title, task.body,
+            MATCH (task.search_tokens) AGAINST (%(q)s IN NATURAL LANGUAGE MODE) AS score
+     FROM task JOIN tasklist ON task.tasklist_id = tasklist.id
+     WHERE tasklist.author_id = %(author_id)s AND tasklist.deleted_at IS NULL
+       AND MATCH (task.search_tokens) AGAINST (%(q)s IN NATURAL LANGUAGE MODE)
+     ORDER BY score DESC LIMIT %(limit)s)
+    ORDER BY score DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+# O mesmo no SQLite, com as tabelas FTS5 (migrations/sqlite). bm25() é menor
+# para os resultados mais relevantes, então o score é o seu negativo.
+SQLITE_SEARCH_SQL = """
+    SELECT * FROM (
+        SELECT 'tasklist' AS kind, tasklist.id AS tasklist_id, NULL AS task_id,
+               tasklist.title, tasklist.body, -bm25(tasklist_fts) AS score
+        FROM tasklist_fts JOIN tasklist ON tasklist.id = tasklist_fts.rowid
+        WHERE tasklist_fts MATCH %(q)s
+          AND tasklist.author_id = %(author_id)s AND tasklist.deleted_at IS NULL
+        ORDER BY score DESC LIMIT %(limit)s)
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'task' AS kind, task.tasklist_id, task.id AS task_id, tasklist.title,
+               task.body, -bm25(task_fts) AS score
+        FROM task_fts
+        JOIN task ON task.id = task_fts.rowid
+        JOIN tasklist ON task.tasklist_id = tasklist.id
+        WHERE task_fts MATCH %(q)s
+          AND tasklist.author_id = %(author_id)s AND tasklist.deleted_at IS NULL
+        ORDER BY score DESC LIMIT %(limit)s)
+    ORDER BY score DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+def fts_query(terms):
+    """
+    Consulta FTS5 equivalente ao NATURAL LANGUAGE MODE do MySQL: qualquer um
+    dos termos, cada um entre aspas para que a sintaxe do FTS5 (AND, NEAR,
+    '*', ...) não se aplique ao texto digitado.
+    """
+    return ' OR '.join(f'"{term}"' for term in terms.split())
+
+
+def search_user_data(author_id, q, page, per_page):
+    """
+    Busca tasklists (título e descrição) e tarefas do usuário, da mais para a
+    menos relevante. Retorna a página pedida e se existe uma próxima.
+    """
+    offset = (page - 1) * per_page
+    q = author_tokens(author_id, q)
+    if not q:
+        return [], False
+    sql = MYSQL_SEARCH_SQL
+    if get_backend().name == 'sqlite':
+        sql, q = SQLITE_SEARCH_SQL, fts_query(q)
+    db_cursor = shard_db(author_id, readonly=True)
+    db_cursor.execute(sql, dict(
+        q=q, author_id=author_id, limit=offset + per_page + 1, offset=offset,
+    ))
+    results = SearchResult.fetchall(db_cursor)
+    return results[:per_page], len(results) > per_page
+
+
+@bp.route('/')
+@login_required
+def index():
+    """Busca nas tasklists e tarefas do usuário logado."""
+    q = request.args.get('q', '').strip()
+    per_page = current_app.config['SEARCH_PER_PAGE']
+    max_pages = current_app.config['SEARCH_MAX_PAGES']
+    page = min(max(request.args.get('page', 1, type=int), 1), max_pages)
+
+    results, has_next = [], False
+    if q:
+        results, has_next = search_user_data(g.user['id'], q, page, per_page)
+
+    next_url = prev_url = None
+    if has_next and page < max_pages:
+        next_url = url_for('search.index', q=q, page=page + 1)
+    if page > 1:
+        prev_url = url_for('search.index', q=q, page=page - 1)
+
+    return render_template(
+        'search.html', q=q, results=results, next_url=next_url, prev_url=prev_url
+    )
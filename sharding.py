@@ -0,0 +1,277 @@
+import time
+
+import click
+from flask import current_app
+
+from .cache import invalidate_now
+from .db import get_db, get_shard_router, run_transaction, shard_count, shard_for
+
+# Colunas copiadas entre shards, com tudo o que as migrações acrescentaram
+TASKLIST_COPY_COLUMNS = (
+    'id', 'author_id', 'created', 'title', 'body', 'version', 'task_count', 'completed_count',
+    'deleted_at',
+)
+TASK_COPY_COLUMNS = ('id', 'tasklist_id', 'body', 'completed', 'created', 'position')
+
+
+class ShardMoveError(click.ClickException):
+    """A migração não pode continuar (ex.: ids que já existem no shard de destino)."""
+
+
+def _upsert_sql(table, columns):
+    assignments = ', '.join(f'{column} = VALUES({column})' for column in columns[1:])
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)})"
+        f" VALUES ({', '.join(['%s'] * len(columns))})"
+        f' ON DUPLICATE KEY UPDATE {assignments}'
+    )
+
+
+def shard_status():
+    """Usuários no diretório e tasklists (não excluídas) em cada shard."""
+    status = []
+    directory = get_db()
+    directory.execute('SELECT shard, COUNT(*), SUM(moving) FROM user_shard GROUP BY shard')
+    users = {shard: (int(count), int(moving or 0)) for shard, count, moving in directory.fetchall()}
+    for shard in range(shard_count()):
+        db_cursor = get_db(shard=shard)
+        db_cursor.execute('SELECT COUNT(*) FROM tasklist WHERE deleted_at IS NULL')
+        tasklists, = db_cursor.fetchone()
+        count, moving = users.get(shard, (0, 0))
+        status.append(dict(shard=shard, users=count, moving=moving, tasklists=int(tasklists)))
+    return status
+
+
+class ShardMove:
+    """
+    Move as tasklists e tarefas de um usuário para outro shard sem tirar o app
+    do ar. As escritas do usuário só ficam bloqueadas (503, ver db.ShardMoving)
+    durante a última sincronização:
+
+    1. copia tudo para o destino, em lotes, com o usuário ativo;
+    2. recopia as tasklists cuja versão mudou, até sobrar pouca diferença;
+    3. marca o usuário como 'moving' e espera o cache do diretório expirar;
+    4. sincroniza o que falta, com as linhas da origem bloqueadas (FOR UPDATE);
+    5. aponta o diretório para o destino e espera o cache expirar de novo,
+       para que nenhum processo ainda leia da origem;
+    6. remove as linhas da origem, em lotes.
+
+    A versão da tasklist muda a cada alteração nela ou nas suas tarefas
+    (tasklist.touch_tasklist), então ela basta para achar o que mudou. Se a
+    migração for interrompida, basta rodá-la de novo: a cópia é idempotente.
+    """
+
+    def __init__(self, user_id, target, batch_size, echo=None):
+        self.user_id = user_id
+        self.target = target
+        self.batch_size = batch_size
+        self.echo = echo or (lambda message: None)
+        self.copied = {} # id da tasklist -> versão copiada para o destino
+        get_shard_router().forget(user_id)
+        self.source = shard_for(user_id)
+
+    def run(self):
+        wait = current_app.config['DB_SHARD_CACHE_TTL'] + 1
+        self.copy_all()
+        for _ in range(3):
+            if self.sync() <= self.batch_size:
+                break
+
+        run_transaction(self.set_directory, self.source, True)
+        self.echo(f'Escritas bloqueadas; aguardando {wait}s pelo cache do diretório.')
+        time.sleep(wait)
+        changed = self.sync(lock=True)
+        self.echo(f'Sincronização final: {changed} tasklists.')
+
+        run_transaction(self.set_directory, self.target, False)
+        # Fragmentos renderizados com dados da origem durante a migração
+        invalidate_now(*(f'tasklist:{id}' for id in self.copied))
+        self.echo(f'Diretório aponta para o shard {self.target}; aguardando {wait}s.')
+        time.sleep(wait)
+        self.delete_source()
+
+    def set_directory(self, shard, moving):
+        get_db().execute(
+            'INSERT INTO user_shard (user_id, shard, moving) VALUES (%s, %s, %s)'
+            ' ON DUPLICATE KEY UPDATE shard = VALUES(shard), moving = VALUES(moving)',
+            (self.user_id, shard, moving)
+        )
+        get_shard_router().forget(self.user_id)
+
+    def _source_tasklists(self, after_id=0, lock=False):
+        db_cursor = get_db(shard=self.source)
+        db_cursor.execute(
+            f"SELECT {', '.join(TASKLIST_COPY_COLUMNS)} FROM tasklist"
+            ' WHERE author_id = %s AND id > %s ORDER BY id LIMIT %s'
+            + (' FOR UPDATE' if lock else ''),
+            (self.user_id, after_id, self.batch_size)
+        )
+        return db_cursor.fetchall()
+
+    def copy_all(self):
+        """Passo 1: copia as tasklists do usuário, um lote por transação."""
+        after_id = 0
+        while True:
+            # self.copied só muda depois do commit: uma transação repetida ou
+            # desfeita não deixa versões que não chegaram ao destino
+            rows, copied = run_transaction(self._copy_batch, after_id)
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            self.copied.update(copied)
+            self.echo(f'{len(self.copied)} tasklists copiadas')
+
+    def _copy_batch(self, after_id):
+        rows = self._source_tasklists(after_id)
+        return rows, {row[0]: self._copy_tasklist(row) for row in rows}
+
+    def _copy_tasklist(self, row):
+        """
+        Copia uma tasklist e todas as suas tarefas, substituindo a cópia anterior.
+        Retorna a versão copiada.
+        """
+        tasklist_id, version = row[0], row[5]
+        target = get_db(shard=self.target)
+        target.execute(
+            'SELECT id FROM tasklist WHERE id = %s AND author_id <> %s', (tasklist_id, self.user_id)
+        )
+        if target.fetchone():
+            raise ShardMoveError(f'A tasklist {tasklist_id} já existe no shard {self.target}.')
+        target.execute(_upsert_sql('tasklist', TASKLIST_COPY_COLUMNS), row)
+
+        source = get_db(shard=self.source)
+        ids, after_id = [], 0
+        while True:
+            source.execute(
+                f"SELECT {', '.join(TASK_COPY_COLUMNS)} FROM task"
+                ' WHERE tasklist_id = %s AND id > %s ORDER BY id LIMIT %s',
+                (tasklist_id, after_id, self.batch_size)
+            )
+            tasks = source.fetchall()
+            if not tasks:
+                break
+            after_id = tasks[-1][0]
+            ids += [task[0] for task in tasks]
+            placeholders = ', '.join(['%s'] * len(tasks))
+            target.execute(
+                f'SELECT id FROM task WHERE id IN ({placeholders}) AND tasklist_id <> %s',
+                (*(task[0] for task in tasks), tasklist_id)
+            )
+            if target.fetchone():
+                raise ShardMoveError(
+                    f'Tarefas da tasklist {tasklist_id} têm ids que já existem no shard {self.target}.'
+                )
+            target.executemany(_upsert_sql('task', TASK_COPY_COLUMNS), tasks)
+
+        # Tarefas excluídas na origem depois da cópia anterior
+        if ids:
+            placeholders = ', '.join(['%s'] * len(ids))
+            target.execute(
+                f'DELETE FROM task WHERE tasklist_id = %s AND id NOT IN ({placeholders})',
+                (tasklist_id, *ids)
+            )
+        else:
+            target.execute('DELETE FROM task WHERE tasklist_id = %s', (tasklist_id,))
+        return version
+
+    def sync(self, lock=False):
+        """
+        Passos 2 e 4: numa transação, recopia as tasklists novas ou com outra
+        versão e remove do destino as que sumiram da origem. Com lock=True as
+        linhas lidas da origem ficam bloqueadas até o commit. Retorna quantas
+        tasklists mudaram.
+        """
+        copied, removed = run_transaction(self._sync, lock)
+        self.copied.update(copied)
+        for tasklist_id in removed:
+            del self.copied[tasklist_id]
+        return len(copied) + len(removed)
+
+    def _sync(self, lock):
+        seen, copied, after_id = set(), {}, 0
+        while True:
+            rows = self._source_tasklists(after_id, lock)
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            for row in rows:
+                seen.add(row[0])
+                if self.copied.get(row[0]) != row[5]:
+                    copied[row[0]] = self._copy_tasklist(row)
+
+        removed = set(self.copied) - seen # Removidas da origem pelo purge
+        target = get_db(shard=self.target)
+        for tasklist_id in removed:
+            target.execute('DELETE FROM task WHERE tasklist_id = %s', (tasklist_id,))
+            target.execute('DELETE FROM tasklist WHERE id = %s', (tasklist_id,))
+        return copied, removed
+
+    def delete_source(self):
+        """Passo 6: remove da origem as tarefas e depois as tasklists, em lotes."""
+        def delete_batch():
+            db_cursor = get_db(shard=self.source)
+            db_cursor.execute(
+                'SELECT id FROM tasklist WHERE author_id = %s ORDER BY id LIMIT %s',
+                (self.user_id, self.batch_size)
+            )
+            ids = [id for (id,) in db_cursor.fetchall()]
+            if ids:
+                placeholders = ', '.join(['%s'] * len(ids))
+                db_cursor.execute(f'DELETE FROM task WHERE tasklist_id IN ({placeholders})', ids)
+                db_cursor.execute(f'DELETE FROM tasklist WHERE id IN ({placeholders})', ids)
+            return len(ids)
+
+        removed = 0
+        while True:
+            count = run_transaction(delete_batch)
+            removed += count
+            if count < self.batch_size:
+                break
+            time.sleep(current_app.config['PURGE_PAUSE'])
+        self.echo(f'{removed} tasklists removidas do shard {self.source}.')
+
+
+@click.command('shard-move')
+@click.argument('username')
+@click.argument('target', type=int)
+@click.option('--batch-size', default=500, show_default=True,
+              help='Tasklists (e tarefas de cada tasklist) por lote.')
+def shard_move_command(username, target, batch_size):
+    """Move as tasklists e tarefas de USERNAME para o shard TARGET, com o app no ar."""
+    if not 0 <= target < shard_count():
+        raise click.ClickException(f'Shard inválido: {target} (há {shard_count()} shards).')
+
+    db_cursor = get_db()
+    db_cursor.execute('SELECT id FROM user WHERE username = %s AND deleted_at IS NULL', (username,))
+    row = db_cursor.fetchone()
+    if row is None:
+        raise click.ClickException(f'Usuário {username} não encontrado.')
+
+    move = ShardMove(row[0], target, batch_size, echo=click.echo)
+    if move.source == target:
+        click.echo(f'{username} já está no shard {target}.')
+        return
+    click.echo(f'Movendo {username} do shard {move.source} para o shard {target}.')
+    try:
+        move.run()
+    except ShardMoveError:
+        # Devolve as escritas ao usuário; as cópias parciais no destino são substituídas
+        # na próxima tentativa e nunca são lidas antes da troca do diretório
+        run_transaction(move.set_directory, move.source, False)
+        raise
+    click.echo('Concluído.')
+
+
+@click.command('shard-status')
+def shard_status_command():
+    """Mostra quantos usuários e tasklists há em cada shard."""
+    for status in shard_status():
+        click.echo(
+            f"shard {status['shard']}: {status['users']} usuários no diretório"
+            f" ({status['moving']} em migração), {status['tasklists']} tasklists"
+        )
+
+
+def init_app(app):
+    app.cli.add_command(shard_move_command)
+    app.cli.add_command(shard_status_command)
@@ -0,0 +1,216 @@
+from datetime import datetime
+import functools
+import os
+import re
+import sqlite3
+import threading
+
+# Backend SQLite embutido (DB_BACKEND='sqlite'), para instalações de um único
+# nó: as consultas vão a um arquivo local (SQLITE_PATH), sem ida e volta pela
+# rede. As views continuam escrevendo o SQL do MySQL; SQLiteCursor o traduz.
+
+# Colunas TIMESTAMP voltam como datetime, como no MySQLdb. O registro vale
+# para o processo inteiro (o sqlite3 não tem conversores por conexão).
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+
+# Placeholders do MySQLdb (%s, %(nome)s) e o '%' escapado
+PLACEHOLDER_RE = re.compile(r'%\((\w+)\)s|%s|%%')
+FOR_UPDATE_RE = re.compile(r'\s+FOR\s+UPDATE\b', re.IGNORECASE)
+WRITE_RE = re.compile(r'^\s*(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+INSERT_RE = re.compile(r'^\s*INSERT\b', re.IGNORECASE)
+# Palavras para a busca: sequências de letras e dígitos, como [[:alnum:]] no MySQL
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def author_tokens(author_id, text):
+    """
+    Texto indexado pela busca (search.py): cada palavra com o prefixo do autor,
+    ex.: (7, 'Comprar pão') -> 'a7xcomprar a7xpão'. Com o prefixo, o índice de
+    texto completo guarda uma lista de ocorrências por usuário e palavra.
+    Registrada como função SQL nas conexões SQLite (triggers de
+    migrations/sqlite/0009); no MySQL os triggers de migrations/0009 fazem o
+    mesmo com REGEXP_REPLACE.
+    """
+    if author_id is None or not text:
+        return ''
+    return ' '.join(f'a{author_id}x{word}' for word in WORD_RE.findall(text.lower()))
+
+
+def _placeholder(match):
+    if match.group(1):
+        return f':{match.group(1)}'
+    return '?' if match.group(0) == '%s' else '%'
+
+
+@functools.lru_cache(maxsize=1024)
+def translate_sql(query):
+    """
+    Traduz uma instrução escrita para o MySQLdb: placeholders '?' e ':nome' e
+    sem FOR UPDATE. Retorna (instrução, escreve), onde 'escreve' indica que
+    ela precisa do lock de escrita do banco (ver SQLiteCursor).
+    """
+    locks = FOR_UPDATE_RE.search(query) is not None
+    query = PLACEHOLDER_RE.sub(_placeholder, FOR_UPDATE_RE.sub('', query))
+    return query, locks or WRITE_RE.match(query) is not None
+
+
+class SQLiteCursor:
+    """
+    Cursor do sqlite3 com a interface que as views usam do MySQLdb.
+
+    A conexão fica em modo autocommit e cada leitura fora de uma escrita vê o
+    último commit. A primeira escrita (ou SELECT ... FOR UPDATE) abre a
+    transação com BEGIN IMMEDIATE, que pega o lock de escrita do banco até o
+    commit ou rollback: é o equivalente ao lock de linha do MySQL, só que do
+    banco inteiro. Se outro escritor segurar o lock por mais que
+    SQLITE_BUSY_TIMEOUT, a instrução falha com 'database is locked' e
+    db.run_transaction repete a transação.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = conn.cursor()
+        self.lastrowid = None
+
+    def _prepare(self, query):
+        query, writes = translate_sql(query)
+        if writes and not self._conn.in_transaction:
+            self._conn.execute('BEGIN IMMEDIATE')
+        return query
+
+    def execute(self, query, args=None):
+        self._cursor.execute(self._prepare(query), args or ())
+        self.lastrowid = self._cursor.lastrowid
+        return self._cursor.rowcount
+
+    def executemany(self, query, args):
+        query = self._prepare(query)
+        self._cursor.executemany(query, args)
+        if INSERT_RE.match(query) and self._cursor.rowcount > 0:
+            # Como no MySQLdb, o id da primeira linha inserida. Com o lock de
+            # escrita e AUTOINCREMENT, os ids das linhas são consecutivos.
+            last_id, = self._conn.execute('SELECT last_insert_rowid()').fetchone()
+            self.lastrowid = last_id - self._cursor.rowcount + 1
+        return self._cursor.rowcount
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ThreadConnections:
+    """
+    Uma conexão por thread, no lugar do pool do MySQL: abrir uma conexão
+    SQLite é barato e ela não pode ser usada por duas threads ao mesmo tempo.
+
+    acquire() na mesma thread devolve a mesma conexão (ex.: streaming_cursor
+    durante uma requisição); o rollback de release() só acontece quando a
+    última delas é devolvida.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.metrics = dict(in_use=0, checkouts=0, creations=0)
+
+    def _count(self, metric, n=1):
+        with self._lock:
+            self.metrics[metric] += n
+
+    def acquire(self):
+        local = self._local
+        # Processos criados por fork não herdam a conexão da thread que os criou
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn, local.depth, local.pid = self._connect(), 0, os.getpid()
+            self._count('creations')
+        local.depth += 1
+        self._count('in_use')
+        self._count('checkouts')
+        return local.conn
+
+    def release(self, conn):
+        local = self._local
+        local.depth -= 1
+        self._count('in_use', -1)
+        if local.depth == 0:
+            # Descarta qualquer transação deixada aberta pela requisição
+            conn.rollback()
+
+    def status(self):
+        with self._lock:
+            return dict(self.metrics)
+
+
+def split_sql(script):
+    """
+    Divide um script SQL em comandos completos segundo o próprio SQLite, o que
+    mantém inteiros os corpos de triggers (BEGIN ... ; ... END).
+    """
+    commands, current = [], ''
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            commands.append(current.strip())
+            current = ''
+    if current.strip():
+        commands.append(current.strip())
+    return commands
+
+
+class SQLiteBackend:
+    """
+    Backend SQLite (ver db.MySQLBackend para a interface). Cada conexão usa
+    WAL (leitores não esperam o escritor), synchronous=NORMAL (seguro com
+    WAL), leitura por mmap de até SQLITE_MMAP_SIZE bytes e um cache de
+    SQLITE_STATEMENT_CACHE instruções preparadas; o SQL traduzido é sempre o
+    mesmo texto, então cada instrução é preparada uma vez por conexão.
+
+    É um banco de um único nó: sem réplicas de leitura nem shards.
+    """
+
+    name = 'sqlite'
+    migrations_dir = os.path.join('migrations', 'sqlite')
+    single_node = True
+    IntegrityError = sqlite3.IntegrityError
+    OperationalError = sqlite3.OperationalError
+
+    def create_pool(self, config, shard=0):
+        def connect():
+            conn = sqlite3.connect(
+                config['SQLITE_PATH'],
+                timeout=config['SQLITE_BUSY_TIMEOUT'],
+                isolation_level=None, # Transações abertas por SQLiteCursor
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                cached_statements=config['SQLITE_STATEMENT_CACHE'],
+            )
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+            conn.execute('PRAGMA foreign_keys = ON')
+            conn.create_function('author_tokens', 2, author_tokens, deterministic=True)
+            return conn
+
+        return ThreadConnections(connect)
+
+    def cursor(self, conn):
+        return SQLiteCursor(conn)
+
+    def streaming_cursor(self, conn):
+        # O cursor do sqlite3 já lê as linhas do arquivo conforme o chamador itera
+        return SQLiteCursor(conn)
+
+    def retry_metric(self, error):
+        """Banco bloqueado por outro escritor além do busy_timeout: vale repetir."""
+        code = getattr(error, 'sqlite_errorcode', None)
+        if code is not None:
+            busy = code & 0xFF == sqlite3.SQLITE_BUSY
+        else:
+            busy = 'locked' in str(error)
+        return 'lock_timeouts' if busy else None
+
+    def split_sql(self, script):
+        return split_sql(script)
@@ -0,0 +1,99 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import click
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+# Executado num processo novo por 'flask startup-time': mede a importação do
+# pacote, a criação do app e a primeira requisição, e imprime o resultado em JSON.
+PROBE_SCRIPT = """
+import importlib, json, sys, time
+started = time.perf_counter()
+package = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+app = package.create_app()
+created = time.perf_counter()
+status = app.test_client().get(sys.argv[2]).status_code
+finished = time.perf_counter()
+print(json.dumps(dict(
+    import_ms=(imported - started) * 1000,
+    create_app_ms=(created - imported) * 1000,
+    first_request_ms=(finished - created) * 1000,
+    status=status,
+)))
+"""
+
+
+def bytecode_cache_dir(app):
+    return os.path.join(app.instance_path, 'jinja_cache')
+
+
+def preload_templates(app):
+    """
+    Compila todos os templates no ambiente Jinja do app e retorna quantos
+    foram carregados. Com o cache de bytecode, a compilação só acontece
+    quando o template muda; nas demais vezes o código é lido do disco.
+    """
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith('.html')]
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def init_app(app):
+    """
+    Ativa o cache de bytecode dos templates em instance/jinja_cache
+    (TEMPLATE_BYTECODE_CACHE), compila os templates na criação do app
+    (PRELOAD_TEMPLATES) e registra o comando 'startup-time'.
+
+    Deve ser chamado depois de registrar os blueprints. Templates compilados
+    antes do fork dos workers são compartilhados com eles, então a primeira
+    requisição de cada worker não paga a compilação.
+    """
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        os.makedirs(bytecode_cache_dir(app), exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir(app))
+
+    if app.config['PRELOAD_TEMPLATES']:
+        preload_templates(app)
+
+    app.cli.add_command(startup_time_command)
+
+
+@click.command('startup-time')
+@click.option('--runs', default=5, show_default=True, help='Processos medidos.')
+@click.option('--path', default='/auth/login', show_default=True,
+              help='Rota da primeira requisição.')
+@click.option('--cold', is_flag=True,
+              help='Apaga o cache de bytecode dos templates antes de cada execução.')
+def startup_time_command(runs, path, cold):
+    """
+    Mede a partida a frio do app: importação do pacote, create_app() e a
+    primeira requisição, cada execução num processo Python novo.
+    """
+    app = current_app
+    package_dir = os.path.dirname(app.root_path)
+    results = []
+    for _ in range(runs):
+        if cold and os.path.isdir(bytecode_cache_dir(app)):
+            FileSystemBytecodeCache(bytecode_cache_dir(app)).clear()
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE_SCRIPT, app.import_name, path],
+            cwd=package_dir, capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for metric in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        values = [result[metric] for result in results]
+        click.echo(
+            f'{metric:18} mediana {statistics.median(values):8.1f}'
+            f'  mín {min(values):8.1f}  máx {max(values):8.1f}'
+        )
+    total = [r['import_ms'] + r['create_app_ms'] + r['first_request_ms'] for r in results]
+    click.echo(f"{'total_ms':18} mediana {statistics.median(total):8.1f}"
+               f"  (status da primeira requisição: {results[-1]['status']})")
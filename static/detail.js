@@ -0,0 +1,200 @@
+// Página de detalhes da tasklist: envia "Alterar Status" e "Excluir" com fetch
+// e troca só a linha da tarefa pela resposta, sem recarregar a página.
+// Sem JavaScript, os formulários continuam funcionando com redirecionamento.
+document.addEventListener('submit', async (event) => {
+  const form = event.target;
+  const row = form.closest('li.task');
+  if (!row || !form.matches('.toggle-form, .delete-form')) {
+    return;
+  }
+  event.preventDefault();
+
+  let response;
+  try {
+    response = await fetch(form.action, {
+      method: 'POST',
+      body: new FormData(form),
+      headers: { 'X-Requested-With': 'fetch' },
+      credentials: 'same-origin',
+    });
+  } catch (error) {
+    response = null;
+  }
+  if (!response || !response.ok || response.redirected) {
+    // Erro ou sessão expirada (redirecionou para o login): recarrega a página completa
+    window.location.reload();
+    return;
+  }
+
+  const html = (await response.text()).trim();
+  if (html) {
+    row.outerHTML = html; // Linha renderizada por task/_macros.html
+  } else {
+    row.remove(); // Tarefa excluída
+  }
+});
+
+// Reordenação: arrastar uma tarefa (ou usar os botões ↑/↓) envia a nova
+// posição para /task/<id>/move. A lista é alterada na página antes da
+// resposta; se a requisição falhar, a página é recarregada com a ordem salva.
+async function sendMove(row, fields) {
+  let response;
+  try {
+    response = await fetch(row.dataset.moveUrl, {
+      method: 'POST',
+      body: new URLSearchParams(fields),
+      headers: { 'X-Requested-With': 'fetch' },
+      credentials: 'same-origin',
+    });
+  } catch (error) {
+    response = null;
+  }
+  if (!response || !response.ok || response.redirected) {
+    window.location.reload();
+  }
+}
+
+function taskId(row) {
+  return row.id.replace('task-', '');
+}
+
+document.addEventListener('submit', (event) => {
+  const form = event.target;
+  const row = form.closest('li.task');
+  if (!row || !form.matches('.move-form') || !event.submitter) {
+    return;
+  }
+  event.preventDefault();
+
+  const direction = event.submitter.value;
+  const sibling = direction === 'up' ? row.previousElementSibling : row.nextElementSibling;
+  if (!sibling) {
+    return; // Já está no início ou no fim
+  }
+  if (direction === 'up') {
+    sibling.before(row);
+  } else {
+    sibling.after(row);
+  }
+  sendMove(row, { direction });
+});
+
+let dragged = null;
+let previousBefore = null; // Vizinha anterior no início do arrasto
+
+document.addEventListener('dragstart', (event) => {
+  dragged = event.target.closest && event.target.closest('ul.tasks li.task');
+  if (dragged) {
+    previousBefore = dragged.previousElementSibling;
+    dragged.classList.add('dragging');
+    event.dataTransfer.effectAllowed = 'move';
+  }
+});
+
+document.addEventListener('dragover', (event) => {
+  const target = event.target.closest && event.target.closest('ul.tasks li.task');
+  if (!dragged || !target || target === dragged) {
+    return;
+  }
+  event.preventDefault();
+  // Metade de cima da linha: antes dela; metade de baixo: depois
+  const box = target.getBoundingClientRect();
+  if (event.clientY < box.top + box.height / 2) {
+    target.before(dragged);
+  } else {
+    target.after(dragged);
+  }
+});
+
+document.addEventListener('drop', (event) => {
+  if (dragged) {
+    event.preventDefault();
+  }
+});
+
+document.addEventListener('dragend', () => {
+  if (!dragged) {
+    return;
+  }
+  const row = dragged;
+  dragged = null;
+  row.classList.remove('dragging');
+
+  const previous = row.previousElementSibling;
+  const next = row.nextElementSibling;
+  if (previous === previousBefore) {
+    return; // Voltou para o mesmo lugar
+  }
+  if (previous) {
+    sendMove(row, { after: taskId(previous) });
+  } else if (next) {
+    sendMove(row, { before: taskId(next) });
+  }
+});
+
+// Alterações feitas em outras abas ou por outras pessoas chegam por Server-Sent
+// Events (tasklist.detail_events) e são aplicadas só nas linhas afetadas.
+// Repetir um evento não muda o resultado, então reenvios são inofensivos.
+// 'stale' marca uma alteração publicada sem conteúdo, quando ninguém acompanhava
+// a tasklist: a página recarrega para vê-la.
+function applyEvent(event) {
+  const list = document.querySelector('ul.tasks');
+  if (event.type === 'reload' || event.type === 'stale' || event.type === 'deleted' ||
+      (event.type === 'tasks' && !list)) {
+    window.location.reload();
+    return;
+  }
+  if (event.type === 'tasks') {
+    for (const task of event.tasks) {
+      const row = document.getElementById(`task-${task.id}`);
+      if (row && row === dragged) {
+        continue; // Não troca a linha que está sendo arrastada
+      }
+      if (row) {
+        row.outerHTML = task.html;
+      } else {
+        list.insertAdjacentHTML('beforeend', task.html); // Tarefas novas entram no fim
+      }
+    }
+  } else if (event.type === 'delete') {
+    for (const id of event.ids) {
+      const row = document.getElementById(`task-${id}`);
+      if (row) {
+        row.remove();
+      }
+    }
+  } else if (event.type === 'move') {
+    const row = document.getElementById(`task-${event.id}`);
+    if (!row || !list || row === dragged) {
+      return;
+    }
+    const previous = event.after && document.getElementById(`task-${event.after}`);
+    if (previous) {
+      previous.after(row);
+    } else {
+      list.prepend(row);
+    }
+  } else if (event.type === 'tasklist') {
+    document.querySelector('.tasklist-title').textContent = event.title;
+    document.querySelector('.tasklist-body').textContent = event.body;
+  }
+}
+
+// Um 'reload' logo depois de carregar a página indica que ela foi montada por
+// outro processo (events.LocalHub sem EVENTS_HUB compartilhado): recarregar de
+// novo entraria em laço, então a página só deixa de se atualizar.
+const RELOAD_GUARD_MS = 5000;
+const loadedAt = Date.now();
+
+const detail = document.getElementById('tasklist-detail');
+if (detail && window.EventSource) {
+  const source = new EventSource(detail.dataset.eventsUrl);
+  source.onmessage = (message) => {
+    const event = JSON.parse(message.data);
+    if (event.type === 'reload' && Date.now() - loadedAt < RELOAD_GUARD_MS) {
+      source.close();
+      return;
+    }
+    applyEvent(event);
+  };
+}
@@ -1,24 +1,37 @@
-from flask import Blueprint, request, redirect, url_for, flash, render_template, g, abort
+from flask import (
+    Blueprint, request, redirect, url_for, flash, render_template, g, abort, current_app,
+    get_template_attribute
+)
 # Ajusta as importações para serem relativas ao pacote
-from db import get_db, mysql_db # Importa também o objeto mysql_db para o commit
-from auth import login_required
+from .db import after_commit, get_db, shard_db, shard_for, shards_from, transactional
+from .auth import login_required
+from .events import publish, publish_stale, watched
+from .models import Task
+from .positions import PositionsExhausted, append_positions, check_length, key_between, rebalance_tasklist
+# Importa get_post do módulo tasklist para obter o objeto tasklist pai
+from .tasklist import get_post as get_tasklist_obj, lock_tasklist, touch_tasklist
 
 bp = Blueprint('task', __name__, url_prefix='/task')
 
+# Colunas de models.Task, na ordem do modelo (sem o author_id opcional)
+TASK_COLUMNS = 'task.id, task.tasklist_id, task.body, task.completed, task.created'
+
 def get_task(id, check_tasklist_author=True):
     """
     Obtém uma tarefa do banco de dados pelo ID, opcionalmente verificando o autor da tasklist pai.
+    Procura primeiro no shard do usuário logado (ver tasklist.get_post).
     """
-    db_cursor = get_db() # Obtém o cursor
-    db_cursor.execute( # Executa a consulta no cursor
-        """
-        SELECT task.id, task.body, task.completed, task.created, task.tasklist_id, tasklist.author_id
-        FROM task JOIN tasklist ON task.tasklist_id = tasklist.id
-        WHERE task.id = %s
-        """, # Use %s para MySQL
-        (id,)
-    )
-    task = db_cursor.fetchone() # fetchone() é chamado no cursor
+    for shard in shards_from(g.user['id']):
+        db_cursor = get_db(readonly=True, shard=shard) # Obtém o cursor (pode ser de uma réplica)
+        db_cursor.execute( # Executa a consulta no cursor
+            f'SELECT {TASK_COLUMNS}, tasklist.author_id'
+            ' FROM task JOIN tasklist ON task.tasklist_id = tasklist.id'
+            ' WHERE task.id = %s AND tasklist.deleted_at IS NULL', # Use %s para MySQL
+            (id,)
+        )
+        task = Task.fetchone(db_cursor)
+        if task is not None:
+            break
 
     if task is None:
         abort(404, f"Task id {id} não existe.")
@@ -29,14 +42,193 @@ def get_task(id, check_tasklist_author=True):
     return task
 
 
+def wants_fragment():
+    """
+    Indica se a ação veio do static/detail.js, que pede só o fragmento da
+    tarefa alterada em vez do redirecionamento para a página de detalhes.
+    """
+    return request.headers.get('X-Requested-With') == 'fetch'
+
+
+def render_task_row(task):
+    """Renderiza a linha de uma tarefa (macro task_row de task/_macros.html)."""
+    return get_template_attribute('task/_macros.html', 'task_row')(task)
+
+
+def publish_tasks(tasklist_id, tasks):
+    """Envia as linhas renderizadas das tarefas a quem acompanha a tasklist (events.py)."""
+    if not watched(tasklist_id):
+        publish_stale(tasklist_id)
+        return
+    publish(tasklist_id, dict(
+        type='tasks', tasks=[dict(id=task['id'], html=str(render_task_row(task))) for task in tasks]
+    ))
+
+
+def publish_changed_tasks(tasklist_id, condition, params):
+    """
+    Lê as tarefas da tasklist que atendem 'condition' e as publica (publish_tasks).
+    Só consulta o banco se alguém acompanha a tasklist; senão, publish_stale.
+    """
+    if not watched(tasklist_id):
+        publish_stale(tasklist_id)
+        return
+    db_cursor = shard_db()
+    db_cursor.execute(
+        f'SELECT {TASK_COLUMNS} FROM task WHERE task.tasklist_id = %s AND {condition}'
+        ' ORDER BY task.position, task.id',
+        (tasklist_id, *params)
+    )
+    publish_tasks(tasklist_id, Task.fetchall(db_cursor))
+
+
+def create_tasks(tasklist_id, bodies):
+    """
+    Insere tarefas numa tasklist do usuário logado e atualiza os contadores
+    dela, na transação atual. Retorna o id da primeira tarefa inserida.
+    """
+    # Bloqueia a tasklist antes de inserir as tarefas (ver tasklist.lock_tasklist)
+    touch_tasklist(tasklist_id, tasks=len(bodies))
+    db_cursor = shard_db()
+    # Novas tarefas entram no fim da lista
+    positions = append_positions(shard_for(g.user['id']), tasklist_id, len(bodies))
+    # O MySQLdb transforma o executemany de um INSERT ... VALUES num único INSERT de várias linhas
+    db_cursor.executemany(
+        'INSERT INTO task (tasklist_id, body, position) VALUES (%s, %s, %s)', # Use %s para MySQL
+        [(tasklist_id, body, position) for body, position in zip(bodies, positions)]
+    )
+    first_id = db_cursor.lastrowid
+    _check_position(tasklist_id, positions[-1])
+    # A tasklist está bloqueada: as tarefas com id a partir de first_id são estas
+    publish_changed_tasks(tasklist_id, 'task.id >= %s', (first_id,))
+    return first_id
+
+
+def _check_position(tasklist_id, position):
+    # Depois do commit: o reequilíbrio roda em segundo plano e precisa ver a nova chave
+    shard = shard_for(g.user['id'])
+    after_commit(lambda: check_length(shard, tasklist_id, position))
+
+
+def _neighbour(tasklist_id, id, position, direction):
+    """
+    (id, posição) da tarefa logo depois ('down') ou logo antes ('up') da
+    posição informada, sem contar a tarefa 'id'; None se não houver.
+    """
+    operator, order = ('>', 'ASC') if direction == 'down' else ('<', 'DESC')
+    db_cursor = shard_db()
+    db_cursor.execute(
+        f'SELECT id, position FROM task WHERE tasklist_id = %s AND position {operator} %s'
+        f' AND id <> %s ORDER BY position {order} LIMIT 1',
+        (tasklist_id, position, id)
+    )
+    return db_cursor.fetchone()
+
+
+def move_task(tasklist_id, id, after=None, before=None):
+    """
+    Move a tarefa para logo depois da tarefa 'after' ou logo antes da tarefa
+    'before' (ids da mesma tasklist); sem nenhuma das duas, para o fim.
+    Só a linha da tarefa movida é alterada. Retorna a nova posição.
+    """
+    # Bloqueia a tasklist: movimentos concorrentes na mesma lista são feitos em fila
+    touch_tasklist(tasklist_id)
+    db_cursor = shard_db()
+
+    def position_of(task_id):
+        db_cursor.execute(
+            'SELECT position FROM task WHERE id = %s AND tasklist_id = %s', (task_id, tasklist_id)
+        )
+        row = db_cursor.fetchone()
+        if row is None:
+            abort(400, f"Task id {task_id} não está nesta tasklist.")
+        return row[0]
+
+    def new_position():
+        if after is not None:
+            low = position_of(after)
+            high = (_neighbour(tasklist_id, id, low, 'down') or (None, None))[1]
+        elif before is not None:
+            high = position_of(before)
+            low = (_neighbour(tasklist_id, id, high, 'up') or (None, None))[1]
+        else:
+            db_cursor.execute(
+                'SELECT MAX(position) FROM task WHERE tasklist_id = %s AND id <> %s', (tasklist_id, id)
+            )
+            low, high = db_cursor.fetchone()[0], None
+        return key_between(low, high)
+
+    try:
+        position = new_position()
+    except PositionsExhausted:
+        # Sem chave entre as vizinhas: reequilibra na própria transação e recalcula
+        rebalance_tasklist(shard_for(g.user['id']), tasklist_id)
+        position = new_position()
+    db_cursor.execute('UPDATE task SET position = %s WHERE id = %s', (position, id))
+    _check_position(tasklist_id, position)
+    if watched(tasklist_id):
+        previous = _neighbour(tasklist_id, id, position, 'up')
+        publish(tasklist_id, dict(type='move', id=id, after=previous and previous[0]))
+    else:
+        publish_stale(tasklist_id)
+    return position
+
+
+def delete_tasks(tasklist_id, ids):
+    """
+    Exclui tarefas de uma tasklist e atualiza os contadores dela, na transação atual.
+    Retorna quantas tarefas foram excluídas.
+    """
+    placeholders = ', '.join(['%s'] * len(ids))
+    lock_tasklist(tasklist_id)
+    db_cursor = shard_db()
+    # Lê (e bloqueia) o que será excluído para descontar dos contadores
+    db_cursor.execute(
+        'SELECT COUNT(*), SUM(completed) FROM task'
+        f' WHERE tasklist_id = %s AND id IN ({placeholders}) FOR UPDATE',
+        (tasklist_id, *ids)
+    )
+    total, completed = db_cursor.fetchone()
+    total, completed = int(total), int(completed or 0)
+    if total:
+        db_cursor.execute(
+            f'DELETE FROM task WHERE tasklist_id = %s AND id IN ({placeholders})',
+            (tasklist_id, *ids)
+        )
+        touch_tasklist(tasklist_id, tasks=-total, completed=-completed)
+        publish(tasklist_id, dict(type='delete', ids=list(ids)))
+    return total
+
+
+def set_tasks_completed(tasklist_id, ids, completed):
+    """
+    Marca tarefas de uma tasklist como completas ou pendentes e atualiza os
+    contadores dela, na transação atual. Retorna quantas tarefas mudaram.
+    """
+    placeholders = ', '.join(['%s'] * len(ids))
+    # Os deltas só são conhecidos depois do UPDATE: bloqueia a tasklist antes dele
+    lock_tasklist(tasklist_id)
+    db_cursor = shard_db()
+    # 'completed <> %s' faz o rowcount contar só as tarefas que de fato mudaram
+    db_cursor.execute(
+        'UPDATE task SET completed = %s'
+        f' WHERE tasklist_id = %s AND id IN ({placeholders}) AND completed <> %s',
+        (completed, tasklist_id, *ids, completed)
+    )
+    changed = db_cursor.rowcount
+    if changed:
+        touch_tasklist(tasklist_id, completed=changed if completed else -changed)
+        publish_changed_tasks(tasklist_id, f'task.id IN ({placeholders})', ids)
+    return changed
+
+
 @bp.route('/<int:tasklist_id>/create', methods=('GET', 'POST'))
 @login_required
+@transactional
 def create(tasklist_id):
     """
     Permite criar uma nova tarefa para uma tasklist específica.
     """
-    # Importa get_post do módulo tasklist para obter o objeto tasklist pai
-    from .tasklist import get_post as get_tasklist_obj
     tasklist = get_tasklist_obj(tasklist_id) # Garante que a tasklist existe e o usuário tem acesso
 
     if request.method == 'POST':
@@ -49,12 +241,7 @@ def create(tasklist_id):
         if error is not None:
             flash(error)
         else:
-            db_cursor = get_db() # Obtém o cursor
-            db_cursor.execute( # Executa a inserção no cursor
-                'INSERT INTO task (tasklist_id, body) VALUES (%s, %s)', # Use %s para MySQL
-                (tasklist_id, body)
-            )
-            mysql_db.connection.commit() # Commita as alterações
+            create_tasks(tasklist_id, [body])
             flash('Tarefa adicionada com sucesso!', 'success')
 
             return redirect(url_for('tasklist.detail', id=tasklist_id))
@@ -64,15 +251,17 @@ def create(tasklist_id):
 
 @bp.route('/<int:id>/delete', methods=('POST',))
 @login_required
+@transactional
 def delete(id):
     """
     Permite deletar uma tarefa.
     """
     task = get_task(id) # Garante que a tarefa existe e o usuário tem permissão para deletá-la
 
-    db_cursor = get_db() # Obtém o cursor
-    db_cursor.execute('DELETE FROM task WHERE id = %s', (id,)) # Use %s para MySQL
-    mysql_db.connection.commit() # Commita as alterações
+    delete_tasks(task['tasklist_id'], [id])
+    if wants_fragment():
+        return '' # A linha some da página; não há o que renderizar
+
     flash('Tarefa excluída com sucesso!', 'info')
 
     return redirect(url_for('tasklist.detail', id=task['tasklist_id']))
@@ -80,47 +269,164 @@ def delete(id):
 
 @bp.route('/<int:id>/toggle-complete', methods=('POST',))
 @login_required
+@transactional
 def toggle_complete(id):
     """
     Alterna o status de conclusão de uma tarefa.
+
+    A alternância e a verificação de que a tarefa pertence ao usuário são feitas
+    num único UPDATE, sem ler antes o valor atual: cliques concorrentes não
+    sobrescrevem um ao outro.
     """
+    db_cursor = shard_db() # Cursor do shard do usuário
     task = None
 
-    try:
-        task = get_task(id) # Obtém a tarefa e verifica permissões
+    # Bloqueia a tasklist antes da tarefa (ver tasklist.lock_tasklist). Uma
+    # tarefa nunca muda de tasklist, então o tasklist_id pode ser lido sem lock.
+    db_cursor.execute('SELECT tasklist_id FROM task WHERE id = %s', (id,))
+    row = db_cursor.fetchone()
+    if row is not None:
+        lock_tasklist(row[0])
+        db_cursor.execute(
+            'UPDATE task SET completed = NOT completed'
+            ' WHERE id = %s AND tasklist_id IN'
+            ' (SELECT id FROM tasklist WHERE author_id = %s AND deleted_at IS NULL)',
+            (id, g.user['id'])
+        )
+    if row is not None and db_cursor.rowcount:
+        # Lê o novo status na mesma transação (a linha continua bloqueada pelo UPDATE)
+        db_cursor.execute(f'SELECT {TASK_COLUMNS} FROM task WHERE id = %s', (id,))
+        task = Task.fetchone(db_cursor)
+        touch_tasklist(task['tasklist_id'], completed=1 if task['completed'] else -1)
+        publish_tasks(task['tasklist_id'], [task])
 
-        # O campo 'completed' no MySQLdb com DictCursor pode vir como int diretamente
-        # ou, dependendo da configuração da coluna, como bool ou bytes.
-        # Converter para int para garantir a lógica de alternância.
-        current_completed_status = int(task['completed'])
+    if task is None:
+        # Nada foi alterado: get_task() aborta com 404 ou 403 conforme o caso
+        get_task(id)
+        abort(404, f"Task id {id} não existe.")
 
-        new_completed_status = 1 if current_completed_status == 0 else 0
+    if wants_fragment():
+        return render_task_row(task)
 
-        db_cursor = get_db() # Obtém o cursor
-        db_cursor.execute( # Executa a atualização no cursor
-            'UPDATE task SET completed = %s WHERE id = %s', # Use %s para MySQL
-            (new_completed_status, id)
-        )
-        mysql_db.connection.commit() # Commita as alterações
+    flash(f"Status da tarefa '{task['body']}' atualizado para {'Completa' if task['completed'] else 'Pendente'}.", 'success')
+    return redirect(url_for('tasklist.detail', id=task['tasklist_id']))
 
-        flash(f"Status da tarefa '{task['body']}' atualizado para {'Completa' if new_completed_status == 1 else 'Pendente'}.", 'success')
-        return redirect(url_for('tasklist.detail', id=task['tasklist_id']))
 
-    except Exception as e:
-        # Em caso de erro, tenta fazer o rollback da conexão
-        flash(f"Ocorreu um erro ao atualizar o status da tarefa: {e}", 'error')
-        db_cursor = g.pop('db_cursor', None) # Tenta pegar o cursor do g
-        if db_cursor and mysql_db.connection: # Verifica se o cursor e a conexão existem
-            mysql_db.connection.rollback() # Faz rollback da conexão
+@bp.route('/<int:id>/move', methods=('POST',))
+@login_required
+@transactional
+def move(id):
+    """
+    Muda a posição de uma tarefa na tasklist. O formulário traz 'after' (id da
+    tarefa que ficará logo antes), 'before' (id da que ficará logo depois) ou
+    'direction' ('up'/'down', uma posição). O static/detail.js envia 'after'
+    ou 'before' ao arrastar uma tarefa; os botões usam 'direction'.
+    """
+    task = get_task(id)
+    tasklist_id = task['tasklist_id']
+    after = request.form.get('after', type=int)
+    before = request.form.get('before', type=int)
 
+    direction = request.form.get('direction')
+    if direction is not None:
+        if direction not in ('up', 'down'):
+            abort(400, f"Direção inválida: {direction}")
+        db_cursor = shard_db()
+        db_cursor.execute('SELECT position FROM task WHERE id = %s', (id,))
+        neighbour = _neighbour(tasklist_id, id, db_cursor.fetchone()[0], direction)
+        if neighbour is not None:
+            # Para cima: antes da anterior; para baixo: depois da seguinte
+            after, before = (neighbour[0], None) if direction == 'down' else (None, neighbour[0])
+            move_task(tasklist_id, id, after, before)
+    elif id not in (after, before):
+        move_task(tasklist_id, id, after, before)
+
+    if wants_fragment():
+        return '', 204 # A página já mostra a nova ordem
+
+    return redirect(url_for('tasklist.detail', id=tasklist_id))
 
-    # Se ocorrer um erro e não houver um redirecionamento, garante que o usuário seja levado de volta
-    # para a página da tasklist, para evitar que a requisição fique "pendurada".
-    # Isso é especialmente importante em um bloco try-except que pode não ter um 'return'.
-    if task:
-        return redirect(url_for('tasklist.detail', id=task['tasklist_id']))
-    else:
-        # Se 'task' for None (ex: get_task falhou com 404 antes do try/except),
-        # redireciona para um local seguro, como a página principal ou login.
-        return redirect(url_for('index')) # ou url_for('auth.login') dependendo da lógica do app
 
+def _selected_task_ids():
+    """
+    Lê os ids de tarefa marcados no formulário (campos 'task_id'), sem repetições.
+    Aborta 400 se passar de TASK_BATCH_MAX.
+    """
+    ids = list(dict.fromkeys(request.form.getlist('task_id', type=int)))
+    if len(ids) > current_app.config['TASK_BATCH_MAX']:
+        abort(400, f"No máximo {current_app.config['TASK_BATCH_MAX']} tarefas por vez.")
+    return ids
+
+
+def _run_batch(tasklist_id, action, message):
+    """
+    Executa uma alteração em lote e volta para a tasklist. A view chamadora é
+    @transactional: o lote inteiro tem um único commit, ou nenhum.
+    'action' faz a alteração e retorna quantas tarefas foram afetadas.
+    """
+    count = action()
+    flash(message.format(count=count), 'success')
+
+    return redirect(url_for('tasklist.detail', id=tasklist_id))
+
+
+@bp.route('/<int:tasklist_id>/batch-create', methods=('POST',))
+@login_required
+@transactional
+def batch_create(tasklist_id):
+    """
+    Cria várias tarefas de uma vez, uma por linha do campo 'bodies'.
+    """
+    get_tasklist_obj(tasklist_id) # Garante que a tasklist existe e o usuário tem acesso
+
+    bodies = [line.strip() for line in request.form['bodies'].splitlines() if line.strip()]
+    if not bodies:
+        flash('Informe ao menos uma tarefa, uma por linha.')
+        return redirect(url_for('task.create', tasklist_id=tasklist_id))
+    if len(bodies) > current_app.config['TASK_BATCH_MAX']:
+        abort(400, f"No máximo {current_app.config['TASK_BATCH_MAX']} tarefas por vez.")
+
+    def action():
+        create_tasks(tasklist_id, bodies)
+        return len(bodies)
+
+    return _run_batch(tasklist_id, action, '{count} tarefas adicionadas com sucesso!')
+
+
+@bp.route('/<int:tasklist_id>/batch-complete', methods=('POST',))
+@login_required
+@transactional
+def batch_complete(tasklist_id):
+    """
+    Marca as tarefas selecionadas como completas (ou pendentes, com completed=0).
+    """
+    get_tasklist_obj(tasklist_id)
+    ids = _selected_task_ids()
+    if not ids:
+        return redirect(url_for('tasklist.detail', id=tasklist_id))
+
+    completed = request.form.get('completed', 1, type=int) != 0
+    return _run_batch(
+        tasklist_id,
+        lambda: set_tasks_completed(tasklist_id, ids, completed),
+        '{count} tarefas atualizadas.',
+    )
+
+
+@bp.route('/<int:tasklist_id>/batch-delete', methods=('POST',))
+@login_required
+@transactional
+def batch_delete(tasklist_id):
+    """
+    Exclui as tarefas selecionadas de uma tasklist.
+    """
+    get_tasklist_obj(tasklist_id)
+    ids = _selected_task_ids()
+    if not ids:
+        return redirect(url_for('tasklist.detail', id=tasklist_id))
+
+    return _run_batch(
+        tasklist_id,
+        lambda: delete_tasks(tasklist_id, ids),
+        '{count} tarefas excluídas.',
+    )
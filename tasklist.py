@@ -1,36 +1,136 @@
+from datetime import datetime
+
+import click
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, Response, current_app, flash, g, redirect, render_template, request,
+    stream_template, url_for
 )
+from markupsafe import Markup
 from werkzeug.exceptions import abort
 
 from .auth import login_required
-from .db import get_db, mysql_db # Importa também o objeto mysql_db para o commit
+from .cache import get_page_cache, invalidate_now, invalidate_pages
+from .db import (
+    get_db, primary_reads, shard_count, shard_db, shards_from, transaction, transactional
+)
+from .events import TooManySubscribers, get_hub, get_stream_slots, publish, stream, tasklist_channel
+from .models import Task, Tasklist
+
+bp = Blueprint('tasklist', __name__, cli_group=None)
+
+# Colunas de models.Tasklist, na ordem do modelo
+TASKLIST_COLUMNS = 'id, title, body, created, author_id, version, task_count, completed_count'
+
+def encode_cursor(tasklist):
+    """Codifica a posição (created, id) de uma tasklist como cursor de paginação."""
+    return f"{tasklist['created'].isoformat()}_{tasklist['id']}"
+
+
+def decode_cursor(cursor):
+    """Decodifica um cursor gerado por encode_cursor, ou aborta 400 se inválido."""
+    try:
+        created, id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created), int(id)
+    except ValueError:
+        abort(400, f"Cursor de paginação inválido: {cursor}")
+
+
+def _index_page(after, before):
+    """
+    Busca uma página do índice. Retorna o contexto do template e as tags de
+    cache dos dados exibidos (ver cache.FragmentCache).
+    """
+    per_page = current_app.config['TASKLISTS_PER_PAGE']
+
+    # Tasklists excluídas (deleted_at) somem na hora; purge.py remove as linhas depois
+    query = f'SELECT {TASKLIST_COLUMNS} FROM tasklist WHERE deleted_at IS NULL'
+    params = ()
+    if before:
+        # Página anterior: percorre em ordem crescente a partir do cursor e inverte depois
+        created, id = decode_cursor(before)
+        query += ' AND (tasklist.created > %s OR (tasklist.created = %s AND tasklist.id > %s))'
+        query += ' ORDER BY tasklist.created ASC, tasklist.id ASC LIMIT %s'
+        params = (created, created, id, per_page + 1)
+    else:
+        if after:
+            created, id = decode_cursor(after)
+            query += ' AND (tasklist.created < %s OR (tasklist.created = %s AND tasklist.id < %s))'
+            params = (created, created, id)
+        query += ' ORDER BY tasklist.created DESC, tasklist.id DESC LIMIT %s'
+        params += (per_page + 1,)
+
+    # Busca uma linha a mais que o tamanho da página só para saber se há outra página.
+    # Com sharding, cada shard devolve a sua página e as linhas são intercaladas
+    # pela mesma ordem (created, id).
+    tasklists = []
+    for shard in range(shard_count()):
+        db_cursor = get_db(readonly=True, shard=shard) # O shard 0 pode vir de uma réplica
+        db_cursor.execute(query, params)
+        tasklists += Tasklist.fetchmany(db_cursor, per_page + 1)
+    if shard_count() > 1:
+        tasklists.sort(key=lambda tasklist: (tasklist.created, tasklist.id), reverse=not before)
+        tasklists = tasklists[:per_page + 1]
+
+    has_more = len(tasklists) > per_page
+    tasklists = tasklists[:per_page]
+    if before:
+        tasklists.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+
+    next_url = prev_url = None
+    if tasklists and has_next:
+        next_url = url_for('tasklist.index', after=encode_cursor(tasklists[-1]))
+    if tasklists and has_prev:
+        prev_url = url_for('tasklist.index', before=encode_cursor(tasklists[0]))
+
+    tags = {f"tasklist:{tasklist['id']}" for tasklist in tasklists}
+    tags.update(f"user:{tasklist['author_id']}" for tasklist in tasklists)
+    if not has_prev:
+        # Uma tasklist nova aparece no topo da primeira página
+        tags.add('index-head')
+
+    return dict(tasklists=tasklists, next_url=next_url, prev_url=prev_url), tags
 
-bp = Blueprint('tasklist', __name__)
 
 @bp.route('/')
 def index():
     """
-    Exibe uma lista de tarefas, incluindo informações do autor.
+    Exibe uma página de tasklists, incluindo informações do autor.
+
+    A paginação é feita por keyset sobre (created, id): o parâmetro 'after' traz
+    a página seguinte (mais antigas) e 'before' a anterior (mais recentes). Assim
+    o custo da página não depende do tamanho da tabela, ao contrário de OFFSET.
+    Com o cache de páginas ativo, a lista renderizada vem do cache sem tocar no
+    banco; sem ele, STREAM_TEMPLATES envia a página em partes. Os dois não se
+    combinam: com o cache, STREAM_TEMPLATES é ignorado (cache.init_app avisa).
     """
-    db_cursor = get_db() # get_db() agora retorna o cursor do MySQL
+    after = request.args.get('after')
+    before = request.args.get('before')
 
-    # Executa a consulta e armazena o resultado da execução (que é o próprio cursor)
-    # na mesma variável para clareza e para garantir que fetchall seja chamado no cursor.
-    db_cursor.execute(
-        """
-        SELECT tasklist.id, title, body, created, author_id, username
-        FROM tasklist JOIN user ON tasklist.author_id = user.id
-        ORDER BY created DESC
-        """
-    )
-    tasklists = db_cursor.fetchall() # fetchall() é chamado no cursor que acabou de executar
+    page_cache = get_page_cache()
+    if page_cache is not None:
+        def render():
+            context, tags = _index_page(after, before)
+            return render_template('task/_tasklists.html', **context), tags
+
+        viewer = g.user['id'] if g.user else None
+        # Fragmentos guardados no cache são lidos do primário (ver db.primary_reads)
+        with primary_reads():
+            html = page_cache.get_or_render(('index', viewer, after, before), render)
+        return render_template('task/index.html', tasklists_html=Markup(html))
 
-    return render_template('task/index.html', tasklists=tasklists)
+    context, _ = _index_page(after, before)
+    if current_app.config['STREAM_TEMPLATES']:
+        # Envia o HTML em partes conforme o template é renderizado
+        return stream_template('task/index.html', **context)
+    return render_template('task/index.html', **context)
 
 
 @bp.route('/create', methods=('GET', 'POST'))
 @login_required
+@transactional
 def create():
     """
     Permite criar uma nova tasklist.
@@ -46,31 +146,82 @@ def create():
         if error is not None:
             flash(error)
         else:
-            db_cursor = get_db() # Obtém o cursor
+            db_cursor = shard_db() # Cursor do shard do usuário
             db_cursor.execute(
                 'INSERT INTO tasklist (title, body, author_id)'
                 ' VALUES (%s, %s, %s)', # MySQL usa %s como placeholder
                 (title, body, g.user['id'])
             )
-            mysql_db.connection.commit() # Commita as alterações no banco de dados MySQL
+            invalidate_pages('index-head')
             return redirect(url_for('tasklist.index'))
 
     return render_template('task/create.html')
 
-def get_post(id, check_author=True):
+def lock_tasklist(id, author_id=None):
     """
-    Obtém uma tasklist pelo ID, opcionalmente verificando o autor.
+    Bloqueia a linha da tasklist até o fim da transação atual.
+
+    Toda alteração nas tarefas de uma tasklist bloqueia primeiro a tasklist e
+    só depois as linhas de task: com a mesma ordem em todas elas, duas
+    transações na mesma lista esperam uma pela outra em vez de entrarem em
+    deadlock. Quem já conhece os deltas dos contadores chama touch_tasklist
+    direto, que também bloqueia a linha.
+    """
+    shard_db(author_id).execute('SELECT id FROM tasklist WHERE id = %s FOR UPDATE', (id,))
+
+
+def touch_tasklist(id, tasks=0, completed=0, author_id=None):
+    """
+    Incrementa a versão da tasklist (usada como ETag pela API), soma os deltas
+    aos contadores task_count/completed_count e invalida as páginas em cache
+    que a exibem.
+    Deve ser chamada na mesma transação de toda alteração na tasklist ou nas suas tarefas,
+    e antes de alterar as tarefas ou depois de lock_tasklist (ver lock_tasklist).
+    author_id é o dono da tasklist (padrão: o usuário logado).
     """
-    db_cursor = get_db() # Obtém o cursor
-    db_cursor.execute(
-        """
-        SELECT tasklist.id, title, body, created, author_id, username
-        FROM tasklist JOIN user ON tasklist.author_id = user.id
-        WHERE tasklist.id = %s
-        """, # MySQL usa %s como placeholder
+    shard_db(author_id).execute(
+        'UPDATE tasklist SET version = version + 1,'
+        ' task_count = task_count + %s, completed_count = completed_count + %s'
+        ' WHERE id = %s',
+        (tasks, completed, id)
+    )
+    invalidate_pages(f'tasklist:{id}')
+
+
+def soft_delete_tasklist(id):
+    """
+    Exclui a tasklist logicamente, na transação atual: ela some na hora das
+    páginas e da API, e purge.py remove depois as tarefas, em lotes, e a linha.
+    Um DELETE direto apagaria todas as tarefas em cascata numa única transação.
+    """
+    shard_db().execute(
+        'UPDATE tasklist SET deleted_at = CURRENT_TIMESTAMP, version = version + 1'
+        ' WHERE id = %s AND deleted_at IS NULL',
         (id,)
     )
-    tasklist = db_cursor.fetchone() # fetchone() é chamado no cursor
+    invalidate_pages(f'tasklist:{id}')
+    publish(id, dict(type='deleted'))
+
+
+def get_post(id, check_author=True, lock=False):
+    """
+    Obtém uma tasklist pelo ID, opcionalmente verificando o autor.
+
+    Procura primeiro no shard do usuário logado, onde estão as tasklists dele;
+    os outros shards só são consultados se ela não estiver lá (404 ou 403).
+    Com lock=True lê do primário com FOR UPDATE: a linha fica bloqueada até o
+    commit, para conferir a versão antes de alterá-la.
+    """
+    for shard in shards_from(g.user['id']):
+        db_cursor = get_db(readonly=not lock, shard=shard) # Sem lock, pode ser de uma réplica
+        db_cursor.execute(
+            f'SELECT {TASKLIST_COLUMNS} FROM tasklist WHERE id = %s AND deleted_at IS NULL' # MySQL usa %s
+            + (' FOR UPDATE' if lock else ''),
+            (id,)
+        )
+        tasklist = Tasklist.fetchone(db_cursor)
+        if tasklist is not None:
+            break
 
     if tasklist is None:
         abort(404, f"Tasklist id {id} doesn't exist.")
@@ -83,6 +234,7 @@ def get_post(id, check_author=True):
 
 @bp.route('/<int:id>/update', methods=('GET', 'POST'))
 @login_required
+@transactional
 def update(id):
     """
     Permite atualizar uma tasklist existente.
@@ -100,27 +252,27 @@ def update(id):
         if error is not None:
             flash(error)
         else:
-            db_cursor = get_db() # Obtém o cursor
+            db_cursor = shard_db() # Cursor do shard do usuário
             db_cursor.execute(
-                'UPDATE tasklist SET title = %s, body = %s' # MySQL usa %s
+                'UPDATE tasklist SET title = %s, body = %s, version = version + 1' # MySQL usa %s
                 ' WHERE id = %s', # MySQL usa %s
                 (title, body, id)
             )
-            mysql_db.connection.commit() # Commita as alterações
+            invalidate_pages(f'tasklist:{id}')
+            publish(id, dict(type='tasklist', title=title, body=body))
             return redirect(url_for('tasklist.index'))
 
     return render_template('task/update.html', tasklist=tasklist)
 
 @bp.route('/<int:id>/delete', methods=('POST',))
 @login_required
+@transactional
 def delete(id):
     """
     Permite deletar uma tasklist.
     """
     get_post(id) # Garante que a tasklist existe e que o usuário tem permissão
-    db_cursor = get_db() # Obtém o cursor
-    db_cursor.execute('DELETE FROM tasklist WHERE id = %s', (id,)) # MySQL usa %s
-    mysql_db.connection.commit() # Commita as alterações
+    soft_delete_tasklist(id)
     return redirect(url_for('tasklist.index'))
 
 
@@ -129,16 +281,123 @@ def delete(id):
 def detail(id):
     """
     Exibe os detalhes de uma tasklist e suas tarefas associadas.
+    A página acompanha as alterações seguintes por detail_events.
     """
+    # Lido antes do HTML: eventos publicados enquanto ele é montado são reenviados
+    events_since = get_hub().last_id(tasklist_channel(id))
+    # Existência, exclusão e autor são verificados em toda requisição, mesmo com o fragmento em cache
     tasklist = get_post(id)
+    page_cache = get_page_cache()
 
-    db_cursor = get_db() # Obtém o cursor
+    def render():
+        # Sem cache, a leitura acima basta; com ele, relê depois do início da renderização,
+        # para que uma alteração entre as duas leituras descarte o fragmento
+        current = tasklist if page_cache is None else get_post(id)
+        db_cursor = shard_db(readonly=True) # Obtém o cursor (pode ser de uma réplica, sem o cache)
 
-    db_cursor.execute( # Executa a consulta
-        'SELECT id, body, completed, created '
-        'FROM task WHERE tasklist_id = %s ORDER BY created ASC', # MySQL usa %s
-        (id,)
+        db_cursor.execute( # Executa a consulta
+            'SELECT id, tasklist_id, body, completed, created ' # Colunas de models.Task
+            'FROM task WHERE tasklist_id = %s ORDER BY position, id', # Ordem definida pelo usuário
+            (id,)
+        )
+        tasks = Task.fetchall(db_cursor)
+
+        html = render_template('task/_detail.html', tasklist=current, tasks=tasks)
+        return html, {f'tasklist:{id}'}
+
+    if page_cache is None:
+        html, _ = render()
+    else:
+        with primary_reads(): # Como em index
+            html = page_cache.get_or_render(('detail', id, g.user['id']), render)
+
+    return render_template(
+        'task/detail.html', tasklist_id=id, detail_html=Markup(html), events_since=events_since
     )
-    tasks = db_cursor.fetchall() # Chama fetchall no cursor
 
-    return render_template('task/detail.html', tasklist=tasklist, tasks=tasks)
+
+@bp.route('/<int:id>/events')
+@login_required
+def detail_events(id):
+    """
+    Server-Sent Events com as alterações na tasklist (ver events.py), para a
+    página de detalhes aberta se atualizar sem recarregar: só as linhas que
+    mudaram são enviadas. O cliente reconecta com Last-Event-ID e recebe o
+    que perdeu.
+
+    A conexão com o banco volta ao pool ao fim desta função, antes do fluxo
+    começar. Enquanto espera, uma conexão aberta ocupa uma fila e a thread que
+    a atende: com os workers gevent de gunicorn.conf.py, uma green thread, o
+    que permite milhares de conexões por processo. Acima de
+    EVENTS_MAX_STREAMS conexões longas (poucas com workers de threads), as
+    demais recebem só os eventos pendentes e são encerradas com um 'retry' de
+    EVENTS_POLL_INTERVAL: o navegador volta a consultar nesse intervalo, com
+    o Last-Event-ID, até conseguir uma vaga.
+    """
+    get_post(id) # Só o autor acompanha a tasklist
+    config = current_app.config
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        subscription = get_hub().subscribe(tasklist_channel(id), since)
+    except TooManySubscribers:
+        abort(503, 'Conexões de eventos demais neste servidor.')
+
+    slots = get_stream_slots()
+    if slots.acquire():
+        body = stream(
+            subscription, config['EVENTS_HEARTBEAT'], config['EVENTS_STREAM_LIFETIME'],
+            on_close=slots.release,
+        )
+    else:
+        body = stream(subscription, config['EVENTS_HEARTBEAT'], 0, retry=config['EVENTS_POLL_INTERVAL'] * 1000)
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Proxies como o nginx não devem acumular o fluxo
+    return response
+
+
+# Tasklists de uma faixa de ids com contadores errados, bloqueadas até o commit,
+# e o recálculo só delas (que também muda a versão).
+TASK_COUNT_SQL = 'SELECT COUNT(*) FROM task WHERE task.tasklist_id = tasklist.id'
+COMPLETED_COUNT_SQL = TASK_COUNT_SQL + ' AND task.completed'
+STALE_COUNTS_SQL = f"""
+    SELECT id FROM tasklist
+    WHERE id >= %s AND id < %s
+      AND (task_count <> ({TASK_COUNT_SQL}) OR completed_count <> ({COMPLETED_COUNT_SQL}))
+    FOR UPDATE
+"""
+REPAIR_COUNTS_SQL = f"""
+    UPDATE tasklist SET
+        task_count = ({TASK_COUNT_SQL}),
+        completed_count = ({COMPLETED_COUNT_SQL}),
+        version = version + 1
+    WHERE id IN ({{placeholders}})
+"""
+
+
+@bp.cli.command('repair-task-counts')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Quantidade de ids de tasklist recalculados por transação.')
+def repair_task_counts_command(batch_size):
+    """Recalcula task_count e completed_count de todas as tasklists (em todos os shards)."""
+    repaired = 0
+    for shard in range(shard_count()):
+        db_cursor = get_db(shard=shard)
+        db_cursor.execute('SELECT MIN(id), MAX(id) FROM tasklist')
+        first, last = db_cursor.fetchone()
+        if first is None:
+            continue
+
+        # Transações curtas, uma por faixa de ids, para não bloquear a tabela inteira
+        for start in range(first, last + 1, batch_size):
+            with transaction():
+                db_cursor.execute(STALE_COUNTS_SQL, (start, start + batch_size))
+                ids = [id for (id,) in db_cursor.fetchall()]
+                if ids:
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    db_cursor.execute(REPAIR_COUNTS_SQL.format(placeholders=placeholders), ids)
+            # Depois do commit: as páginas em cache dos workers mostram os contadores novos
+            invalidate_now(*(f'tasklist:{id}' for id in ids))
+            repaired += len(ids)
+
+    click.echo(f'{repaired} tasklists com contadores corrigidos.')